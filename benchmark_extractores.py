@@ -0,0 +1,214 @@
+"""
+Benchmark de los backends de extracción de texto (extractores_pdf): páginas por
+segundo y qué tan bien sobreviven los campos clave (IDENTIFICACIÓN, EDAD, SEXO,
+FECHA ATENCIÓN, PESO, TALLA) en output/historia_paciente_0.pdf y en historias
+sintéticas con el formato del PDF impreso por Chrome (etiquetas en negrita y valor
+en otra fuente, sin espacio entre ambos).
+
+    python benchmark_extractores.py
+    python benchmark_extractores.py --sinteticas 50 --paginas 10 --json extractores.json otras/*.pdf
+
+En las sintéticas se conoce el valor correcto de cada campo; en los PDFs reales
+solo se informa si el campo se encontró.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import tempfile
+import time
+
+from extractores_pdf import backends_disponibles, obtener_backend
+from reporte_medifolios import RE_FECHA_ATENCION, normalizar_pagina_pdf
+from simulador_sitios import escapar_texto_pdf, pdf_paginas
+
+PDF_REFERENCIA = os.path.join("output", "historia_paciente_0.pdf")
+
+# Patrones con los que el resto del repo lee cada campo
+CAMPOS = {
+    "IDENTIFICACIÓN": re.compile(r'IDENTIFICACI[ÓO]N:\s*([A-Z]{2} \d+)'),
+    "EDAD": re.compile(r'EDAD:\s*(\d+)\s*[Aa][ñÑ][oO][sS]?'),
+    "SEXO": re.compile(r'SEXO:\s*([A-Za-z]+)'),
+    "FECHA ATENCIÓN": RE_FECHA_ATENCION,
+    "PESO": re.compile(r'PESO\s*:?\s*([0-9]+(?:\.[0-9]+)?)\s*kgs', re.IGNORECASE),
+    "TALLA": re.compile(r'TALLA\s*:?\s*([0-9]+(?:\.[0-9]+)?)\s*cms', re.IGNORECASE),
+}
+
+# Etiqueta pegada al valor ("EDAD:64", "PESO70"): lo que hay que corregir después
+RE_PEGADAS = re.compile(r'(?:EDAD:|SEXO:|IDENTIFICACI[ÓO]N:|ATENCI[ÓO]N:|PESO|TALLA)(?=[0-9A-Za-zÁÉÍÓÚÑ])')
+
+_NOMBRES = ["ANA", "LUIS", "MARÍA", "JOSÉ", "SOFÍA", "ANDRÉS", "VALENTINA", "JULIÁN", "CAMILA", "NICOLÁS"]
+_APELLIDOS = ["RODRÍGUEZ", "GÓMEZ", "MARTÍNEZ", "PEÑA", "NÚÑEZ", "SANTAMARÍA", "CASTAÑO", "LÓPEZ"]
+_PALABRAS = ("paciente refiere dolor abdominal intermitente desde hace tres días sin fiebre ni vómito "
+             "se indica control con paraclínicos hemograma glicemia creatinina examen físico sin "
+             "alteraciones abdomen blando depresible tolera vía oral se explican signos de alarma").split()
+
+
+def _par(etiqueta, valor, separacion=450):
+    """
+    Etiqueta en negrita y valor en regular, separados (también del par anterior)
+    por desplazamiento y no por un espacio, como en el PDF impreso por Chrome
+    """
+    return (f"/F2 9 Tf [-{2 * separacion} ({escapar_texto_pdf(etiqueta)})] TJ "
+            f"/F1 9 Tf [-{separacion} ({escapar_texto_pdf(valor)})] TJ ")
+
+
+def _titulo(texto, tamano=10):
+    return f"/F2 {tamano} Tf ({escapar_texto_pdf(texto)}) Tj "
+
+
+def historia_sintetica(azar, paginas):
+    """Contenido de cada página y valores correctos de una historia de `paginas` atenciones"""
+    edad = azar.randint(1, 95)
+    verdad = {
+        "IDENTIFICACIÓN": f"{azar.choice(['CC', 'TI', 'RC'])} {azar.randint(1000000, 99999999)}",
+        "EDAD": str(edad),
+        "SEXO": azar.choice(["MASCULINO", "FEMENINO"]),
+        "FECHA ATENCIÓN": [],
+        "PESO": [],
+        "TALLA": [],
+    }
+    nombre = f"{azar.choice(_NOMBRES)} {azar.choice(_APELLIDOS)} {azar.choice(_APELLIDOS)}"
+    contenidos = []
+    for n in range(paginas):
+        fecha = f"20{azar.randint(18, 25)}-{azar.randint(1, 12):02d}-{azar.randint(1, 28):02d}"
+        peso = f"{azar.randint(20, 110)}.{azar.randint(0, 9)}"
+        talla = str(azar.randint(90, 195))
+        verdad["FECHA ATENCIÓN"].append(fecha)
+        verdad["PESO"].append(peso)
+        verdad["TALLA"].append(talla)
+        lineas = [
+            _titulo("EVOLUCIÓN CITAS DE CONTROL", 11),
+            _par("FECHA ATENCIÓN:", f"{fecha} {azar.randint(7, 18):02d}:{azar.randint(0, 59):02d}:00")
+            + f"/F1 9 Tf [-300 (- NUM. HISTORIA: {verdad['IDENTIFICACIÓN'].split()[1]})] TJ ",
+            _titulo("DATOS DE IDENTIFICACIÓN"),
+            # Apellido partido en dos tramos de texto, como al ajustar la línea en Chrome
+            _par("NOMBRE:", nombre[:-2]) + f"({escapar_texto_pdf(nombre[-2:])}) Tj "
+            + _par("IDENTIFICACIÓN:", verdad["IDENTIFICACIÓN"]),
+            _par("EDAD:", f"{edad} Años") + _par("SEXO:", verdad["SEXO"]) + _par("ESTADO CIVIL:", "SOLTERO"),
+            _titulo("EXAMEN FÍSICO"),
+            _par("PESO", f"{peso} kgs", 300) + _par("TALLA", f"{talla} cms", 300) + _par("T.A.", "120/80 mmHg", 300),
+        ]
+        for _ in range(40):
+            lineas.append(f"/F1 9 Tf ({' '.join(azar.choice(_PALABRAS) for _ in range(14))}) Tj ")
+        contenidos.append("BT 40 800 Td 13 TL " + "T* ".join(lineas) + "ET")
+    return contenidos, verdad
+
+
+def generar_sinteticas(directorio, cantidad, paginas, semilla=0):
+    """Escribe `cantidad` historias sintéticas; retorna {ruta: valores correctos}"""
+    azar = random.Random(semilla)
+    os.makedirs(directorio, exist_ok=True)
+    verdades = {}
+    for n in range(cantidad):
+        contenidos, verdad = historia_sintetica(azar, paginas)
+        ruta = os.path.join(directorio, f"sintetica_{n}.pdf")
+        with open(ruta, "wb") as f:
+            f.write(pdf_paginas(contenidos))
+        verdades[ruta] = verdad
+    return verdades
+
+
+def evaluar_campos(texto, verdad=None):
+    """
+    Puntaje 0..1 por campo. Con `verdad`, la fracción de valores correctos
+    recuperados; sin ella (PDF real), 1 si el campo se encontró.
+    """
+    puntajes = {}
+    for campo, patron in CAMPOS.items():
+        encontrados = [m.group(1).strip() for m in patron.finditer(texto)]
+        if verdad is None:
+            puntajes[campo] = 1.0 if encontrados else 0.0
+            continue
+        esperados = verdad[campo] if isinstance(verdad[campo], list) else [verdad[campo]]
+        if campo == "FECHA ATENCIÓN":
+            encontrados = [e[:10] for e in encontrados]
+        puntajes[campo] = sum(1 for e in set(esperados) if e in encontrados) / len(set(esperados))
+    return puntajes
+
+
+def medir_backend(nombre, rutas, verdades, repeticiones=3, normalizar=False):
+    backend = obtener_backend(nombre)
+    paginas = 0
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        textos = {}
+        for ruta in rutas:
+            paginas_ruta = list(backend.paginas(ruta))
+            paginas += len(paginas_ruta)
+            if normalizar:
+                paginas_ruta = [normalizar_pagina_pdf(p) for p in paginas_ruta]
+            textos[ruta] = "\n\n".join(paginas_ruta)
+    duracion = time.perf_counter() - inicio
+
+    sinteticos, reales = {campo: [] for campo in CAMPOS}, {}
+    pegadas = 0
+    for ruta, texto in textos.items():
+        pegadas += len(RE_PEGADAS.findall(texto))
+        puntajes = evaluar_campos(texto, verdades.get(ruta))
+        if ruta in verdades:
+            for campo, puntaje in puntajes.items():
+                sinteticos[campo].append(puntaje)
+        else:
+            reales[os.path.basename(ruta)] = puntajes
+    campos = {campo: round(sum(p) / len(p), 3) for campo, p in sinteticos.items() if p}
+    return {
+        "backend": nombre,
+        "version": backend.version,
+        "paginas": paginas,
+        "segundos": round(duracion, 3),
+        "paginas_segundo": round(paginas / duracion, 1) if duracion else 0.0,
+        "campos_sinteticos": campos,
+        "fidelidad": round(sum(campos.values()) / len(campos), 3) if campos else None,
+        "campos_reales": reales,
+        "etiquetas_pegadas": pegadas,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara los backends de extracción de texto de PDF")
+    parser.add_argument("pdfs", nargs="*", help="PDFs reales a incluir (por defecto output/historia_paciente_0.pdf)")
+    parser.add_argument("--backends", nargs="+", default=None, help="Backends a medir (por defecto los instalados)")
+    parser.add_argument("--sinteticas", type=int, default=20, help="Historias sintéticas a generar")
+    parser.add_argument("--paginas", type=int, default=6, help="Páginas (atenciones) por historia sintética")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Pasadas sobre todos los PDFs al medir velocidad")
+    parser.add_argument("--normalizar", action="store_true",
+                        help="Medir los campos después de normalizar_pagina_pdf, como en web_medifolios")
+    parser.add_argument("--dir", default=None, help="Directorio para las sintéticas (por defecto uno temporal)")
+    parser.add_argument("--json", help="Guardar los resultados en este archivo")
+    args = parser.parse_args()
+
+    reales = args.pdfs or ([PDF_REFERENCIA] if os.path.exists(PDF_REFERENCIA) else [])
+    directorio = args.dir or tempfile.mkdtemp(prefix="benchmark_pdf_")
+    verdades = generar_sinteticas(directorio, args.sinteticas, args.paginas)
+    rutas = reales + list(verdades)
+    backends = args.backends or backends_disponibles()
+    print(f"🧪 {len(reales)} PDFs reales y {len(verdades)} sintéticos de {args.paginas} páginas, "
+          f"backends: {', '.join(backends)}")
+
+    resultados = []
+    for nombre in backends:
+        try:
+            resultados.append(medir_backend(nombre, rutas, verdades, args.repeticiones, args.normalizar))
+        except Exception as e:
+            print(f"❌ {nombre}: {str(e)[:200]}")
+
+    print(f"\n📊 EXTRACCIÓN DE TEXTO ({'normalizado' if args.normalizar else 'tal cual'})")
+    print(f"   {'backend':<12}{'págs/s':>9}{'fidelidad':>11}{'pegadas':>9}  " + "  ".join(CAMPOS))
+    for r in resultados:
+        campos = "  ".join(f"{r['campos_sinteticos'].get(c, 0):>{len(c)}.0%}" for c in CAMPOS)
+        fidelidad = f"{r['fidelidad']:.0%}" if r["fidelidad"] is not None else "-"
+        print(f"   {r['backend']:<12}{r['paginas_segundo']:>9.1f}{fidelidad:>11}{r['etiquetas_pegadas']:>9}  {campos}")
+    for nombre_pdf in (resultados[0]["campos_reales"] if resultados else {}):
+        print(f"\n   {nombre_pdf}: campos encontrados")
+        for r in resultados:
+            puntajes = r["campos_reales"][nombre_pdf]
+            faltan = [c for c, p in puntajes.items() if not p]
+            print(f"   {r['backend']:<12}{int(sum(puntajes.values()))}/{len(CAMPOS)}"
+                  + (f"  (faltan: {', '.join(faltan)})" if faltan else ""))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "resultados": resultados}, f, ensure_ascii=False, indent=2)
+        print(f"💾 Resultados guardados en {args.json}")
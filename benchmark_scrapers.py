@@ -0,0 +1,150 @@
+"""
+Benchmark de los scrapers contra simulador_sitios.py: mide pacientes/hora de
+descargar_historias_clinicas (Medifolios) y de descargar_multiples_historias
+(Avicena, vía procesar_documento) con latencias y fallos reproducibles.
+
+    python benchmark_scrapers.py --sitio ambos --pacientes 20 --latencia 0.2 --tasa-fallos 0.05
+    python benchmark_scrapers.py --sitio medifolios --pacientes 40 --workers 3 --json resultado.json
+
+Requiere Chrome y chromedriver, igual que los scrapers.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from simulador_sitios import (agregar_argumentos, config_desde_argumentos, imagen_captcha,
+                              iniciar_simulador, variables_entorno)
+
+# Captchas generados para entrenar el reconocedor local antes de medir
+CAPTCHAS_ENTRENAMIENTO = 40
+
+USUARIO_SIMULADO = "benchmark"
+PASSWORD_SIMULADO = "benchmark"
+
+
+def _entrenar_reconocedor(directorio, cantidad=CAPTCHAS_ENTRENAMIENTO):
+    """Entrena el reconocedor con captchas del simulador, así el login no pasa por OpenAI"""
+    from captcha_local import ReconocedorCaptcha
+
+    reconocedor = ReconocedorCaptcha(directorio)
+    azar = random.Random(0)
+    for _ in range(cantidad):
+        codigo = "".join(azar.choice("0123456789") for _ in range(5))
+        reconocedor.registrar(imagen_captcha(codigo), codigo)
+    print(f"🧠 Reconocedor entrenado con {len(reconocedor.etiquetas)} dígitos del simulador")
+
+
+def _resultado(sitio, pacientes, exitosos, duracion, **extra):
+    resultado = {
+        "sitio": sitio,
+        "pacientes": pacientes,
+        "exitosos": exitosos,
+        "segundos": round(duracion, 2),
+        "pacientes_hora": round(exitosos / duracion * 3600, 1) if duracion else 0.0,
+    }
+    resultado.update(extra)
+    return resultado
+
+
+def medir_medifolios(num_pacientes, directorio, workers=1):
+    """Login, índice y descarga de `num_pacientes` historias; con workers > 1 usa el pool"""
+    from web_medifolios import HistoriasClinicasExtractor
+    from pool_medifolios import descargar_en_paralelo
+
+    salida = os.path.join(directorio, "medifolios")
+    opciones = {"usar_cache_sesion": False}
+    inicio = time.monotonic()
+    if workers > 1:
+        pdfs_info = descargar_en_paralelo(USUARIO_SIMULADO, PASSWORD_SIMULADO, num_pacientes,
+                                          num_workers=workers, output_dir=salida, opciones_extractor=opciones)
+        return _resultado("medifolios", num_pacientes, len(pdfs_info), time.monotonic() - inicio, workers=workers)
+
+    extractor = HistoriasClinicasExtractor(output_dir=salida, **opciones)
+    try:
+        extractor.precalentar()
+        if not extractor.login(USUARIO_SIMULADO, PASSWORD_SIMULADO):
+            raise RuntimeError("Falló el login en el simulador de Medifolios")
+        extractor.navegar_a_pacientes()
+        pacientes = extractor.construir_indice_pacientes(limite=num_pacientes)
+        inicio_descarga = time.monotonic()
+        pdfs_info = extractor.descargar_historias_clinicas(pacientes=pacientes)
+        fin = time.monotonic()
+    finally:
+        extractor.cerrar()
+    return _resultado("medifolios", len(pacientes), len(pdfs_info), fin - inicio, workers=1,
+                      segundos_descarga=round(fin - inicio_descarga, 2))
+
+
+def medir_avicena(num_pacientes, directorio):
+    """Login con captcha y descarga de todos los folios de `num_pacientes` documentos"""
+    from web_avicena import AvicenaLogin
+
+    salida = os.path.join(directorio, "avicena")
+    avicena = AvicenaLogin(download_dir=salida, usar_cache_sesion=False)
+    resultados = []
+    inicio = time.monotonic()
+    try:
+        avicena.precalentar()
+        if not avicena.iniciar_sesion(USUARIO_SIMULADO, PASSWORD_SIMULADO):
+            raise RuntimeError("Falló el login en el simulador de Avicena")
+        inicio_descarga = time.monotonic()
+        for n in range(num_pacientes):
+            numero = str(41389301 + n * 13)
+            resultados.append(avicena.procesar_documento("433", numero, os.path.join(salida, f"433_{numero}")))
+        fin = time.monotonic()
+    finally:
+        avicena.cerrar()
+    exitosos = [r for r in resultados if r["ok"]]
+    return _resultado("avicena", num_pacientes, len(exitosos), fin - inicio,
+                      segundos_descarga=round(fin - inicio_descarga, 2),
+                      pdfs=sum(len(r["pdfs"]) for r in exitosos))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de los scrapers contra el simulador local")
+    parser.add_argument("--sitio", choices=["medifolios", "avicena", "ambos"], default="ambos")
+    parser.add_argument("--pacientes", "-n", type=int, default=10, help="Pacientes a descargar por sitio")
+    parser.add_argument("--workers", "-w", type=int, default=1, help="Navegadores en paralelo (solo Medifolios)")
+    parser.add_argument("--dir", default=None, help="Directorio de salida (por defecto uno temporal)")
+    parser.add_argument("--json", help="Guardar los resultados en este archivo")
+    parser.add_argument("--headless", action="store_true", help="Medir en modo producción (headless y con bloqueos)")
+    parser.add_argument("--puerto", type=int, default=0,
+                        help="Puerto fijo del simulador (la caché de Chrome depende del origen)")
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+
+    directorio = args.dir or tempfile.mkdtemp(prefix="benchmark_hc_")
+    servidor, url_base = iniciar_simulador(config_desde_argumentos(args), args.puerto)
+    print(f"🧪 Simulador en {url_base}, salida en {directorio}")
+
+    # Antes de importar los scrapers: las URLs y el directorio de captchas se leen al importar
+    os.environ.update(variables_entorno(url_base))
+    os.environ["DIR_CAPTCHAS"] = os.path.join(directorio, "captchas")
+    # Perfiles de Chrome aparte de los de producción; con el mismo --dir la segunda corrida mide en caliente
+    os.environ["DIR_PERFILES"] = os.path.join(directorio, "perfiles")
+    if args.headless:
+        os.environ["NAVEGADOR_HEADLESS"] = "1"
+    if args.sitio != "medifolios" and not args.captcha_libre:
+        _entrenar_reconocedor(os.environ["DIR_CAPTCHAS"])
+
+    resultados = []
+    try:
+        if args.sitio in ("medifolios", "ambos"):
+            resultados.append(medir_medifolios(args.pacientes, directorio, args.workers))
+        if args.sitio in ("avicena", "ambos"):
+            resultados.append(medir_avicena(args.pacientes, directorio))
+    finally:
+        servidor.shutdown()
+
+    print(f"\n📊 BENCHMARK (latencia {args.latencia}s, reporte {args.latencia_reporte}s, "
+          f"fallos {args.tasa_fallos:.0%}, cuelgues {args.tasa_cuelgues:.0%})")
+    for r in resultados:
+        print(f"   {r['sitio']}: {r['exitosos']}/{r['pacientes']} pacientes en {r['segundos']:.1f}s "
+              f"→ {r['pacientes_hora']:.0f} pacientes/hora")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "resultados": resultados}, f, ensure_ascii=False, indent=2)
+        print(f"💾 Resultados guardados en {args.json}")
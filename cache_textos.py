@@ -0,0 +1,257 @@
+"""
+Caché persistente del texto extraído de los PDFs, direccionada por contenido:
+la clave es el SHA-256 del archivo y la versión del backend que lo extrajo, así
+un PDF copiado, renombrado o descargado de nuevo sin cambios no se vuelve a
+parsear, y cambiar de librería (o de versión) no sirve texto viejo.
+
+Se guarda el texto de las páginas comprimido con zlib y los desplazamientos de
+inicio de cada página, en un SQLite con tope de tamaño: al pasarlo se borran las
+entradas usadas hace más tiempo. Lo que cada flujo hace después con el texto
+(normalizar_pagina_pdf, separadores, recortes) es barato y se aplica sobre lo
+que sale de la caché, así una misma entrada sirve a todos los flujos.
+
+Si quien lee corta antes del final (presupuesto de caracteres) se guardan las
+páginas leídas; una lectura posterior que necesite más sigue desde ahí.
+
+    from cache_textos import iterar_paginas
+    for pagina in iterar_paginas(ruta):
+        ...
+"""
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+
+from extractores_pdf import obtener_backend
+from manifiesto import hash_archivo
+
+# Archivo SQLite de la caché; contiene texto de historias clínicas, no versionar
+ARCHIVO_CACHE_TEXTOS = os.getenv(
+    "CACHE_TEXTOS_ARCHIVO", os.path.join(os.path.expanduser("~"), ".historia_clinica", "textos_pdf.sqlite3")
+)
+
+# Usar la caché; con "0" todos los PDFs se parsean en cada corrida
+USAR_CACHE_TEXTOS = os.getenv("CACHE_TEXTOS", "1").lower() in ("1", "true", "si", "sí")
+
+# Tope del texto comprimido guardado; al pasarlo se desalojan las entradas menos usadas
+TAMANO_CACHE_TEXTOS_MB = int(os.getenv("CACHE_TEXTOS_MB", "1024"))
+
+# Cambia si cambia el formato de lo guardado
+VERSION_FORMATO = 1
+
+# Al desalojar se baja hasta esta fracción del tope, para no desalojar en cada escritura
+_FRACCION_TRAS_DESALOJO = 0.9
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS textos (
+    huella TEXT NOT NULL,
+    version TEXT NOT NULL,
+    paginas INTEGER NOT NULL,
+    texto BLOB NOT NULL,
+    desplazamientos BLOB NOT NULL,
+    completo INTEGER NOT NULL DEFAULT 1,
+    tamano INTEGER NOT NULL,
+    creado REAL NOT NULL,
+    ultimo_uso REAL NOT NULL,
+    PRIMARY KEY (huella, version)
+);
+CREATE INDEX IF NOT EXISTS textos_ultimo_uso ON textos (ultimo_uso);
+"""
+
+
+def _empaquetar(paginas):
+    """(texto comprimido, desplazamientos comprimidos) de una lista de páginas"""
+    desplazamientos = array("I")
+    posicion = 0
+    for pagina in paginas:
+        desplazamientos.append(posicion)
+        posicion += len(pagina)
+    return zlib.compress("".join(paginas).encode("utf-8")), zlib.compress(desplazamientos.tobytes())
+
+
+def _desempaquetar(texto, desplazamientos):
+    texto = zlib.decompress(texto).decode("utf-8")
+    inicios = array("I")
+    inicios.frombytes(zlib.decompress(desplazamientos))
+    finales = list(inicios[1:]) + [len(texto)]
+    return [texto[inicio:fin] for inicio, fin in zip(inicios, finales)]
+
+
+class CacheTextos:
+    """
+    Páginas extraídas por (SHA-256 del PDF, versión del backend). Segura entre
+    hilos y entre procesos (cada proceso abre su propia conexión).
+    """
+
+    def __init__(self, ruta=ARCHIVO_CACHE_TEXTOS, tamano_max_mb=TAMANO_CACHE_TEXTOS_MB):
+        self.ruta = ruta
+        self.tamano_max = tamano_max_mb * 1024 * 1024
+        self._conexion = None
+        self._candado = threading.Lock()
+
+    def _conectar(self):
+        if self._conexion is None:
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, mode=0o700, exist_ok=True)
+            # El archivo guarda el texto clínico completo: solo lo lee el usuario dueño
+            os.close(os.open(self.ruta, os.O_CREAT | os.O_WRONLY, 0o600))
+            conexion = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False)
+            conexion.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conexion.execute("PRAGMA journal_mode = WAL")
+            self._restringir_permisos()
+            conexion.execute("PRAGMA synchronous = NORMAL")
+            conexion.executescript(_ESQUEMA)
+            columnas = [fila[1] for fila in conexion.execute("PRAGMA table_info(textos)")]
+            if "completo" not in columnas:
+                # Cachés creadas antes de guardar lecturas parciales: todas sus entradas están completas
+                conexion.execute("ALTER TABLE textos ADD COLUMN completo INTEGER NOT NULL DEFAULT 1")
+            self._conexion = conexion
+        return self._conexion
+
+    def _restringir_permisos(self):
+        """Deja la base y sus archivos -wal/-shm en 0600, incluidos los de cachés ya creadas"""
+        for ruta in (self.ruta, self.ruta + "-wal", self.ruta + "-shm"):
+            try:
+                os.chmod(ruta, 0o600)
+            except OSError:
+                pass
+
+    @staticmethod
+    def version(backend):
+        return f"{backend.version}/v{VERSION_FORMATO}"
+
+    def obtener(self, huella, version):
+        """(páginas guardadas, completo) o None si no está"""
+        with self._candado:
+            conexion = self._conectar()
+            fila = conexion.execute(
+                "SELECT texto, desplazamientos, completo FROM textos WHERE huella = ? AND version = ?",
+                (huella, version)
+            ).fetchone()
+            if fila is None:
+                return None
+            with conexion:
+                conexion.execute("UPDATE textos SET ultimo_uso = ? WHERE huella = ? AND version = ?",
+                                 (time.time(), huella, version))
+        return _desempaquetar(fila[0], fila[1]), bool(fila[2])
+
+    def guardar(self, huella, version, paginas, completo=True):
+        texto, desplazamientos = _empaquetar(paginas)
+        ahora = time.time()
+        with self._candado:
+            conexion = self._conectar()
+            with conexion:
+                conexion.execute(
+                    "INSERT OR REPLACE INTO textos (huella, version, paginas, texto, desplazamientos, completo, "
+                    "tamano, creado, ultimo_uso) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (huella, version, len(paginas), texto, desplazamientos, int(completo),
+                     len(texto) + len(desplazamientos), ahora, ahora),
+                )
+            self._desalojar(conexion)
+
+    def _desalojar(self, conexion):
+        """Borra las entradas usadas hace más tiempo hasta quedar bajo el tope"""
+        total = conexion.execute("SELECT COALESCE(SUM(tamano), 0) FROM textos").fetchone()[0]
+        if total <= self.tamano_max:
+            return 0
+        exceso = total - int(self.tamano_max * _FRACCION_TRAS_DESALOJO)
+        borrar = []
+        for rowid, tamano in conexion.execute("SELECT rowid, tamano FROM textos ORDER BY ultimo_uso"):
+            borrar.append((rowid,))
+            exceso -= tamano
+            if exceso <= 0:
+                break
+        with conexion:
+            conexion.executemany("DELETE FROM textos WHERE rowid = ?", borrar)
+        conexion.execute("PRAGMA incremental_vacuum")
+        print(f"🧹 Caché de textos: {len(borrar)} entradas desalojadas para quedar bajo "
+              f"{self.tamano_max / 1024 / 1024:.0f} MB")
+        return len(borrar)
+
+    def resumen(self):
+        with self._candado:
+            entradas, paginas, tamano = self._conectar().execute(
+                "SELECT COUNT(*), COALESCE(SUM(paginas), 0), COALESCE(SUM(tamano), 0) FROM textos"
+            ).fetchone()
+        return {"entradas": entradas, "paginas": paginas, "mb": round(tamano / 1024 / 1024, 1)}
+
+    def cerrar(self):
+        with self._candado:
+            if self._conexion is not None:
+                self._conexion.close()
+            self._conexion = None
+
+
+_cache = None
+_candado_cache = threading.Lock()
+
+
+def _reiniciar_en_hijo():
+    # Un proceso hijo (fork del pool de extracción) no puede usar la conexión ni los
+    # candados del padre: abre su propia caché
+    global _cache, _candado_cache
+    _cache, _candado_cache = None, threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reiniciar_en_hijo)
+
+
+def cache_global():
+    """Caché compartida del proceso, o None si está desactivada"""
+    global _cache
+    if not USAR_CACHE_TEXTOS:
+        return None
+    with _candado_cache:
+        if _cache is None:
+            _cache = CacheTextos()
+        return _cache
+
+
+def iterar_paginas(ruta, backend=None, cache=None, estadisticas=None):
+    """
+    Genera el texto de cada página del PDF con el backend indicado (por defecto
+    EXTRACTOR_PDF): primero lo que haya en la caché para ese mismo contenido y
+    versión, después lo que falte, leído del PDF solo a medida que se pide.
+    `estadisticas`, si se pasa, queda con las páginas servidas desde la caché
+    ("cache") y las extraídas del PDF ("extraidas").
+    """
+    extractor = obtener_backend(backend)
+    cache = cache or cache_global()
+    estadisticas = {} if estadisticas is None else estadisticas
+    estadisticas.update(cache=0, extraidas=0)
+
+    guardadas, completo = [], False
+    if cache is not None:
+        huella = hash_archivo(ruta)
+        version = CacheTextos.version(extractor)
+        try:
+            guardadas, completo = cache.obtener(huella, version) or ([], False)
+        except sqlite3.Error as e:
+            print(f"⚠️ Caché de textos no disponible: {str(e)[:100]}")
+            cache = None
+
+    for pagina in guardadas:
+        estadisticas["cache"] += 1
+        yield pagina
+    if completo:
+        return
+
+    leidas = list(guardadas)
+    terminado = False
+    try:
+        for pagina in extractor.paginas(ruta, desde=len(guardadas)):
+            leidas.append(pagina)
+            estadisticas["extraidas"] += 1
+            yield pagina
+        terminado = True
+    finally:
+        # También si quien lee cortó antes: el prefijo sirve a la próxima lectura
+        if cache is not None and (terminado or len(leidas) > len(guardadas)):
+            try:
+                cache.guardar(huella, version, leidas, completo=terminado)
+            except sqlite3.Error as e:
+                print(f"⚠️ No se pudo guardar el texto en la caché: {str(e)[:100]}")
@@ -0,0 +1,257 @@
+"""
+Reconocedor local de los captchas numéricos de Avicena.
+
+Segmenta la imagen en dígitos por proyección de columnas y clasifica cada uno
+con vecino más cercano contra plantillas sacadas de captchas ya resueltos.
+Cada login exitoso agrega su captcha (con el código que funcionó) al conjunto
+de entrenamiento, así el reconocedor mejora solo con el uso.
+
+Uso para reconstruir el modelo y medir su precisión:
+    python captcha_local.py --entrenar
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+DIR_CAPTCHAS = os.getenv(
+    "DIR_CAPTCHAS", os.path.join(os.path.expanduser("~"), ".historia_clinica", "captchas")
+)
+
+# Tamaño al que se normaliza cada dígito antes de compararlo
+LADO_DIGITO = 16
+
+# Columnas con menos píxeles de tinta que esto se consideran vacías (ruido, líneas finas)
+MIN_TINTA_COLUMNA = 1
+MIN_ANCHO_DIGITO = 3
+
+# Distancia máxima aceptada al vecino más cercano (vectores normalizados, 0 a 2)
+DISTANCIA_MAXIMA = 0.6
+
+# Los workers de lote_avicena inician sesión a la vez y comparten el modelo en disco
+_candado_modelo = threading.Lock()
+
+
+def _umbral_otsu(grises):
+    histograma = np.bincount(grises.ravel(), minlength=256).astype(np.float64)
+    total = grises.size
+    suma_total = np.dot(np.arange(256), histograma)
+    peso_fondo = suma_fondo = 0.0
+    mejor, umbral = -1.0, 127
+    for t in range(256):
+        peso_fondo += histograma[t]
+        if peso_fondo == 0 or peso_fondo == total:
+            continue
+        suma_fondo += t * histograma[t]
+        media_fondo = suma_fondo / peso_fondo
+        media_frente = (suma_total - suma_fondo) / (total - peso_fondo)
+        varianza = peso_fondo * (total - peso_fondo) * (media_fondo - media_frente) ** 2
+        if varianza > mejor:
+            mejor, umbral = varianza, t
+    return umbral
+
+
+def binarizar(imagen):
+    """Imagen PIL (o ruta) a matriz booleana donde True es tinta"""
+    if not isinstance(imagen, Image.Image):
+        imagen = Image.open(imagen)
+    grises = np.asarray(imagen.convert("L"), dtype=np.uint8)
+    tinta = grises <= _umbral_otsu(grises)
+    # La tinta es la clase minoritaria; si no, el captcha es claro sobre oscuro
+    if tinta.mean() > 0.5:
+        tinta = ~tinta
+    return tinta
+
+
+def _dividir_ancho(segmentos, columnas, ancho_tipico):
+    """Parte en dos los segmentos mucho más anchos que el resto (dígitos pegados)"""
+    resultado = []
+    for inicio, fin in segmentos:
+        ancho = fin - inicio
+        if ancho_tipico and ancho > 1.6 * ancho_tipico:
+            partes = int(round(ancho / ancho_tipico))
+            cortes = [inicio]
+            for k in range(1, partes):
+                centro = inicio + k * ancho // partes
+                ventana = columnas[max(inicio, centro - 2):min(fin, centro + 3)]
+                cortes.append(max(inicio, centro - 2) + int(np.argmin(ventana)))
+            cortes.append(fin)
+            resultado.extend(zip(cortes[:-1], cortes[1:]))
+        else:
+            resultado.append((inicio, fin))
+    return resultado
+
+
+def segmentar(tinta):
+    """Lista de matrices booleanas, una por dígito, de izquierda a derecha"""
+    columnas = tinta.sum(axis=0)
+    segmentos, inicio = [], None
+    for x, cantidad in enumerate(np.append(columnas, 0)):
+        if cantidad >= MIN_TINTA_COLUMNA and inicio is None:
+            inicio = x
+        elif cantidad < MIN_TINTA_COLUMNA and inicio is not None:
+            if x - inicio >= MIN_ANCHO_DIGITO:
+                segmentos.append((inicio, x))
+            inicio = None
+
+    if segmentos:
+        ancho_tipico = float(np.median([fin - ini for ini, fin in segmentos]))
+        segmentos = _dividir_ancho(segmentos, columnas, ancho_tipico)
+
+    digitos = []
+    for ini, fin in segmentos:
+        recorte = tinta[:, ini:fin]
+        filas = np.where(recorte.any(axis=1))[0]
+        if filas.size:
+            digitos.append(recorte[filas[0]:filas[-1] + 1])
+    return digitos
+
+
+def vectorizar(digito):
+    """Dígito binario a vector normalizado de LADO_DIGITO x LADO_DIGITO"""
+    imagen = Image.fromarray((digito * 255).astype(np.uint8))
+    imagen = imagen.resize((LADO_DIGITO, LADO_DIGITO), Image.BILINEAR)
+    vector = np.asarray(imagen, dtype=np.float32).ravel()
+    norma = np.linalg.norm(vector)
+    return vector / norma if norma else vector
+
+
+class ReconocedorCaptcha:
+    """Clasificador de dígitos por vecino más cercano sobre plantillas etiquetadas"""
+
+    def __init__(self, directorio=DIR_CAPTCHAS):
+        self.directorio = directorio
+        self.ruta_modelo = os.path.join(directorio, "modelo.npz")
+        self.plantillas = np.zeros((0, LADO_DIGITO * LADO_DIGITO), dtype=np.float32)
+        self.etiquetas = np.zeros(0, dtype="<U1")
+        self._cargar()
+
+    def _cargar(self):
+        try:
+            datos = np.load(self.ruta_modelo)
+            self.plantillas, self.etiquetas = datos["plantillas"], datos["etiquetas"]
+        except (OSError, KeyError, ValueError):
+            pass
+
+    def _guardar(self):
+        """Escribe el modelo con un temporal único en el mismo directorio (llamar con el candado)"""
+        os.makedirs(self.directorio, exist_ok=True)
+        fd, temporal = tempfile.mkstemp(prefix="modelo_", suffix=".tmp", dir=self.directorio)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, plantillas=self.plantillas, etiquetas=self.etiquetas)
+            os.replace(temporal, self.ruta_modelo)
+        except BaseException:
+            try:
+                os.remove(temporal)
+            except OSError:
+                pass
+            raise
+
+    @property
+    def entrenado(self):
+        return len(set(self.etiquetas.tolist())) >= 10
+
+    def reconocer(self, imagen):
+        """
+        Retorna el código leído, o None si no hay modelo suficiente o algún
+        dígito no se parece lo bastante a ninguna plantilla.
+        """
+        if not self.entrenado:
+            return None
+        digitos = segmentar(binarizar(imagen))
+        if not digitos:
+            return None
+
+        vectores = np.stack([vectorizar(d) for d in digitos])
+        # Distancias euclidianas (dígitos x plantillas) en una sola operación
+        distancias = np.sqrt(np.maximum(
+            (vectores ** 2).sum(1)[:, None] + (self.plantillas ** 2).sum(1)[None, :]
+            - 2 * vectores @ self.plantillas.T, 0
+        ))
+        cercanos = distancias.argmin(axis=1)
+        if distancias[np.arange(len(digitos)), cercanos].max() > DISTANCIA_MAXIMA:
+            return None
+        return "".join(self.etiquetas[cercanos])
+
+    def registrar(self, imagen, codigo):
+        """
+        Agrega un captcha resuelto al entrenamiento. Solo se usa si la segmentación
+        produce tantos dígitos como tiene el código; la imagen queda guardada
+        para poder reentrenar con --entrenar.
+        """
+        digitos = segmentar(binarizar(imagen))
+        if not codigo.isdigit() or len(digitos) != len(codigo):
+            print(f"⚠️ Captcha '{codigo}' no se agregó al entrenamiento: "
+                  f"{len(digitos)} segmentos para {len(codigo)} dígitos")
+            return False
+
+        os.makedirs(self.directorio, exist_ok=True)
+        if isinstance(imagen, str):
+            shutil.copyfile(imagen, os.path.join(self.directorio, f"{codigo}_{int(time.time() * 1000)}.png"))
+
+        nuevas = np.stack([vectorizar(d) for d in digitos])
+        with _candado_modelo:
+            # Se parte del modelo en disco para no pisar lo que otro worker agregó
+            self._cargar()
+            self.plantillas = np.vstack([self.plantillas, nuevas])
+            self.etiquetas = np.concatenate([self.etiquetas, np.array(list(codigo), dtype="<U1")])
+            self._guardar()
+        print(f"🧠 Captcha '{codigo}' agregado al entrenamiento ({len(self.etiquetas)} dígitos)")
+        return True
+
+    def entrenar(self):
+        """Reconstruye las plantillas a partir de las imágenes etiquetadas del directorio"""
+        self.plantillas = np.zeros((0, LADO_DIGITO * LADO_DIGITO), dtype=np.float32)
+        self.etiquetas = np.zeros(0, dtype="<U1")
+        muestras = []
+        os.makedirs(self.directorio, exist_ok=True)
+        for archivo in sorted(os.listdir(self.directorio)):
+            codigo = archivo.split("_", 1)[0]
+            if archivo.endswith(".png") and codigo.isdigit():
+                digitos = segmentar(binarizar(os.path.join(self.directorio, archivo)))
+                if len(digitos) == len(codigo):
+                    muestras.append((codigo, digitos))
+
+        if muestras:
+            self.plantillas = np.stack([vectorizar(d) for _, digitos in muestras for d in digitos])
+            self.etiquetas = np.array([c for codigo, _ in muestras for c in codigo], dtype="<U1")
+        with _candado_modelo:
+            self._guardar()
+        return muestras
+
+    def evaluar(self, muestras):
+        """Precisión por captcha dejando cada captcha fuera de sus propias plantillas"""
+        aciertos = inicio = 0
+        for codigo, digitos in muestras:
+            fin = inicio + len(codigo)
+            plantillas = np.vstack([self.plantillas[:inicio], self.plantillas[fin:]])
+            etiquetas = np.concatenate([self.etiquetas[:inicio], self.etiquetas[fin:]])
+            vectores = np.stack([vectorizar(d) for d in digitos])
+            cercanos = ((vectores[:, None, :] - plantillas[None, :, :]) ** 2).sum(-1).argmin(1)
+            aciertos += "".join(etiquetas[cercanos]) == codigo
+            inicio = fin
+        return aciertos / len(muestras) if muestras else 0.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconocedor local de captchas de Avicena")
+    parser.add_argument("--entrenar", action="store_true", help="Reconstruir el modelo desde las imágenes etiquetadas")
+    parser.add_argument("--reconocer", help="Ruta de una imagen de captcha a leer")
+    parser.add_argument("--dir", default=DIR_CAPTCHAS, help="Directorio de captchas etiquetados")
+    args = parser.parse_args()
+
+    reconocedor = ReconocedorCaptcha(args.dir)
+    if args.entrenar:
+        muestras = reconocedor.entrenar()
+        print(f"✅ Modelo con {len(muestras)} captchas ({len(reconocedor.etiquetas)} dígitos)")
+        print(f"📊 Precisión (dejando uno fuera): {reconocedor.evaluar(muestras):.1%}")
+    if args.reconocer:
+        inicio = time.perf_counter()
+        codigo = reconocedor.reconocer(args.reconocer)
+        print(f"🔍 {codigo or 'sin lectura confiable'} ({(time.perf_counter() - inicio) * 1000:.1f} ms)")
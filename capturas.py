@@ -0,0 +1,65 @@
+import base64
+import collections
+import os
+import re
+import time
+
+# Capturas de diagnóstico desactivadas por defecto: en producción solo cuestan tiempo y disco
+CAPTURAS_DEBUG = os.getenv("CAPTURAS_DEBUG", "0").lower() in ("1", "true", "si", "sí")
+
+# Últimas capturas que se conservan en memoria
+MAX_CAPTURAS = int(os.getenv("MAX_CAPTURAS", "12"))
+
+DIR_CAPTURAS = os.getenv("DIR_CAPTURAS", "capturas_fallos")
+
+# Calidad JPEG de cada captura: bastante para leer la pantalla, una fracción del PNG
+CALIDAD_CAPTURA = 60
+
+
+class BufferCapturas:
+    """
+    Capturas de pantalla de diagnóstico en un buffer circular en memoria.
+
+    Con `activo=False` capturar() no hace nada. Activo, guarda las últimas
+    `max_capturas` como JPEG y solo las escribe a disco con volcar(), cuando
+    algo falló; descartar() las olvida cuando el paso terminó bien.
+    """
+
+    def __init__(self, activo=CAPTURAS_DEBUG, max_capturas=MAX_CAPTURAS, directorio=DIR_CAPTURAS):
+        self.activo = activo
+        self.directorio = directorio
+        self._capturas = collections.deque(maxlen=max_capturas)
+
+    def capturar(self, driver, etiqueta):
+        if not self.activo:
+            return
+        try:
+            # CDP comprime en el navegador; save_screenshot siempre pasa un PNG completo
+            datos = base64.b64decode(driver.execute_cdp_cmd(
+                "Page.captureScreenshot", {"format": "jpeg", "quality": CALIDAD_CAPTURA}
+            )["data"])
+            extension = "jpg"
+        except Exception:
+            try:
+                datos, extension = driver.get_screenshot_as_png(), "png"
+            except Exception as e:
+                print(f"⚠️ No se pudo capturar '{etiqueta}': {str(e)[:100]}")
+                return
+        self._capturas.append((time.time(), etiqueta, extension, datos))
+
+    def volcar(self, motivo):
+        """Escribe las capturas del buffer en <directorio>/<motivo>_<fecha>/ y lo vacía"""
+        if not self._capturas:
+            return None
+        nombre = re.sub(r"[^\w.-]", "_", str(motivo))
+        carpeta = os.path.join(self.directorio, f"{nombre}_{time.strftime('%Y%m%d_%H%M%S')}")
+        os.makedirs(carpeta, exist_ok=True)
+        for n, (_, etiqueta, extension, datos) in enumerate(self._capturas, 1):
+            with open(os.path.join(carpeta, f"{n:02d}_{etiqueta}.{extension}"), "wb") as f:
+                f.write(datos)
+        print(f"📸 {len(self._capturas)} capturas de diagnóstico guardadas en {carpeta}")
+        self._capturas.clear()
+        return carpeta
+
+    def descartar(self):
+        self._capturas.clear()
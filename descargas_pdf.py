@@ -0,0 +1,201 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Bytes finales del PDF donde debe aparecer el marcador %%EOF
+_COLA_PDF = 2048
+
+# Inicio del rango en "Content-Range: bytes 1024-2047/4096"
+_RE_CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-")
+
+
+def verificar_pdf(ruta):
+    """True si el archivo empieza con %PDF- y termina con el marcador %%EOF"""
+    try:
+        tamano = os.path.getsize(ruta)
+        with open(ruta, "rb") as f:
+            if f.read(5) != b"%PDF-":
+                return False
+            f.seek(max(0, tamano - _COLA_PDF))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+
+class GestorDescargas:
+    """
+    Descarga PDFs en segundo plano con una sola sesión HTTP keep-alive por login.
+
+    La cola es acotada: encolar() bloquea cuando hay `max_pendientes` descargas
+    sin terminar. Las descargas interrumpidas se reanudan con peticiones Range
+    sobre el archivo parcial (`.part`), y cada PDF se valida antes de darlo por bueno.
+
+    Cada `.part` va con un archivo `.part.json` que guarda la URL y el validador
+    (ETag o Last-Modified) de la respuesta que lo originó. Solo se reanuda con
+    If-Range sobre ese mismo recurso; en cualquier otro caso (otra URL, sin
+    validador, 416 o un Content-Range que no empieza donde se pidió) el parcial se
+    descarta y se descarga desde cero, para no pegar bytes de otro PDF.
+    """
+
+    def __init__(self, driver, max_concurrentes=3, max_pendientes=10,
+                 tamano_bloque=256 * 1024, reintentos=3, timeout=30):
+        self.driver = driver
+        self.tamano_bloque = tamano_bloque
+        self.reintentos = reintentos
+        self.timeout = timeout
+
+        self.sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrentes)
+        self.sesion.mount("https://", adaptador)
+        self.sesion.mount("http://", adaptador)
+        self.sesion.headers["User-Agent"] = driver.execute_script("return navigator.userAgent;")
+
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrentes, thread_name_prefix="descarga-pdf")
+        self._cupos = threading.BoundedSemaphore(max_pendientes)
+        self._futuros = []
+
+    def copiar_cookies(self):
+        """
+        Copia las cookies del navegador a un jar propio de cada descarga (desde el
+        hilo del driver), sin tocar la sesión que comparten los hilos de descarga.
+        """
+        cookies = requests.cookies.RequestsCookieJar()
+        for ck in self.driver.get_cookies():
+            cookies.set(ck["name"], ck["value"], domain=ck.get("domain", ""), path=ck.get("path", "/"))
+        return cookies
+
+    def encolar(self, url, ruta):
+        """
+        Agrega una descarga a la cola y retorna su Future (resultado: ruta del PDF).
+
+        Se debe llamar desde el hilo que maneja el driver, porque refresca las cookies.
+        """
+        cookies = self.copiar_cookies()
+        self._descartar_parcial_ajeno(url, ruta + ".part")
+        self._cupos.acquire()
+        futuro = self._pool.submit(self._descargar, url, ruta, cookies)
+        futuro.add_done_callback(lambda _: self._cupos.release())
+        self._futuros.append(futuro)
+        print(f"📥 Descarga en cola ({len(self.pendientes())} pendientes): {os.path.basename(ruta)}")
+        return futuro
+
+    @staticmethod
+    def _leer_origen(parcial):
+        """URL y validador con que se empezó a escribir `parcial`, o {} si no se sabe"""
+        try:
+            with open(parcial + ".json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _guardar_origen(parcial, url, resp):
+        validador = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+        with open(parcial + ".json", "w", encoding="utf-8") as f:
+            json.dump({"url": url, "validador": validador}, f)
+
+    @staticmethod
+    def _borrar_parcial(parcial):
+        for ruta in (parcial, parcial + ".json"):
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+
+    def _descartar_parcial_ajeno(self, url, parcial):
+        """Borra un `.part` viejo que no se sabe que venga de esta misma URL"""
+        if os.path.exists(parcial) and self._leer_origen(parcial).get("url") != url:
+            print(f"🗑️ Parcial ajeno descartado: {os.path.basename(parcial)}")
+            self._borrar_parcial(parcial)
+
+    def pendientes(self):
+        return [f for f in self._futuros if not f.done()]
+
+    def _descargar(self, url, ruta, cookies):
+        parcial = ruta + ".part"
+        inicio = time.monotonic()
+        ultimo_error = None
+
+        for intento in range(1, self.reintentos + 1):
+            try:
+                self._descargar_parcial(url, parcial, cookies)
+                if not verificar_pdf(parcial):
+                    # Contenido corrupto o truncado: la próxima vez se descarga desde cero
+                    self._borrar_parcial(parcial)
+                    raise ValueError("El archivo descargado no es un PDF completo")
+                os.replace(parcial, ruta)
+                self._borrar_parcial(parcial)
+                print(f"✅ PDF descargado: {ruta} ({os.path.getsize(ruta)/1024:.2f} KB "
+                      f"en {time.monotonic() - inicio:.1f}s)")
+                return ruta
+            except Exception as e:
+                ultimo_error = e
+                print(f"⚠️ Descarga de {os.path.basename(ruta)} falló (intento {intento}/{self.reintentos}): {str(e)}")
+                if intento < self.reintentos:
+                    time.sleep(min(2 ** intento, 10))
+
+        raise RuntimeError(f"No se pudo descargar {url}: {ultimo_error}")
+
+    def _descargar_parcial(self, url, parcial, cookies):
+        """
+        Descarga `parcial`, o lo reanuda con Range + If-Range si ya tiene bytes de
+        esta misma URL y se conoce el validador de la respuesta original
+        """
+        origen = self._leer_origen(parcial)
+        ya_descargado = os.path.getsize(parcial) if os.path.exists(parcial) else 0
+        if ya_descargado and (origen.get("url") != url or not origen.get("validador")):
+            # Sin forma de comprobar que el servidor entregue el mismo archivo
+            self._borrar_parcial(parcial)
+            ya_descargado = 0
+        cabeceras = {}
+        if ya_descargado:
+            cabeceras = {"Range": f"bytes={ya_descargado}-", "If-Range": origen["validador"]}
+
+        with self.sesion.get(url, stream=True, timeout=self.timeout, headers=cabeceras, cookies=cookies) as resp:
+            if resp.status_code == 416 or (resp.status_code == 206 and not self._rango_desde(resp, ya_descargado)):
+                self._borrar_parcial(parcial)
+                if not ya_descargado:
+                    raise ValueError(f"Respuesta HTTP {resp.status_code} inesperada sin pedir un rango")
+                # El recurso cambió o el servidor no respetó el rango: se empieza de nuevo
+                print(f"🔄 Parcial inválido para {os.path.basename(parcial)} "
+                      f"(HTTP {resp.status_code}), descargando desde cero")
+                resp.close()
+                return self._descargar_parcial(url, parcial, cookies)
+            resp.raise_for_status()
+
+            if resp.status_code == 206:
+                modo = "ab"
+            else:
+                # 200: el servidor ignoró el Range o el If-Range no coincidió (archivo completo)
+                modo = "wb"
+                self._guardar_origen(parcial, url, resp)
+            with open(parcial, modo) as f:
+                for bloque in resp.iter_content(self.tamano_bloque):
+                    f.write(bloque)
+
+    @staticmethod
+    def _rango_desde(resp, inicio):
+        """True si el Content-Range de un 206 empieza exactamente en `inicio`"""
+        coincidencia = _RE_CONTENT_RANGE.match(resp.headers.get("Content-Range", "").strip())
+        return inicio > 0 and coincidencia is not None and int(coincidencia.group(1)) == inicio
+
+    def esperar_todas(self):
+        """Espera las descargas encoladas; retorna las rutas exitosas en orden de encolado"""
+        rutas = []
+        for futuro in self._futuros:
+            try:
+                rutas.append(futuro.result())
+            except Exception as e:
+                print(f"❌ Error en descarga: {str(e)}")
+        self._futuros = []
+        return rutas
+
+    def cerrar(self):
+        self._pool.shutdown(wait=True)
+        self.sesion.close()
@@ -0,0 +1,184 @@
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import Future
+
+
+class EscuchaCDP:
+    """
+    Escucha los eventos de red de una pestaña de Chrome directamente por el
+    websocket de DevTools (CDP), en un hilo aparte, sin pasar por los logs
+    de rendimiento de Selenium.
+
+    Lleva la cuenta de las peticiones en curso para poder esperar a que la
+    red quede inactiva, y resuelve futuros cuando llega una respuesta con
+    el tipo MIME esperado (ver esperar_respuesta).
+    """
+
+    # Peticiones que nunca terminan (long-polling, keep-alive) no deben
+    # bloquear la espera de inactividad indefinidamente
+    EDAD_MAXIMA_PETICION = 10
+
+    def __init__(self, driver):
+        self.driver = driver
+        self._ws = None
+        self._hilo = None
+        self._activo = False
+        self._lock = threading.Lock()
+        self._siguiente_id = 0
+        self._en_curso = {}
+        self._esperas_respuesta = []
+        self._ultima_actividad = time.monotonic()
+        self.ventana = None
+
+    def _debugger_address(self):
+        opciones = self.driver.capabilities.get("goog:chromeOptions", {})
+        direccion = opciones.get("debuggerAddress")
+        if not direccion:
+            raise RuntimeError("El driver no expone 'debuggerAddress' de Chrome")
+        return direccion
+
+    def _url_websocket(self, handle):
+        """Busca el websocket de DevTools de la pestaña asociada al handle de Selenium"""
+        direccion = self._debugger_address()
+        with urllib.request.urlopen(f"http://{direccion}/json", timeout=5) as resp:
+            objetivos = json.loads(resp.read().decode("utf-8"))
+
+        id_objetivo = handle.replace("CDwindow-", "").upper()
+        paginas = [o for o in objetivos if o.get("type") == "page"]
+        for objetivo in paginas:
+            if objetivo.get("id", "").upper() == id_objetivo:
+                return objetivo["webSocketDebuggerUrl"]
+        raise RuntimeError(f"No se encontró la pestaña {handle} en DevTools")
+
+    def iniciar(self, handle=None):
+        """Conecta con la pestaña indicada (o la actual) y habilita los eventos de red"""
+        import websocket  # websocket-client, solo se necesita si se usa la escucha
+
+        self.detener()
+        handle = handle or self.driver.current_window_handle
+        url = self._url_websocket(handle)
+
+        # suppress_origin evita el rechazo de Chrome >= 111 por cabecera Origin
+        self._ws = websocket.create_connection(url, timeout=5, suppress_origin=True)
+        self._ws.settimeout(0.5)
+        self.ventana = handle
+        with self._lock:
+            self._en_curso.clear()
+            self._ultima_actividad = time.monotonic()
+
+        self._activo = True
+        self._enviar("Network.enable", {})
+        self._hilo = threading.Thread(target=self._bucle, name="escucha-cdp", daemon=True)
+        self._hilo.start()
+        return self
+
+    def asegurar_ventana(self, handle):
+        """Reconecta la escucha si el driver cambió de pestaña"""
+        if not self._activo or handle != self.ventana:
+            self.iniciar(handle)
+
+    def detener(self):
+        self._activo = False
+        self._cancelar_esperas("La escucha CDP se detuvo")
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+        if self._hilo is not None and self._hilo is not threading.current_thread():
+            self._hilo.join(timeout=2)
+        self._ws = None
+        self._hilo = None
+
+    @property
+    def activo(self):
+        return self._activo
+
+    def _enviar(self, metodo, parametros):
+        with self._lock:
+            self._siguiente_id += 1
+            mensaje_id = self._siguiente_id
+        self._ws.send(json.dumps({"id": mensaje_id, "method": metodo, "params": parametros}))
+        return mensaje_id
+
+    def _bucle(self):
+        import websocket
+
+        while self._activo:
+            try:
+                crudo = self._ws.recv()
+            except websocket.WebSocketTimeoutException:
+                continue
+            except Exception:
+                # Pestaña cerrada o conexión perdida
+                self._activo = False
+                self._cancelar_esperas("Se perdió la conexión con la pestaña")
+                break
+
+            try:
+                mensaje = json.loads(crudo)
+            except (TypeError, ValueError):
+                continue
+
+            metodo = mensaje.get("method")
+            if metodo:
+                self._procesar_evento(metodo, mensaje.get("params", {}))
+
+    def _procesar_evento(self, metodo, params):
+        ahora = time.monotonic()
+        with self._lock:
+            if metodo == "Network.requestWillBeSent":
+                url = params.get("request", {}).get("url", "")
+                if not url.startswith("data:"):
+                    self._en_curso[params.get("requestId")] = ahora
+                self._ultima_actividad = ahora
+            elif metodo in ("Network.loadingFinished", "Network.loadingFailed"):
+                self._en_curso.pop(params.get("requestId"), None)
+                self._ultima_actividad = ahora
+            elif metodo == "Network.responseReceived" and self._esperas_respuesta:
+                respuesta = params.get("response", {})
+                pendientes = []
+                for mime_type, futuro in self._esperas_respuesta:
+                    if respuesta.get("mimeType") == mime_type and not futuro.done():
+                        futuro.set_result(respuesta)
+                    elif not futuro.done():
+                        pendientes.append((mime_type, futuro))
+                self._esperas_respuesta = pendientes
+
+    def esperar_respuesta(self, mime_type):
+        """
+        Future que se resuelve con la primera respuesta (dict `response` de
+        Network.responseReceived) cuyo mimeType coincida.
+
+        Debe registrarse antes de la acción que dispara la petición.
+        """
+        if not self._activo:
+            raise RuntimeError("La escucha CDP no está activa")
+        futuro = Future()
+        with self._lock:
+            self._esperas_respuesta.append((mime_type, futuro))
+        return futuro
+
+    def _cancelar_esperas(self, motivo):
+        with self._lock:
+            pendientes, self._esperas_respuesta = self._esperas_respuesta, []
+        for _, futuro in pendientes:
+            if not futuro.done():
+                futuro.set_exception(RuntimeError(motivo))
+
+    def peticiones_en_curso(self):
+        """Número de peticiones abiertas, ignorando las que llevan demasiado tiempo colgadas"""
+        limite = time.monotonic() - self.EDAD_MAXIMA_PETICION
+        with self._lock:
+            return sum(1 for inicio in self._en_curso.values() if inicio >= limite)
+
+    def inactiva(self, ventana_inactividad=0.5):
+        """True si no hay peticiones en curso y no hubo tráfico en la ventana indicada"""
+        with self._lock:
+            ultima = self._ultima_actividad
+        return (
+            self.peticiones_en_curso() == 0
+            and time.monotonic() - ultima >= ventana_inactividad
+        )
@@ -0,0 +1,177 @@
+import time
+
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+# Tiempo máximo (segundos) por paso del flujo; "default" aplica a pasos no listados
+TIEMPOS_ESPERA = {
+    "default": 10,
+    "login": 20,
+    "menu": 10,
+    "listado": 20,
+    "seleccion_paciente": 15,
+    "panel_historico": 15,
+    "visor": 30,
+    "reporte": 30,
+    "cierre_visor": 10,
+    "regreso_listado": 20,
+}
+
+# Overlays de carga o de diálogos modales que bloquean los clics
+SELECTOR_OVERLAYS = "div.ui-widget-overlay, div.modal-backdrop, div.blockUI.blockOverlay"
+
+_JS_DOM_LISTO = """
+return document.readyState === 'complete'
+    && (typeof window.jQuery === 'undefined' || window.jQuery.active === 0);
+"""
+
+_JS_SIN_OVERLAYS = """
+var overlays = document.querySelectorAll(arguments[0]);
+for (var i = 0; i < overlays.length; i++) {
+    var estilo = window.getComputedStyle(overlays[i]);
+    var caja = overlays[i].getBoundingClientRect();
+    if (estilo.display !== 'none' && estilo.visibility !== 'hidden'
+        && caja.width > 0 && caja.height > 0) {
+        return false;
+    }
+}
+return true;
+"""
+
+_JS_ACTIVIDAD_RED = """
+return [
+    (typeof window.jQuery === 'undefined') ? 0 : window.jQuery.active,
+    window.performance.getEntriesByType('resource').length
+];
+"""
+
+
+class Esperas:
+    """
+    Esperas por condición para reemplazar las pausas fijas con time.sleep.
+
+    Cada espera pertenece a un paso del flujo, que define su tiempo máximo
+    (ver TIEMPOS_ESPERA) y bajo el que se registra cuánto tardó realmente.
+    """
+
+    def __init__(self, driver, tiempos=None, escucha_red=None, intervalo=0.1):
+        self.driver = driver
+        self.tiempos = dict(TIEMPOS_ESPERA)
+        if tiempos:
+            self.tiempos.update(tiempos)
+        self.escucha_red = escucha_red
+        self.intervalo = intervalo
+        self.registro = []
+        # Callback opcional latido(paso) tras cada espera; lo usa el supervisor para detectar cuelgues
+        self.latido = None
+
+    def timeout(self, paso):
+        return self.tiempos.get(paso, self.tiempos["default"])
+
+    def _registrar(self, paso, condicion, segundos, ok):
+        self.registro.append({
+            "paso": paso,
+            "condicion": condicion,
+            "segundos": round(segundos, 3),
+            "ok": ok,
+        })
+        if self.latido is not None:
+            self.latido(paso)
+
+    def hasta(self, condicion, paso="default", descripcion="condicion"):
+        """Espera una condición de Selenium y registra el tiempo que tomó"""
+        inicio = time.monotonic()
+        try:
+            resultado = WebDriverWait(
+                self.driver, self.timeout(paso), poll_frequency=self.intervalo
+            ).until(condicion)
+        except TimeoutException:
+            self._registrar(paso, descripcion, time.monotonic() - inicio, False)
+            raise
+        self._registrar(paso, descripcion, time.monotonic() - inicio, True)
+        return resultado
+
+    def presente(self, localizador, paso="default"):
+        return self.hasta(EC.presence_of_element_located(localizador), paso, f"presente {localizador[1]}")
+
+    def clickeable(self, localizador, paso="default"):
+        return self.hasta(EC.element_to_be_clickable(localizador), paso, f"clickeable {localizador[1]}")
+
+    def invisible(self, localizador, paso="default"):
+        return self.hasta(EC.invisibility_of_element_located(localizador), paso, f"invisible {localizador[1]}")
+
+    def dom_listo(self, paso="default"):
+        """Documento cargado y sin peticiones AJAX de jQuery pendientes"""
+        return self.hasta(lambda d: d.execute_script(_JS_DOM_LISTO), paso, "dom_listo")
+
+    def sin_overlays(self, paso="default", selector=SELECTOR_OVERLAYS, obligatoria=False):
+        """
+        Ningún overlay visible bloqueando la interfaz.
+
+        Si no es obligatoria y vence el plazo, devuelve False en lugar de lanzar TimeoutException.
+        """
+        return self._esperar(
+            lambda d: d.execute_script(_JS_SIN_OVERLAYS, selector), paso, "sin_overlays", obligatoria
+        )
+
+    def nueva_ventana(self, cantidad_previa, paso="default"):
+        return self.hasta(EC.number_of_windows_to_be(cantidad_previa + 1), paso, "nueva_ventana")
+
+    def red_inactiva(self, paso="default", ventana_inactividad=0.5, obligatoria=False):
+        """
+        Espera a que la red quede inactiva durante `ventana_inactividad` segundos.
+
+        Usa los eventos de CDP si hay una escucha activa sobre la pestaña actual;
+        si no, recurre a jQuery.active y al conteo de recursos cargados.
+        Si no es obligatoria y vence el plazo, devuelve False y el flujo continúa.
+        """
+        escucha = self.escucha_red
+        if escucha is not None and escucha.activo and escucha.ventana == self.driver.current_window_handle:
+            return self._esperar(
+                lambda d: escucha.inactiva(ventana_inactividad), paso, "red_inactiva_cdp", obligatoria
+            )
+
+        estado = {"firma": None, "desde": time.monotonic()}
+
+        def _sin_trafico(driver):
+            pendientes, recursos = driver.execute_script(_JS_ACTIVIDAD_RED)
+            ahora = time.monotonic()
+            if pendientes or recursos != estado["firma"]:
+                estado["firma"] = recursos
+                estado["desde"] = ahora
+                return False
+            return ahora - estado["desde"] >= ventana_inactividad
+
+        return self._esperar(_sin_trafico, paso, "red_inactiva_js", obligatoria)
+
+    def _esperar(self, condicion, paso, descripcion, obligatoria):
+        try:
+            self.hasta(condicion, paso, descripcion)
+            return True
+        except TimeoutException:
+            if obligatoria:
+                raise
+            print(f"⚠️ Tiempo de espera agotado en '{paso}' ({descripcion}), se continúa")
+            return False
+
+    def resumen(self):
+        """Agrega el registro por paso: número de esperas, total, máximo y fallos"""
+        resumen = {}
+        for entrada in self.registro:
+            datos = resumen.setdefault(entrada["paso"], {"esperas": 0, "total": 0.0, "maximo": 0.0, "timeouts": 0})
+            datos["esperas"] += 1
+            datos["total"] += entrada["segundos"]
+            datos["maximo"] = max(datos["maximo"], entrada["segundos"])
+            if not entrada["ok"]:
+                datos["timeouts"] += 1
+        return resumen
+
+    def imprimir_resumen(self):
+        resumen = self.resumen()
+        if not resumen:
+            return
+        print(f"\n⏱️ TIEMPOS DE ESPERA POR PASO")
+        for paso, datos in sorted(resumen.items(), key=lambda x: -x[1]["total"]):
+            print(f"  {paso:<20} {datos['esperas']:>4} esperas  total {datos['total']:7.2f}s  "
+                  f"máx {datos['maximo']:6.2f}s  timeouts {datos['timeouts']}")
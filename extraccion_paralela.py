@@ -0,0 +1,210 @@
+"""
+Extracción del texto de PDFs en un pool de procesos, para lotes de miles de
+historias donde la extracción (CPU) es el cuello de botella.
+
+    from extraccion_paralela import extraer_textos
+
+    for ruta, texto, paginas, tiempos in extraer_textos(rutas, workers=4):
+        ...
+
+Los resultados salen a medida que cada archivo termina (no en el orden de entrada)
+y la extracción sigue avanzando mientras quien consume hace otra cosa (p. ej. la
+llamada al LLM). Un PDF que pasa del tiempo máximo se descarta matando su proceso,
+que se reemplaza por uno nuevo; así un archivo patológico no frena el lote.
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import wait
+
+from extractores_pdf import obtener_backend
+from texto_pdf import texto_pdf
+
+# Procesos de extracción; 0 para usar todos los núcleos
+WORKERS_EXTRACCION = int(os.getenv("EXTRACCION_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# Segundos máximos por archivo; 0 para no limitar
+TIMEOUT_EXTRACCION = float(os.getenv("EXTRACCION_TIMEOUT", "120"))
+
+# Archivos que procesa un worker antes de reemplazarlo, para que no acumule memoria
+ARCHIVOS_POR_PROCESO = int(os.getenv("EXTRACCION_ARCHIVOS_POR_PROCESO", "500"))
+
+# Resultados listos que se guardan mientras quien consume está ocupado (por worker)
+RESULTADOS_EN_ESPERA = 4
+
+_FIN = object()
+
+
+def extraer_texto_pdf(ruta, separador="\n\n", normalizar=None, backend=None, max_caracteres=None):
+    """
+    Texto de un PDF con el backend indicado (por defecto EXTRACTOR_PDF), ver
+    texto_pdf. Retorna (texto, paginas, tiempos); tiempos["cache"] es True si no
+    hubo que leer el PDF.
+    """
+    inicio = time.perf_counter()
+    estadisticas = {}
+    texto, paginas = texto_pdf(ruta, separador, normalizar, max_caracteres, backend=backend,
+                               estadisticas=estadisticas)
+    tiempos = {"segundos": time.perf_counter() - inicio, "backend": obtener_backend(backend).nombre,
+               "cache": estadisticas["extraidas"] == 0}
+    return texto, paginas, tiempos
+
+
+def _bucle_worker(conexion, separador, normalizar, backend, max_caracteres):
+    """Proceso hijo: recibe rutas hasta recibir None y responde (ruta, texto, paginas, tiempos)"""
+    while True:
+        try:
+            ruta = conexion.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if ruta is None:
+            break
+        try:
+            texto, paginas, tiempos = extraer_texto_pdf(ruta, separador, normalizar, backend, max_caracteres)
+        except Exception as e:
+            texto, paginas, tiempos = "", 0, {"error": f"{type(e).__name__}: {str(e)[:200]}"}
+        tiempos["pid"] = os.getpid()
+        conexion.send((ruta, texto, paginas, tiempos))
+
+
+class _Worker:
+    """Un proceso de extracción con a lo sumo un archivo asignado"""
+
+    def __init__(self, contexto, opciones):
+        self.conexion, extremo_hijo = contexto.Pipe()
+        self.proceso = contexto.Process(target=_bucle_worker, args=(extremo_hijo,) + opciones, daemon=True)
+        self.proceso.start()
+        # Sin la copia del padre, la muerte del hijo se ve como EOF en la conexión
+        extremo_hijo.close()
+        self.ruta = None
+        self.inicio = None
+        self.archivos = 0
+
+    def asignar(self, ruta):
+        self.conexion.send(str(ruta))
+        self.ruta, self.inicio = ruta, time.monotonic()
+
+    def cerrar(self, forzar=False):
+        if not forzar:
+            try:
+                self.conexion.send(None)
+            except OSError:
+                forzar = True
+            else:
+                self.proceso.join(timeout=5)
+        if self.proceso.is_alive():
+            self.proceso.kill()
+            self.proceso.join()
+        self.conexion.close()
+
+
+def _entregar(cola, resultado, detener):
+    """Pone un resultado en la cola sin quedar bloqueado si quien consume se fue"""
+    while not detener.is_set():
+        try:
+            cola.put(resultado, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _despachar(rutas, workers, timeout, opciones, cola, detener):
+    """Hilo que reparte las rutas entre los procesos y recoge los resultados"""
+    contexto = multiprocessing.get_context()
+    activos = []
+    quedan = True
+    try:
+        while not detener.is_set():
+            # Un archivo por worker libre; los procesos se crean a medida que hay trabajo
+            libres = [w for w in activos if w.ruta is None]
+            while quedan and (libres or len(activos) < workers):
+                ruta = next(rutas, None)
+                if ruta is None:
+                    quedan = False
+                    break
+                if libres:
+                    worker = libres.pop()
+                else:
+                    worker = _Worker(contexto, opciones)
+                    activos.append(worker)
+                worker.asignar(ruta)
+
+            ocupados = [w for w in activos if w.ruta is not None]
+            if not ocupados:
+                break
+
+            espera = None
+            if timeout:
+                espera = max(0.0, min(w.inicio for w in ocupados) + timeout - time.monotonic())
+            listos = wait([w.conexion for w in ocupados], timeout=espera)
+
+            for worker in ocupados:
+                if worker.conexion in listos:
+                    try:
+                        resultado = worker.conexion.recv()
+                    except (EOFError, OSError):
+                        # El proceso murió a mitad del archivo (memoria, fallo de la librería...)
+                        print(f"❌ El proceso de extracción murió con {worker.ruta}")
+                        resultado = (worker.ruta, "", 0, {"error": "proceso terminado"})
+                        worker.archivos = ARCHIVOS_POR_PROCESO
+                    resultado = (worker.ruta,) + tuple(resultado[1:])
+                    worker.ruta = None
+                    worker.archivos += 1
+                    if worker.archivos >= ARCHIVOS_POR_PROCESO:
+                        activos.remove(worker)
+                        worker.cerrar(forzar=not worker.proceso.is_alive())
+                    if "error" in resultado[3]:
+                        print(f"❌ Error extrayendo texto de {resultado[0]}: {resultado[3]['error']}")
+                    if not _entregar(cola, resultado, detener):
+                        return
+                elif timeout and time.monotonic() - worker.inicio > timeout and not worker.conexion.poll():
+                    print(f"⏱️ {worker.ruta} superó {timeout:.0f}s de extracción, se descarta")
+                    activos.remove(worker)
+                    worker.cerrar(forzar=True)
+                    resultado = (worker.ruta, "", 0, {"error": "timeout", "segundos": timeout})
+                    if not _entregar(cola, resultado, detener):
+                        return
+    except BaseException as e:
+        _entregar(cola, e, detener)
+    finally:
+        for worker in activos:
+            worker.cerrar(forzar=worker.ruta is not None)
+        _entregar(cola, _FIN, detener)
+
+
+def extraer_textos(rutas, workers=None, timeout=None, separador="\n\n", normalizar=None, backend=None,
+                   max_caracteres=None):
+    """
+    Genera (ruta, texto, paginas, tiempos) por cada PDF de `rutas`, en el orden en
+    que terminan, extraídos con `backend` (ver extractores_pdf). Si un archivo falla
+    o pasa de `timeout` segundos el texto es "" y `tiempos["error"]` dice por qué.
+    `normalizar` (una función de nivel de módulo, para poder enviarla a los
+    procesos) se aplica a cada página; con `max_caracteres` se dejan de leer
+    páginas al llegar a ese largo.
+    """
+    workers = max(1, workers or WORKERS_EXTRACCION)
+    # Se resuelve aquí: un backend inexistente falla antes de arrancar procesos y
+    # todos los workers usan el mismo aunque sea "auto"
+    backend = obtener_backend(backend).nombre
+    timeout = TIMEOUT_EXTRACCION if timeout is None else timeout
+    cola = queue.Queue(maxsize=workers * RESULTADOS_EN_ESPERA)
+    detener = threading.Event()
+    hilo = threading.Thread(target=_despachar, name="extraccion_pdf", daemon=True,
+                            args=(iter(rutas), workers, timeout, (separador, normalizar, backend, max_caracteres),
+                                  cola, detener))
+    hilo.start()
+    try:
+        while True:
+            resultado = cola.get()
+            if resultado is _FIN:
+                break
+            if isinstance(resultado, BaseException):
+                raise resultado
+            yield resultado
+    finally:
+        # Si quien consume corta antes, el hilo deja de repartir y cierra los procesos
+        detener.set()
+        hilo.join()
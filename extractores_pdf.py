@@ -0,0 +1,158 @@
+"""
+Backends intercambiables para extraer el texto de los PDFs:
+
+- pypdf2: el de siempre; lento y en los PDF impresos por Chrome parte palabras
+  ("C ONSULTA") y pega etiquetas con el valor siguiente.
+- pypdfium2: PDFium, el mismo motor de Chrome; mucho más rápido y respeta los
+  espacios del documento.
+- pdfminer: pdfminer.six; el más lento, pero agrupa el texto por bloques (una
+  etiqueta por línea).
+
+    from extractores_pdf import obtener_backend
+
+    backend = obtener_backend()          # EXTRACTOR_PDF, por defecto "auto"
+    for texto_pagina in backend.paginas(ruta):
+        ...
+
+Se elige por corrida con EXTRACTOR_PDF o con el parámetro de cada punto de
+entrada; "auto" usa el primero instalado de PREFERENCIA_AUTO.
+benchmark_extractores.py compara velocidad y qué tan bien sobreviven los campos clave.
+"""
+import os
+import sys
+
+# Backend de la corrida: pypdf2, pypdfium2, pdfminer o auto
+EXTRACTOR_PDF = os.getenv("EXTRACTOR_PDF", "auto").lower()
+
+# Orden en que "auto" busca un backend instalado
+PREFERENCIA_AUTO = ("pypdfium2", "pypdf2", "pdfminer")
+
+
+class BackendPDF:
+    """
+    Interfaz de un backend: `paginas(ruta, desde)` genera el texto de cada página en
+    orden, a partir de la página `desde` (0 es la primera) y sin leer las siguientes
+    hasta que se piden
+    """
+
+    nombre = None
+
+    def __init__(self):
+        # ImportError si la librería no está instalada
+        self.libreria = self._importar()
+
+    def _importar(self):
+        raise NotImplementedError
+
+    def _version_libreria(self):
+        return getattr(self.libreria, "__version__", "?")
+
+    @property
+    def version(self):
+        """Nombre y versión de la librería; cambia si el texto extraído puede cambiar"""
+        return f"{self.nombre}-{self._version_libreria()}"
+
+    def paginas(self, ruta, desde=0):
+        raise NotImplementedError
+
+    def texto(self, ruta, separador="\n\n"):
+        return separador.join(self.paginas(ruta))
+
+
+class BackendPyPDF2(BackendPDF):
+    nombre = "pypdf2"
+
+    def _importar(self):
+        import PyPDF2
+        return PyPDF2
+
+    def paginas(self, ruta, desde=0):
+        with open(ruta, "rb") as archivo:
+            lector = self.libreria.PdfReader(archivo)
+            for indice in range(desde, len(lector.pages)):
+                yield lector.pages[indice].extract_text() or ""
+
+
+class BackendPypdfium2(BackendPDF):
+    nombre = "pypdfium2"
+
+    def _importar(self):
+        import pypdfium2
+        return pypdfium2
+
+    def _version_libreria(self):
+        return str(self.libreria.version.PYPDFIUM_INFO)
+
+    def paginas(self, ruta, desde=0):
+        documento = self.libreria.PdfDocument(ruta)
+        try:
+            for indice in range(desde, len(documento)):
+                pagina = documento[indice]
+                texto_pagina = pagina.get_textpage()
+                try:
+                    texto = texto_pagina.get_text_range()
+                finally:
+                    texto_pagina.close()
+                    pagina.close()
+                # PDFium separa las líneas con \r\n
+                yield texto.replace("\r\n", "\n").replace("\r", "\n")
+        finally:
+            documento.close()
+
+
+class BackendPdfminer(BackendPDF):
+    nombre = "pdfminer"
+
+    def _importar(self):
+        import pdfminer
+        from pdfminer.high_level import extract_pages
+        from pdfminer.layout import LAParams, LTTextContainer
+        self._extraer_paginas, self._parametros, self._contenedor = extract_pages, LAParams, LTTextContainer
+        return pdfminer
+
+    def paginas(self, ruta, desde=0):
+        # Las páginas fuera de page_numbers no se interpretan
+        numeros = range(desde, sys.maxsize) if desde else None
+        for pagina in self._extraer_paginas(ruta, page_numbers=numeros, laparams=self._parametros()):
+            yield "".join(elemento.get_text() for elemento in pagina if isinstance(elemento, self._contenedor))
+
+
+BACKENDS = {
+    "pypdf2": BackendPyPDF2,
+    "pypdfium2": BackendPypdfium2,
+    "pdfminer": BackendPdfminer,
+}
+
+_instancias = {}
+
+
+def obtener_backend(nombre=None):
+    """
+    Backend por nombre (por defecto EXTRACTOR_PDF). Lanza ValueError si el nombre no
+    existe e ImportError si se pidió uno en particular y su librería no está instalada.
+    """
+    nombre = (nombre or EXTRACTOR_PDF).lower()
+    if nombre == "auto":
+        for candidato in PREFERENCIA_AUTO:
+            try:
+                return obtener_backend(candidato)
+            except ImportError:
+                continue
+        raise ImportError("No hay ninguna librería de PDF instalada (PyPDF2, pypdfium2 o pdfminer.six)")
+    if nombre not in BACKENDS:
+        raise ValueError(f"Backend de PDF desconocido: {nombre} (opciones: auto, {', '.join(BACKENDS)})")
+    if nombre not in _instancias:
+        _instancias[nombre] = BACKENDS[nombre]()
+    return _instancias[nombre]
+
+
+def backends_disponibles():
+    """Nombres de los backends cuya librería está instalada"""
+    disponibles = []
+    for nombre in BACKENDS:
+        try:
+            obtener_backend(nombre)
+            disponibles.append(nombre)
+        except ImportError:
+            pass
+    return disponibles
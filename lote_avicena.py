@@ -0,0 +1,198 @@
+"""
+Descarga por lotes de historias clínicas de Avicena a partir de un CSV de documentos.
+
+El CSV debe tener columnas `tipo` y `numero` (con o sin encabezado). `tipo` puede ser
+una sigla de TIPOS_IDENTIFICACION (CC) o directamente el valor numérico del select de
+Avicena; las filas con otra sigla se informan y se omiten. Con "-" se lee
+de la entrada estándar, así se puede alimentar desde otro proceso.
+
+    python lote_avicena.py documentos.csv --workers 3 --dir descargas_lote
+"""
+import argparse
+import csv
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from opciones_navegador import HEADLESS
+from supervisor import Supervisor, navegador_responde
+from web_avicena import AvicenaLogin
+
+load_dotenv()
+
+# Valores del select formPrerrequisitos:ctlTipoIdentificacion por sigla; para otros
+# tipos (TI, RC, CE...) usar en el CSV el valor de la opción tal cual aparece en Avicena
+TIPOS_IDENTIFICACION = {
+    "CC": "433",
+}
+
+# Documentos leídos por adelantado como máximo: el CSV puede tener miles de filas
+MAX_EN_COLA = 100
+
+_FIN = None
+
+
+def leer_documentos(origen):
+    """Genera (tipo, numero) desde un CSV o desde stdin ("-"), sin cargarlo entero"""
+    archivo = sys.stdin if origen == "-" else open(origen, newline="", encoding="utf-8-sig")
+    try:
+        for n, fila in enumerate(csv.reader(archivo), start=1):
+            if len(fila) < 2 or not fila[1].strip():
+                continue
+            tipo, numero = fila[0].strip(), fila[1].strip()
+            if tipo.lower() == "tipo":
+                continue  # encabezado
+            valor = TIPOS_IDENTIFICACION.get(tipo.upper(), tipo)
+            if not valor.isdigit():
+                # Una sigla sin valor conocido no existe en el select: se rechaza antes de abrir el navegador
+                print(f"❌ Fila {n}: tipo de identificación desconocido '{tipo}' ({numero}); use "
+                      f"{', '.join(TIPOS_IDENTIFICACION)} o el valor numérico del select de Avicena")
+                continue
+            yield valor, numero
+    finally:
+        if archivo is not sys.stdin:
+            archivo.close()
+
+
+class ReporteLote:
+    """CSV de resultados por documento, escrito a medida que cada worker termina uno"""
+
+    CAMPOS = ["tipo", "numero", "ok", "pdfs", "segundos", "tiempos", "worker", "error"]
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._candado = threading.Lock()
+        self.resultados = []
+        if not os.path.exists(ruta):
+            with open(ruta, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(self.CAMPOS)
+
+    def agregar(self, resultado):
+        fila = dict(resultado, pdfs=len(resultado["pdfs"]), tiempos=json.dumps(resultado["tiempos"]))
+        with self._candado:
+            self.resultados.append(resultado)
+            with open(self.ruta, "a", newline="", encoding="utf-8") as f:
+                csv.DictWriter(f, fieldnames=self.CAMPOS, extrasaction="ignore").writerow(fila)
+
+
+def _crear_avicena(worker_id, usuario, password, sucursal, download_dir, headless=HEADLESS):
+    """Navegador de Avicena precalentado y con la sesión iniciada, o None si falla el login"""
+    avicena = AvicenaLogin(download_dir=download_dir, ranura_sesion=worker_id, headless=headless)
+    avicena.precalentar()
+    if not avicena.iniciar_sesion(usuario, password, sucursal):
+        print(f"❌ Worker {worker_id}: falló el inicio de sesión")
+        avicena.cerrar()
+        return None
+    return avicena
+
+
+def _ejecutar_worker(worker_id, cola, usuario, password, sucursal, download_dir, reporte, headless=HEADLESS):
+    """
+    Procesa documentos de la cola hasta encontrar el fin. Un Supervisor recrea el
+    navegador (con la sesión guardada) si se cuelga y reintenta el documento en curso.
+    """
+    def procesar(avicena, documento):
+        tipo, numero = documento
+        resultado = avicena.procesar_documento(tipo, numero, os.path.join(download_dir, f"{tipo}_{numero}"))
+        if not resultado["ok"] and not navegador_responde(avicena.driver):
+            # Navegador caído: el supervisor lo recrea y reintenta el documento
+            raise RuntimeError(resultado["error"])
+        resultado["worker"] = worker_id
+        reporte.agregar(resultado)
+        return resultado
+
+    supervisor = Supervisor(
+        f"worker {worker_id}",
+        crear=lambda: _crear_avicena(worker_id, usuario, password, sucursal, download_dir, headless),
+        procesar=procesar,
+    )
+    procesados = supervisor.ejecutar(iter(cola.get, _FIN))
+    # Documentos tomados de la cola cuando el navegador ya no se pudo recrear: quedan en
+    # el reporte como fallidos en lugar de perderse; el resto de la cola sigue para los demás workers
+    for tipo, numero in supervisor.sin_procesar:
+        reporte.agregar({"tipo": tipo, "numero": numero, "ok": False, "pdfs": [], "segundos": 0.0, "tiempos": {},
+                         "worker": worker_id, "error": "navegador no disponible"})
+    return len(procesados)
+
+
+def _encolar(cola, elemento, futuros):
+    """Pone un elemento en la cola acotada; False si ya no queda ningún worker que la consuma"""
+    while not all(f.done() for f in futuros):
+        try:
+            cola.put(elemento, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def descargar_lote(origen, usuario, password, num_workers=2, download_dir="descargas_lote", sucursal="29374",
+                   headless=HEADLESS):
+    """
+    Reparte los documentos de `origen` entre `num_workers` navegadores, cada uno con
+    su propia sesión, y registra el resultado de cada documento en resultados_lote.csv.
+    """
+    os.makedirs(download_dir, exist_ok=True)
+    reporte = ReporteLote(os.path.join(download_dir, "resultados_lote.csv"))
+    cola = queue.Queue(maxsize=MAX_EN_COLA)
+    inicio = time.monotonic()
+
+    print(f"🚀 Lote Avicena con {num_workers} workers desde {origen}")
+    with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="avicena") as pool:
+        futuros = [
+            pool.submit(_ejecutar_worker, w, cola, usuario, password, sucursal, download_dir, reporte, headless)
+            for w in range(num_workers)
+        ]
+
+        encolados = 0
+        for documento in leer_documentos(origen):
+            if not _encolar(cola, documento, futuros):
+                print("❌ No quedan workers activos; se detiene la lectura de documentos")
+                break
+            encolados += 1
+
+        for _ in futuros:
+            _encolar(cola, _FIN, futuros)
+
+        for w, futuro in enumerate(futuros):
+            try:
+                print(f"✅ Worker {w}: {futuro.result()} documentos procesados")
+            except Exception as e:
+                print(f"❌ Worker {w} terminó con error: {str(e)}")
+
+    duracion = time.monotonic() - inicio
+    exitosos = [r for r in reporte.resultados if r["ok"]]
+    tiempos = sorted(r["segundos"] for r in reporte.resultados)
+    print(f"\n📊 RESUMEN LOTE: {len(exitosos)}/{encolados} documentos, "
+          f"{sum(len(r['pdfs']) for r in exitosos)} PDFs en {duracion:.1f}s")
+    if tiempos:
+        print(f"⏱️ Por documento: mediana {tiempos[len(tiempos) // 2]:.1f}s, máximo {tiempos[-1]:.1f}s")
+    print(f"📄 Detalle por documento: {reporte.ruta}")
+    return reporte.resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Descarga por lotes de historias clínicas de Avicena")
+    parser.add_argument("documentos", help="CSV con columnas tipo,numero ('-' para leer de stdin)")
+    parser.add_argument("--workers", "-w", type=int, default=2, help="Navegadores en paralelo")
+    parser.add_argument("--dir", "-d", default=os.path.join(os.getcwd(), "descargas_lote"),
+                        help="Directorio de descargas")
+    parser.add_argument("--sucursal", default="29374", help="Valor de la sucursal de ingreso")
+    parser.add_argument("--headless", action="store_true", default=HEADLESS,
+                        help="Chrome sin ventana y sin fuentes ni analítica (por defecto NAVEGADOR_HEADLESS)")
+    args = parser.parse_args()
+
+    USUARIO = os.environ.get("AVICENA_USUARIO")
+    PASSWORD = os.environ.get("AVICENA_PASSWORD")
+    if not (USUARIO and PASSWORD):
+        print("❌ Faltan AVICENA_USUARIO y AVICENA_PASSWORD en el .env")
+        exit(1)
+
+    descargar_lote(args.documentos, USUARIO, PASSWORD, num_workers=args.workers,
+                   download_dir=args.dir, sucursal=args.sucursal, headless=args.headless)
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Estados de un paciente en una corrida, en orden de avance
+ESTADOS = ["listado", "descargado", "convertido", "renderizado"]
+
+# Archivo que produce cada estado (campo del registro con su ruta y hash)
+_ARCHIVO_POR_ESTADO = {
+    "descargado": "ruta",
+    "convertido": "ruta_json",
+    "renderizado": "ruta_html",
+}
+
+NOMBRE_MANIFIESTO = "manifiesto.jsonl"
+
+# Un candado por archivo: los workers del pool escriben en el mismo manifiesto
+_candados = {}
+_candado_global = threading.Lock()
+
+
+def _candado(ruta):
+    with _candado_global:
+        return _candados.setdefault(os.path.abspath(ruta), threading.Lock())
+
+
+def hash_archivo(ruta, tamano_bloque=1024 * 1024):
+    """SHA-256 del archivo, leído por bloques"""
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(tamano_bloque), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+class Manifiesto:
+    """
+    Registro de avance de una corrida en un JSONL de solo agregado dentro del
+    directorio de salida. Cada línea es un evento {id_paciente, estado, ...};
+    el estado de un paciente es la combinación de sus eventos en orden.
+
+    Permite reanudar una corrida interrumpida sin repetir el trabajo hecho.
+    """
+
+    def __init__(self, directorio):
+        self.ruta = os.path.join(directorio, NOMBRE_MANIFIESTO)
+        self._candado = _candado(self.ruta)
+        self._pacientes = {}
+        self._cargar()
+
+    def _cargar(self):
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        evento = json.loads(linea)
+                    except ValueError:
+                        # Última línea cortada si el proceso murió escribiendo
+                        continue
+                    self._aplicar(evento)
+        except FileNotFoundError:
+            pass
+
+    def _aplicar(self, evento):
+        registro = self._pacientes.setdefault(evento["id_paciente"], {"estado": None})
+        registro.update({k: v for k, v in evento.items() if k not in ("estado", "ts")})
+        # Un estado posterior a "listado" manda aunque retroceda: volver a descargar
+        # invalida la conversión y el renderizado anteriores
+        if evento["estado"] != "listado" or registro["estado"] is None:
+            registro["estado"] = evento["estado"]
+
+    def registrar(self, id_paciente, estado, **datos):
+        """
+        Agrega un evento al manifiesto. Por cada archivo conocido del estado
+        (ruta, ruta_json, ruta_html) se guarda también su hash.
+        """
+        if not id_paciente or id_paciente == "Desconocido":
+            return
+        evento = {"ts": time.time(), "id_paciente": id_paciente, "estado": estado}
+        evento.update(datos)
+        campo = _ARCHIVO_POR_ESTADO.get(estado)
+        if campo and datos.get(campo) and os.path.exists(datos[campo]):
+            evento[f"hash_{campo}"] = hash_archivo(datos[campo])
+
+        linea = json.dumps(evento, ensure_ascii=False) + "\n"
+        with self._candado:
+            with open(self.ruta, "a", encoding="utf-8") as f:
+                f.write(linea)
+                f.flush()
+                os.fsync(f.fileno())
+            self._aplicar(evento)
+
+    def registro(self, id_paciente):
+        return self._pacientes.get(id_paciente)
+
+    def _archivo_integro(self, registro, estado):
+        campo = _ARCHIVO_POR_ESTADO[estado]
+        ruta = registro.get(campo)
+        if not ruta or not os.path.exists(ruta):
+            return False
+        esperado = registro.get(f"hash_{campo}")
+        return esperado is None or hash_archivo(ruta) == esperado
+
+    def completo(self, id_paciente, estado):
+        """
+        True si el paciente llegó al menos a `estado` y los archivos de ese estado
+        y de los anteriores siguen en disco sin cambios.
+        """
+        registro = self._pacientes.get(id_paciente)
+        if not registro or registro["estado"] is None:
+            return False
+        if ESTADOS.index(registro["estado"]) < ESTADOS.index(estado):
+            return False
+        return all(
+            self._archivo_integro(registro, e)
+            for e in ESTADOS[1:ESTADOS.index(estado) + 1]
+        )
+
+    def resumen(self):
+        """Cantidad de pacientes por estado alcanzado"""
+        conteo = {estado: 0 for estado in ESTADOS}
+        for registro in self._pacientes.values():
+            if registro["estado"]:
+                conteo[registro["estado"]] += 1
+        return conteo
@@ -0,0 +1,67 @@
+"""
+Modo de producción del navegador: Chrome headless y bloqueo por CDP
+(Network.setBlockedURLs) de los recursos que los flujos no necesitan, para
+bajar CPU y ancho de banda por worker.
+
+Solo se bloquean recursos secundarios (analítica, fuentes, multimedia y, donde
+no hacen falta, imágenes); nunca HTML, JS, CSS ni documentos, así los IDs del DOM
+y la disposición de la página no cambian. El bloqueo se aplica a la pestaña
+principal: la pestaña de impresión del reporte, el iframe del visor y el PDF no
+se ven afectados.
+"""
+import os
+
+# Chrome sin ventana; en un equipo con escritorio se puede desactivar para depurar
+HEADLESS = os.getenv("NAVEGADOR_HEADLESS", "0").lower() in ("1", "true", "si", "sí")
+
+# Bloquear recursos pesados; por defecto solo en headless (modo producción)
+_bloquear = os.getenv("BLOQUEAR_RECURSOS", "").lower()
+BLOQUEAR_RECURSOS = _bloquear in ("1", "true", "si", "sí") if _bloquear else None
+
+# Tamaño de la ventana virtual en headless: igual a una pantalla completa, así los
+# elementos que dependen del ancho (menús, tablas responsivas) se ven igual
+TAMANO_VENTANA = os.getenv("NAVEGADOR_TAMANO_VENTANA", "1920,1080")
+
+_ANALITICA = [
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*googlesyndication.com*",
+    "*facebook.net*", "*connect.facebook.*", "*hotjar.com*", "*clarity.ms*", "*newrelic.com*",
+    "*nr-data.net*", "*tawk.to*", "*zopim.com*",
+]
+_FUENTES = ["*.woff", "*.woff?*", "*.woff2", "*.woff2?*", "*.ttf", "*.ttf?*", "*.otf", "*.eot", "*.eot?*"]
+_MULTIMEDIA = ["*.mp4", "*.webm", "*.mp3", "*.ogg", "*.avi"]
+_IMAGENES = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico", "*.bmp"]
+
+# Patrones por sitio. Avicena conserva las imágenes (el captcha es un <img> que se
+# captura) y el extractor también (el respaldo del LLM es una captura de la página)
+BLOQUEOS_POR_SITIO = {
+    "medifolios": _ANALITICA + _FUENTES + _MULTIMEDIA + _IMAGENES,
+    "avicena": _ANALITICA + _FUENTES + _MULTIMEDIA,
+    "extractor": _ANALITICA + _FUENTES + _MULTIMEDIA,
+}
+
+
+def configurar_ventana(opciones, headless=HEADLESS):
+    """Ventana maximizada, o headless con el tamaño de una pantalla completa"""
+    if headless:
+        opciones.add_argument("--headless=new")
+        opciones.add_argument(f"--window-size={TAMANO_VENTANA}")
+    else:
+        opciones.add_argument("--start-maximized")
+    return opciones
+
+
+def bloquear_recursos(driver, sitio):
+    """
+    Aplica los bloqueos del sitio a la pestaña actual del driver. Llamarla de nuevo
+    al cambiar a una pestaña nueva que se quiera aligerar. Retorna True si se aplicó.
+    """
+    patrones = BLOQUEOS_POR_SITIO.get(sitio)
+    if not patrones:
+        return False
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patrones})
+        return True
+    except Exception as e:
+        print(f"⚠️ No se pudieron bloquear recursos en {sitio}: {str(e)[:100]}")
+        return False
@@ -7,14 +7,24 @@ import json
 import time
 import re
 from dotenv import load_dotenv
+from trazas import tramo
+from extraccion_paralela import extraer_textos
+from texto_pdf import texto_pdf
+from segmentacion import combinar_json, mapear_bloques, segmentar_texto
 
 load_dotenv()
 
+# Caracteres por llamada a OpenAI; una historia más larga se parte en bloques de atenciones (ver segmentacion)
+MAX_PDF_CHARS = 15000
+
 class PDFProcessor:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, extractor_pdf=None):
         # Inicializar cliente de OpenAI
         self.client = OpenAI(api_key=api_key or os.environ.get("OPENAI_API_KEY"))
         
+        # Librería de extracción de texto; None usa EXTRACTOR_PDF
+        self.extractor_pdf = extractor_pdf
+        
         # Crear directorios de salida si no existen
         os.makedirs("output", exist_ok=True)
         
@@ -24,27 +34,25 @@ class PDFProcessor:
                                                  "Diabetes", "PSA", "Presion_Arterial", 
                                                  "Diagnostico", "Tratamiento"])
     
-    def extract_text_from_pdf(self, pdf_path):
-        """Extrae el texto de un archivo PDF utilizando una librería de extracción"""
+    @tramo("pdf_processor.extraccion_texto")
+    def extract_text_from_pdf(self, pdf_path, max_chars=None):
+        """
+        Extrae el texto de un archivo PDF con el backend elegido (ver extractores_pdf), o desde la caché.
+        Con `max_chars` deja de leer páginas al llegar a ese largo.
+        """
         try:
-            # Importamos PyPDF2 aquí para no tener dependencia si no se usa
-            import PyPDF2
-            
-            text = ""
-            with open(pdf_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                for page_num in range(len(reader.pages)):
-                    text += reader.pages[page_num].extract_text() + "\n"
-            
+            text, _ = texto_pdf(pdf_path, separador="\n", max_caracteres=max_chars, backend=self.extractor_pdf)
             return text
         except Exception as e:
             print(f"Error extrayendo texto del PDF {pdf_path}: {str(e)}")
             return ""
     
-    def process_pdf_with_openai(self, pdf_path):
+    @tramo("pdf_processor.documento")
+    def process_pdf_with_openai(self, pdf_path, pdf_text=None):
         """Procesa un PDF con la API de OpenAI o4-mini para extraer información estructurada"""
-        # Extraer el texto del PDF
-        pdf_text = self.extract_text_from_pdf(pdf_path)
+        # Extraer el texto del PDF, salvo que ya venga extraído
+        if pdf_text is None:
+            pdf_text = self.extract_text_from_pdf(pdf_path)
         
         if not pdf_text.strip():
             print(f"⚠️ No se pudo extraer texto del PDF: {pdf_path}")
@@ -52,6 +60,17 @@ class PDFProcessor:
         
         print(f"🔍 Procesando PDF con OpenAI: {pdf_path}")
         
+        # Historias largas: una llamada por bloque de atenciones, con los datos del paciente en cada una
+        bloques = segmentar_texto(pdf_text).bloques(MAX_PDF_CHARS)
+        if len(bloques) > 1:
+            print(f"📑 {len(bloques)} bloques de hasta {MAX_PDF_CHARS} caracteres")
+        partes = mapear_bloques(lambda bloque: self._process_block_with_openai(bloque["texto"]), bloques)
+        if any(parte is None for parte in partes):
+            return None
+        return combinar_json(partes)
+    
+    def _process_block_with_openai(self, pdf_text):
+        """Envía un bloque de la historia a OpenAI y retorna el JSON con "paciente" y "consultas", o None"""
         # Definir el prompt para OpenAI
         prompt = f"""
         Extrae la siguiente información del texto de una historia clínica. La información debe estar en formato JSON con dos objetos: "paciente" y "consultas".
@@ -96,20 +115,21 @@ class PDFProcessor:
         
         Aquí está el texto de la historia clínica:
         
-        {pdf_text[:15000]}  # Limitamos a 15000 caracteres para no exceder límites de tokens
+        {pdf_text}
         """
         
         try:
             # Llamar a la API de OpenAI
-            response = self.client.chat.completions.create(
-                model="o4-mini",  # Usar o4-mini como especificaste
-                messages=[
-                    {"role": "system", "content": "Eres un asistente especializado en extraer información médica estructurada de historias clínicas."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.0,  # Usar temperatura baja para respuestas consistentes
-                response_format={"type": "json_object"}  # Forzar respuesta en JSON
-            )
+            with tramo("pdf_processor.llm"):
+                response = self.client.chat.completions.create(
+                    model="o4-mini",  # Usar o4-mini como especificaste
+                    messages=[
+                        {"role": "system", "content": "Eres un asistente especializado en extraer información médica estructurada de historias clínicas."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.0,  # Usar temperatura baja para respuestas consistentes
+                    response_format={"type": "json_object"}  # Forzar respuesta en JSON
+                )
             
             # Extraer el contenido de la respuesta
             result = response.choices[0].message.content
@@ -169,8 +189,8 @@ class PDFProcessor:
         except Exception as e:
             print(f"❌ Error al añadir datos a los DataFrames: {str(e)}")
     
-    def process_directory(self, pdf_directory):
-        """Procesa todos los PDFs en un directorio"""
+    def process_directory(self, pdf_directory, workers=None):
+        """Procesa todos los PDFs en un directorio; el texto se extrae en paralelo con `workers` procesos"""
         pdf_files = [f for f in os.listdir(pdf_directory) if f.lower().endswith('.pdf')]
         
         if not pdf_files:
@@ -179,12 +199,14 @@ class PDFProcessor:
         
         print(f"🔍 Encontrados {len(pdf_files)} archivos PDF para procesar")
         
-        for pdf_file in pdf_files:
-            pdf_path = os.path.join(pdf_directory, pdf_file)
-            print(f"\n📄 Procesando: {pdf_file}")
+        pdf_paths = [os.path.join(pdf_directory, pdf_file) for pdf_file in pdf_files]
+        # Los PDFs llegan a medida que termina su extracción, no en el orden del directorio
+        for pdf_path, pdf_text, num_pages, timings in extraer_textos(pdf_paths, workers=workers, separador="\n",
+                                                                   backend=self.extractor_pdf):
+            print(f"\n📄 Procesando: {os.path.basename(pdf_path)} ({num_pages} páginas)")
             
             # Procesar el PDF con OpenAI
-            data = self.process_pdf_with_openai(pdf_path)
+            data = self.process_pdf_with_openai(pdf_path, pdf_text)
             
             # Añadir datos a los DataFrames
             self.add_to_dataframes(data)
@@ -192,6 +214,7 @@ class PDFProcessor:
             # Pequeña pausa para evitar límites de rate en la API
             time.sleep(1)
     
+    @tramo("pdf_processor.escritura_csv")
     def save_to_csv(self, output_dir="output"):
         """Guarda los DataFrames a archivos CSV"""
         os.makedirs(output_dir, exist_ok=True)
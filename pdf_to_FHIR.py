@@ -6,12 +6,17 @@ import pandas as pd
 from pathlib import Path
 import base64
 import re
-from PyPDF2 import PdfReader
+from extraccion_paralela import extraer_textos
+from texto_pdf import texto_pdf
+from segmentacion import combinar_json, mapear_bloques, segmentar_texto
 
 # Configuración de OpenAI
 openai.api_key = os.getenv("OPENAI_API_KEY")  
 MODEL_NAME = "o4-mini"
 
+# Caracteres de historia por llamada; las historias más largas se parten por atenciones
+MAX_CARACTERES_BLOQUE = 3000
+
 # Ruta a la carpeta con historias clínicas
 HISTORIAS_DIR = Path(r"C:\Users\salos\Downloads\historia_clinica\descargas")
 
@@ -35,13 +40,12 @@ def clean_json(texto: str) -> str:
     return texto[start:end+1].strip()
 
 # Función para extraer y parsear información usando el modelo
-def procesar_historia(file_path: Path) -> dict:
-    # 1) Leer texto del PDF
-    reader = PdfReader(str(file_path))
-    full_text = []
-    for page in reader.pages:
-        full_text.append(page.extract_text() or "")
-    documento = "\n\n".join(full_text).strip()
+def procesar_historia(file_path: Path, documento: str = None) -> dict:
+    # 1) Leer texto del PDF, salvo que ya venga extraído
+    if documento is None:
+        # Backend de EXTRACTOR_PDF (pypdf2, pypdfium2, pdfminer o auto), o desde la caché;
+        # completo: PESO y TALLA se toman de la última atención
+        documento = texto_pdf(str(file_path))[0].strip()
 
     # 1) Capturar todos los valores de PESO (kgs) y quedarnos con el último
     pesos = re.findall(
@@ -59,7 +63,7 @@ def procesar_historia(file_path: Path) -> dict:
     )
     talla = float(tallas[-1]) if tallas else None
     
-    # 2) Construir prompt con el texto (posiblemente recortándolo si es muy largo)
+    # 2) Construir prompt (el texto va por bloques de atenciones, ver paso 3)
     system_prompt = """
     Te paso a continuación el texto de una historia clínica. Quiero que me devuelvas **solo** un objeto JSON con el estandar  HL7 FHIR (sin ningún texto adicional) con estas 6 claves de nivel superior:
     1. "Paciente": un objeto con:
@@ -104,10 +108,16 @@ def procesar_historia(file_path: Path) -> dict:
     devuélvelo **solo** como JSON con claves "
         "Paciente, Diagnosticos, Procedimientos, SignosVitales, Paraclinicos, Medicamentos"""
 
-    # 3) Llamada al modelo
+    # 3) Llamada al modelo: una por bloque de atenciones, con los datos del paciente en cada una
+    bloques = segmentar_texto(documento).bloques(MAX_CARACTERES_BLOQUE)
+    partes = mapear_bloques(lambda bloque: consultar_modelo(system_prompt, bloque["texto"]), bloques)
+    return combinar_json(partes)
+
+
+def consultar_modelo(system_prompt: str, texto: str) -> dict:
     user_prompt = f"""
     --- INICIO HISTORIA ---
-    {documento[:3000]}
+    {texto}
     --- FIN HISTORIA ---
     """
 
@@ -129,41 +139,52 @@ for pdf_file in HISTORIAS_DIR.glob("*.pdf"):
     print(data)'''
 
 
-html_jsones = ""
-for pdf_file in HISTORIAS_DIR.glob("*.pdf"):
-    data = procesar_historia(pdf_file)
-    json_formatted = json.dumps(data, indent=2, ensure_ascii=False)
-    html_jsones += f"<pre>{json_formatted}</pre>\n"
-    print(data)
-
-# Generar HTML con todas las tablas
-html = f"""
-<html>
-<head>
-  <meta charset="utf-8">
-  <title>Resumen Historias Clínicas</title>
-  <style>
-    body {{ font-family: Arial, sans-serif; }}
-    h2 {{ color: #333; }}
-    pre {{
-      background-color: #f9f9f9;
-      border: 1px solid #ccc;
-      padding: 10px;
-      overflow-x: auto;
-      white-space: pre-wrap;
-      word-wrap: break-word;
-    }}
-  </style>
-</head>
-<body>
-  <h1>Historias Clínicas en estándar HL7-FHIR</h1>
-  {html_jsones}
-</body>
-</html>
-"""
-
-output_path = Path(r"C:\Users\salos\Downloads\historia_clinica\descargas\output\html_historias_FHIR")
-with open(output_path, "w", encoding="utf-8") as f:
-    f.write(html)
-
-print(f"Archivo HTML generado en: {output_path.resolve()}")
\ No newline at end of file
+# Los procesos de extracción importan este módulo al arrancar (spawn en Windows):
+# el lote solo corre al ejecutar el script
+if __name__ == "__main__":
+    html_jsones = ""
+    # El texto se extrae en paralelo; los PDFs llegan a medida que terminan
+    for pdf_file, documento, _, tiempos in extraer_textos(HISTORIAS_DIR.glob("*.pdf")):
+        # Un PDF que falló o pasó del tiempo máximo se informa y se salta, sin frenar el lote
+        if "error" in tiempos:
+            print(f"❌ {pdf_file}: no se pudo extraer el texto ({tiempos['error']}), se omite")
+            continue
+        data = procesar_historia(pdf_file, documento.strip())
+        if data is None:
+            print(f"⚠️ {pdf_file}: sin texto para procesar, se omite")
+            continue
+        json_formatted = json.dumps(data, indent=2, ensure_ascii=False)
+        html_jsones += f"<pre>{json_formatted}</pre>\n"
+        print(data)
+
+    # Generar HTML con todas las tablas
+    html = f"""
+    <html>
+    <head>
+      <meta charset="utf-8">
+      <title>Resumen Historias Clínicas</title>
+      <style>
+        body {{ font-family: Arial, sans-serif; }}
+        h2 {{ color: #333; }}
+        pre {{
+          background-color: #f9f9f9;
+          border: 1px solid #ccc;
+          padding: 10px;
+          overflow-x: auto;
+          white-space: pre-wrap;
+          word-wrap: break-word;
+        }}
+      </style>
+    </head>
+    <body>
+      <h1>Historias Clínicas en estándar HL7-FHIR</h1>
+      {html_jsones}
+    </body>
+    </html>
+    """
+
+    output_path = Path(r"C:\Users\salos\Downloads\historia_clinica\descargas\output\html_historias_FHIR")
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(html)
+
+    print(f"Archivo HTML generado en: {output_path.resolve()}")
\ No newline at end of file
@@ -6,12 +6,17 @@ import pandas as pd
 from pathlib import Path
 import base64
 import re
-from PyPDF2 import PdfReader
+from extraccion_paralela import extraer_textos
+from texto_pdf import texto_pdf
+from segmentacion import combinar_json, mapear_bloques, segmentar_texto
 
 # Configuración de OpenAI
 openai.api_key = os.getenv("OPENAI_API_KEY")  
 MODEL_NAME = "o4-mini"
 
+# Caracteres de historia por llamada; las historias más largas se parten por atenciones
+MAX_CARACTERES_BLOQUE = 3000
+
 # Ruta a la carpeta con historias clínicas
 HISTORIAS_DIR = Path(r"D:\\Downloads\\historias_medifolios")
 
@@ -35,13 +40,12 @@ def clean_json(texto: str) -> str:
     return texto[start:end+1].strip()
 
 # Función para extraer y parsear información usando el modelo
-def procesar_historia(file_path: Path) -> dict:
-    # 1) Leer texto del PDF
-    reader = PdfReader(str(file_path))
-    full_text = []
-    for page in reader.pages:
-        full_text.append(page.extract_text() or "")
-    documento = "\n\n".join(full_text).strip()
+def procesar_historia(file_path: Path, documento: str = None) -> dict:
+    # 1) Leer texto del PDF, salvo que ya venga extraído
+    if documento is None:
+        # Backend de EXTRACTOR_PDF (pypdf2, pypdfium2, pdfminer o auto), o desde la caché;
+        # completo: PESO y TALLA se toman de la última atención
+        documento = texto_pdf(str(file_path))[0].strip()
 
     # 1) Capturar todos los valores de PESO (kgs) y quedarnos con el último
     pesos = re.findall(
@@ -59,7 +63,7 @@ def procesar_historia(file_path: Path) -> dict:
     )
     talla = float(tallas[-1]) if tallas else None
     
-    # 2) Construir prompt con el texto (posiblemente recortándolo si es muy largo)
+    # 2) Construir prompt (el texto va por bloques de atenciones, ver paso 3)
     system_prompt = """
     Te paso a continuación el texto de una historia clínica. Quiero que me devuelvas **solo** un objeto JSON (sin ningún texto adicional) con estas 6 claves de nivel superior:
     1. "Paciente": un objeto con:
@@ -104,10 +108,16 @@ def procesar_historia(file_path: Path) -> dict:
     devuélvelo **solo** como JSON con claves "
         "Paciente, Diagnosticos, Procedimientos, SignosVitales, Paraclinicos, Medicamentos"""
 
-    # 3) Llamada al modelo
+    # 3) Llamada al modelo: una por bloque de atenciones, con los datos del paciente en cada una
+    bloques = segmentar_texto(documento).bloques(MAX_CARACTERES_BLOQUE)
+    partes = mapear_bloques(lambda bloque: consultar_modelo(system_prompt, bloque["texto"]), bloques)
+    return combinar_json(partes), peso, talla
+
+
+def consultar_modelo(system_prompt: str, texto: str) -> dict:
     user_prompt = f"""
     --- INICIO HISTORIA ---
-    {documento[:3000]}
+    {texto}
     --- FIN HISTORIA ---
     """
 
@@ -120,170 +130,181 @@ def procesar_historia(file_path: Path) -> dict:
     )
     texto = respuesta.choices[0].message.content
     texto_json = clean_json(texto)
-    return json.loads(texto_json), peso, talla
-
-
-# Procesar todos los PDFs en la carpeta
-for pdf_file in HISTORIAS_DIR.glob("*.pdf"):
-    data, peso, talla = procesar_historia(pdf_file)
-    
-    # Paciente (incluye demográficos y antropometría)
-    p = data.get("Paciente", {})
-    pacientes.append({
-        "ID":               p.get("Identificacion")       or p.get("DocumentoIdentidad"),
-        "Nombre":           p.get("Nombre", "") + " " + p.get("Apellido", ""),
-        "Sexo":             p.get("Sexo"),
-        "FechaNacimiento":  p.get("FechaNacimiento"),
-        "Edad":             p.get("Edad"),
-        "Peso":             peso,
-        "Talla":            talla
-    })
+    return json.loads(texto_json)
+
+
+# Los procesos de extracción importan este módulo al arrancar (spawn en Windows):
+# el lote solo corre al ejecutar el script
+if __name__ == "__main__":
+    # Procesar todos los PDFs en la carpeta; el texto se extrae en paralelo y
+    # los PDFs llegan a medida que terminan
+    for pdf_file, documento, _, tiempos in extraer_textos(HISTORIAS_DIR.glob("*.pdf")):
+        # Un PDF que falló o pasó del tiempo máximo se informa y se salta, sin frenar el lote
+        if "error" in tiempos:
+            print(f"❌ {pdf_file}: no se pudo extraer el texto ({tiempos['error']}), se omite")
+            continue
+        data, peso, talla = procesar_historia(pdf_file, documento.strip())
+        if data is None:
+            print(f"⚠️ {pdf_file}: sin texto para procesar, se omite")
+            continue
     
-    # Diagnósticos
-    for d in data.get("Diagnosticos", []):
-        if isinstance(d, dict):
-            ID =       d.get("Identificacion")
-            codigo    = d.get("code")
-            diagnostico = d.get("display")
-            fecha     = d.get("onsetDateTime")
-        else:
-            # d es una cadena: la tomamos como diagnóstico libre
-            ID =         d.get("Identificacion")
-            codigo      = None
-            diagnostico = d
-            fecha       = None
-
-        diagnosticos.append({
-            "ID": ID,
-            "Código":    codigo,
-            "Diagnóstico": diagnostico,
-            "FechaAtencion":     fecha
+        # Paciente (incluye demográficos y antropometría)
+        p = data.get("Paciente", {})
+        pacientes.append({
+            "ID":               p.get("Identificacion")       or p.get("DocumentoIdentidad"),
+            "Nombre":           p.get("Nombre", "") + " " + p.get("Apellido", ""),
+            "Sexo":             p.get("Sexo"),
+            "FechaNacimiento":  p.get("FechaNacimiento"),
+            "Edad":             p.get("Edad"),
+            "Peso":             peso,
+            "Talla":            talla
         })
     
-    # Procedimientos
-    for proc in data.get("Procedimientos", []):
-        if isinstance(proc, dict):
-            ID            = proc.get("Identificacion")
-            codigo        = proc.get("code")
-            display       = proc.get("display")
-            fechaHora     = proc.get("performedDateTime")
-        else:
-            ID            = None
-            codigo        = None
-            display       = proc
-            fechaHora     = None
-
-        procedimientos.append({
-            "ID":            ID,
-            "Código":        codigo,
-            "Procedimiento": display,
-            "FechaHora":     fechaHora
-        })
-
-
-    # Signos Vitales
-    for sv in data.get("SignosVitales", []):
-        if isinstance(sv, dict):
-            ID          = sv.get("Identificacion")
-            row = {
+        # Diagnósticos
+        for d in data.get("Diagnosticos", []):
+            if isinstance(d, dict):
+                ID =       d.get("Identificacion")
+                codigo    = d.get("code")
+                diagnostico = d.get("display")
+                fecha     = d.get("onsetDateTime")
+            else:
+                # d es una cadena: la tomamos como diagnóstico libre
+                ID =         d.get("Identificacion")
+                codigo      = None
+                diagnostico = d
+                fecha       = None
+
+            diagnosticos.append({
+                "ID": ID,
+                "Código":    codigo,
+                "Diagnóstico": diagnostico,
+                "FechaAtencion":     fecha
+            })
+    
+        # Procedimientos
+        for proc in data.get("Procedimientos", []):
+            if isinstance(proc, dict):
+                ID            = proc.get("Identificacion")
+                codigo        = proc.get("code")
+                display       = proc.get("display")
+                fechaHora     = proc.get("performedDateTime")
+            else:
+                ID            = None
+                codigo        = None
+                display       = proc
+                fechaHora     = None
+
+            procedimientos.append({
                 "ID":            ID,
-                "FechaHora":     sv.get("effectiveDateTime")
-            }
-            for comp in sv.get("component", []):
-                medida = comp.get("code", {}).get("display",
-                        comp.get("code", {}).get("text", ""))
-                valor  = comp.get("valueQuantity", {}).get("value")
-                row[medida] = valor
-        else:
-            row = {
-                "ID":            None,
-                "FechaHora":     None,
-                "Observación":   sv
-            }
-        signos_vitales.append(row)
+                "Código":        codigo,
+                "Procedimiento": display,
+                "FechaHora":     fechaHora
+            })
+
+
+        # Signos Vitales
+        for sv in data.get("SignosVitales", []):
+            if isinstance(sv, dict):
+                ID          = sv.get("Identificacion")
+                row = {
+                    "ID":            ID,
+                    "FechaHora":     sv.get("effectiveDateTime")
+                }
+                for comp in sv.get("component", []):
+                    medida = comp.get("code", {}).get("display",
+                            comp.get("code", {}).get("text", ""))
+                    valor  = comp.get("valueQuantity", {}).get("value")
+                    row[medida] = valor
+            else:
+                row = {
+                    "ID":            None,
+                    "FechaHora":     None,
+                    "Observación":   sv
+                }
+            signos_vitales.append(row)
 
 
     
-    # Paraclínicos
-    for lab in data.get("Paraclinicos", []):
-        if isinstance(lab, dict):
-            ID        = lab.get("Identificacion")
-            fecha     = lab.get("effectiveDateTime")
-            prueba    = lab.get("code", {}).get("display")
-            resultado = lab.get("valueQuantity", {}).get("value")
-            unidad    = lab.get("valueQuantity", {}).get("unit")
-        else:
-            ID        = None
-            fecha     = None
-            prueba    = lab
-            resultado = None
-            unidad    = None
-
-        paraclinicos.append({
-            "ID":       ID,
-            "Fecha":    fecha,
-            "Prueba":   prueba,
-            "Resultado":resultado,
-            "Unidad":   unidad
-        })
+        # Paraclínicos
+        for lab in data.get("Paraclinicos", []):
+            if isinstance(lab, dict):
+                ID        = lab.get("Identificacion")
+                fecha     = lab.get("effectiveDateTime")
+                prueba    = lab.get("code", {}).get("display")
+                resultado = lab.get("valueQuantity", {}).get("value")
+                unidad    = lab.get("valueQuantity", {}).get("unit")
+            else:
+                ID        = None
+                fecha     = None
+                prueba    = lab
+                resultado = None
+                unidad    = None
+
+            paraclinicos.append({
+                "ID":       ID,
+                "Fecha":    fecha,
+                "Prueba":   prueba,
+                "Resultado":resultado,
+                "Unidad":   unidad
+            })
 
 
         
-    # Medicamentos
-    for med in data.get("Medicamentos", []):
-        if isinstance(med, dict):
-            ID      = med.get("Identificacion")
-            med_cc  = med.get("medicationCodeableConcept", {})
-            nombre  = med_cc.get("text") or med_cc.get("coding", [{}])[0].get("display")
-            inicio  = med.get("effectivePeriod", {}).get("start")
-        else:
-            ID      = None
-            nombre  = med
-            inicio  = None
-
-        medicamentos.append({
-            "ID":             ID,
-            "Medicamento":    nombre,
-            "Inicio":         inicio
-        })
-    print(pacientes)
-
-
-
-# Crear DataFrames
-df_pacientes = pd.DataFrame(pacientes)
-df_diagnosticos = pd.DataFrame(diagnosticos)
-df_procedimientos = pd.DataFrame(procedimientos)
-df_signos = pd.DataFrame(signos_vitales)
-df_paraclinicos = pd.DataFrame(paraclinicos)
-df_medicamentos = pd.DataFrame(medicamentos)
-
-
-# Generar HTML con todas las tablas
-html = f"""
-<html>
-<head>
-  <meta charset="utf-8">
-  <title>Resumen Historias Clínicas</title>
-  <style>
-    table {{ border-collapse: collapse; width: 100%; margin-bottom: 20px; }}
-    th, td {{ border: 1px solid #ddd; padding: 8px; }}
-    th {{ background-color: #f2f2f2; }}
-  </style>
-</head>
-<body>
-  <h1>Pacientes</h1> {df_pacientes.to_html(index=False, border=0)}
-  <h1>Diagnósticos</h1> {df_diagnosticos.to_html(index=False, border=0)}
-  <h1>Procedimientos</h1> {df_procedimientos.to_html(index=False, border=0)}
-  <h1>Signos Vitales</h1> {df_signos.to_html(index=False, border=0)}
-  <h1>Paraclínicos</h1> {df_paraclinicos.to_html(index=False, border=0)}
-  <h1>Medicamentos</h1> {df_medicamentos.to_html(index=False, border=0)}
-</body>
-</html>
-"""
-
-output_path = Path(r"D:\\Downloads\\historias_medifolios\\output\\html_historias")
-with open(output_path, "w", encoding="utf-8") as f:
-    f.write(html)
-
-print(f"Archivo HTML generado en: {output_path.resolve()}")
\ No newline at end of file
+        # Medicamentos
+        for med in data.get("Medicamentos", []):
+            if isinstance(med, dict):
+                ID      = med.get("Identificacion")
+                med_cc  = med.get("medicationCodeableConcept", {})
+                nombre  = med_cc.get("text") or med_cc.get("coding", [{}])[0].get("display")
+                inicio  = med.get("effectivePeriod", {}).get("start")
+            else:
+                ID      = None
+                nombre  = med
+                inicio  = None
+
+            medicamentos.append({
+                "ID":             ID,
+                "Medicamento":    nombre,
+                "Inicio":         inicio
+            })
+        print(pacientes)
+
+
+
+    # Crear DataFrames
+    df_pacientes = pd.DataFrame(pacientes)
+    df_diagnosticos = pd.DataFrame(diagnosticos)
+    df_procedimientos = pd.DataFrame(procedimientos)
+    df_signos = pd.DataFrame(signos_vitales)
+    df_paraclinicos = pd.DataFrame(paraclinicos)
+    df_medicamentos = pd.DataFrame(medicamentos)
+
+
+    # Generar HTML con todas las tablas
+    html = f"""
+    <html>
+    <head>
+      <meta charset="utf-8">
+      <title>Resumen Historias Clínicas</title>
+      <style>
+        table {{ border-collapse: collapse; width: 100%; margin-bottom: 20px; }}
+        th, td {{ border: 1px solid #ddd; padding: 8px; }}
+        th {{ background-color: #f2f2f2; }}
+      </style>
+    </head>
+    <body>
+      <h1>Pacientes</h1> {df_pacientes.to_html(index=False, border=0)}
+      <h1>Diagnósticos</h1> {df_diagnosticos.to_html(index=False, border=0)}
+      <h1>Procedimientos</h1> {df_procedimientos.to_html(index=False, border=0)}
+      <h1>Signos Vitales</h1> {df_signos.to_html(index=False, border=0)}
+      <h1>Paraclínicos</h1> {df_paraclinicos.to_html(index=False, border=0)}
+      <h1>Medicamentos</h1> {df_medicamentos.to_html(index=False, border=0)}
+    </body>
+    </html>
+    """
+
+    output_path = Path(r"D:\\Downloads\\historias_medifolios\\output\\html_historias")
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(html)
+
+    print(f"Archivo HTML generado en: {output_path.resolve()}")
\ No newline at end of file
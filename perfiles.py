@@ -0,0 +1,279 @@
+"""
+Perfiles de Chrome persistentes por sitio y worker (user-data-dir), para que cada
+arranque reutilice la caché HTTP con el JS, CSS y fuentes de Medifolios y Avicena
+en lugar de descargarlos otra vez con un perfil vacío.
+
+Un perfil solo puede usarlo un Chrome a la vez: se reserva con un archivo de bloqueo
+y, si está ocupado, el navegador arranca con un perfil temporal.
+
+Privacidad: la caché HTTP también guarda las respuestas de reportes y visores con
+datos de pacientes. Al liberar un perfil persistente se borra de la caché todo lo
+que no sea un recurso estático (ver EXTENSIONES_ESTATICAS); las cookies de sesión
+sí quedan en el perfil. Si Chrome muere sin liberar, la limpieza ocurre en el
+siguiente uso de la ranura. Con PERFILES_CHROME=0 no queda nada en disco.
+"""
+import json
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Carpeta con un perfil por sitio y ranura; contiene caché y cookies de sesión, no
+# versionar ni compartir (ver la nota de privacidad arriba)
+DIR_PERFILES = os.getenv(
+    "DIR_PERFILES", os.path.join(os.path.expanduser("~"), ".historia_clinica", "perfiles")
+)
+
+# Usar perfiles persistentes; con "0" cada navegador arranca con un perfil vacío
+USAR_PERFILES = os.getenv("PERFILES_CHROME", "1").lower() in ("1", "true", "si", "sí")
+
+# Tope de la caché en disco de cada perfil
+TAMANO_CACHE_MB = int(os.getenv("PERFILES_CACHE_MB", "500"))
+
+# Archivos que Chrome deja al morir (p. ej. matado por el supervisor) y bloquean el perfil
+_ARCHIVOS_SINGLETON = ("SingletonLock", "SingletonSocket", "SingletonCookie", "lockfile")
+
+ARCHIVO_BLOQUEO = ".en_uso"
+
+# Segundos en que un bloqueo recién creado y aún sin PID se considera ocupado
+_GRACIA_BLOQUEO = 10
+
+# Lo único que se conserva en la caché entre usos; reportes, visores y cualquier
+# otra respuesta (posibles datos de pacientes) se borran al liberar el perfil
+EXTENSIONES_ESTATICAS = (
+    ".js", ".css", ".woff", ".woff2", ".ttf", ".otf", ".eot",
+    ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".webp", ".map",
+)
+
+# Número mágico de la cabecera de las entradas de la caché "simple" de Chrome
+_MAGIA_CACHE_SIMPLE = 0xFCFB6D1BA7725C30
+
+_en_uso = set()
+_candado = threading.Lock()
+
+
+def _proceso_vivo(pid):
+    if psutil is not None:
+        return psutil.pid_exists(pid)
+    if os.name != "posix":
+        # Sin psutil en Windows no hay forma segura de comprobarlo: se asume vivo
+        return True
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _url_de_entrada(ruta):
+    """URL de una entrada de la caché simple de Chrome (archivo <hash>_0), o None"""
+    try:
+        with open(ruta, "rb") as f:
+            cabecera = f.read(24)
+            if len(cabecera) < 24:
+                return None
+            magia, _, largo = struct.unpack("<QII", cabecera[:16])
+            if magia != _MAGIA_CACHE_SIMPLE:
+                return None
+            clave = f.read(largo).decode("utf-8", "replace").split()
+    except OSError:
+        return None
+    # La clave puede traer prefijos de aislamiento ("1/0/_dk_https://sitio ... url")
+    return clave[-1] if clave else None
+
+
+def purgar_cache(directorio):
+    """
+    Borra de la caché HTTP del perfil todas las entradas que no son recursos
+    estáticos. Si la caché no tiene el formato simple (no se puede leer la URL
+    de cada entrada) se borra completa. Retorna el número de entradas borradas.
+    """
+    cache = os.path.join(directorio, "Default", "Cache", "Cache_Data")
+    try:
+        nombres = os.listdir(cache)
+    except OSError:
+        return 0
+    borrar = set()
+    for nombre in nombres:
+        if not nombre.endswith("_0"):
+            continue
+        url = _url_de_entrada(os.path.join(cache, nombre))
+        if url is None:
+            # Formato desconocido: no se puede separar lo estático de los reportes
+            shutil.rmtree(cache, ignore_errors=True)
+            return len(nombres)
+        if not urlparse(url).path.lower().endswith(EXTENSIONES_ESTATICAS):
+            borrar.add(nombre[:-2])
+    if not borrar and any(n.startswith("data_") for n in nombres):
+        # Caché "blockfile" (Chrome antiguo en Windows): tampoco se puede filtrar
+        shutil.rmtree(cache, ignore_errors=True)
+        return len(nombres)
+    for nombre in nombres:
+        if nombre.rsplit("_", 1)[0] in borrar:
+            try:
+                os.remove(os.path.join(cache, nombre))
+            except OSError:
+                pass
+    return len(borrar)
+
+
+def _marcar_salida_normal(directorio):
+    """Evita el aviso de "Chrome no se cerró correctamente" tras un cierre forzado"""
+    ruta = os.path.join(directorio, "Default", "Preferences")
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            preferencias = json.load(f)
+        perfil = preferencias.setdefault("profile", {})
+        if perfil.get("exit_type") == "Normal" and perfil.get("exited_cleanly", True):
+            return
+        perfil["exit_type"], perfil["exited_cleanly"] = "Normal", True
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(preferencias, f)
+    except (OSError, ValueError):
+        pass
+
+
+class PerfilChrome:
+    """
+    Perfil de Chrome reservado para un navegador. Con `persistente=False` (o si el
+    perfil de la ranura está en uso) es un directorio temporal que se borra al liberar.
+    """
+
+    def __init__(self, sitio, ranura=0, persistente=USAR_PERFILES, directorio=DIR_PERFILES):
+        self.sitio = sitio
+        self.ranura = ranura
+        self.directorio = None
+        self.persistente = False
+        if persistente:
+            self._reservar(os.path.join(directorio, f"{sitio}_{ranura}"))
+        if self.directorio is None:
+            self.directorio = tempfile.mkdtemp(prefix=f"chrome_{sitio}_")
+
+    def _reservar(self, directorio):
+        os.makedirs(directorio, exist_ok=True)
+        bloqueo = os.path.join(directorio, ARCHIVO_BLOQUEO)
+        with _candado:
+            if directorio in _en_uso:
+                print(f"⚠️ Perfil {os.path.basename(directorio)} en uso en este proceso, se usará uno temporal")
+                return
+            # O_EXCL hace la reserva atómica entre procesos; si el archivo ya existe
+            # solo se reclama cuando el proceso que lo creó ya no está vivo
+            for _ in range(2):
+                try:
+                    fd = os.open(bloqueo, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                except FileExistsError:
+                    pid = self._pid_bloqueo(bloqueo)
+                    if pid is None or (pid and pid != os.getpid() and _proceso_vivo(pid)):
+                        dueno = f"el proceso {pid}" if pid else "otro proceso"
+                        print(f"⚠️ Perfil {os.path.basename(directorio)} en uso por {dueno}, se usará uno temporal")
+                        return
+                    # Bloqueo huérfano (proceso muerto): se borra y se vuelve a intentar
+                    try:
+                        os.remove(bloqueo)
+                    except FileNotFoundError:
+                        pass
+                    continue
+                except OSError as e:
+                    print(f"⚠️ No se pudo reservar el perfil {os.path.basename(directorio)}: {str(e)}")
+                    return
+                with os.fdopen(fd, "w") as f:
+                    f.write(str(os.getpid()))
+                break
+            else:
+                print(f"⚠️ Perfil {os.path.basename(directorio)} en disputa, se usará uno temporal")
+                return
+            _en_uso.add(directorio)
+
+        # Nadie más usa el perfil: lo que haya dejado un Chrome anterior se puede limpiar,
+        # incluidas las respuestas en caché de un uso que no llegó a liberar
+        for nombre in _ARCHIVOS_SINGLETON:
+            try:
+                os.remove(os.path.join(directorio, nombre))
+            except OSError:
+                pass
+        purgar_cache(directorio)
+        _marcar_salida_normal(directorio)
+        self.directorio, self.persistente = directorio, True
+
+    @staticmethod
+    def _pid_bloqueo(bloqueo):
+        """
+        PID escrito en el bloqueo; 0 si el archivo está vacío o ilegible y es viejo
+        (huérfano), None si es reciente (el dueño aún no escribió su PID).
+        """
+        try:
+            with open(bloqueo, "r") as f:
+                return int(f.read().strip())
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError):
+            try:
+                edad = time.time() - os.path.getmtime(bloqueo)
+            except OSError:
+                return 0
+            return None if edad < _GRACIA_BLOQUEO else 0
+
+    def aplicar(self, opciones):
+        """Agrega a las opciones de Chrome el perfil y el tamaño de la caché"""
+        opciones.add_argument(f"--user-data-dir={self.directorio}")
+        opciones.add_argument(f"--disk-cache-size={TAMANO_CACHE_MB * 1024 * 1024}")
+        opciones.add_argument("--no-first-run")
+        opciones.add_argument("--no-default-browser-check")
+        opciones.add_argument("--hide-crash-restore-bubble")
+        return opciones
+
+    def liberar(self):
+        if self.directorio is None:
+            return
+        if self.persistente:
+            # Chrome ya está cerrado: se quitan de la caché los reportes con datos de pacientes
+            borradas = purgar_cache(self.directorio)
+            if borradas:
+                print(f"🧹 {borradas} respuestas no estáticas borradas de la caché del perfil")
+            with _candado:
+                _en_uso.discard(self.directorio)
+                try:
+                    os.remove(os.path.join(self.directorio, ARCHIVO_BLOQUEO))
+                except OSError:
+                    pass
+        else:
+            shutil.rmtree(self.directorio, ignore_errors=True)
+        self.directorio = None
+
+
+# Recursos de la página cargados y cuántos salieron de la caché (transferSize 0)
+_JS_RECURSOS_CACHE = """
+var recursos = window.performance.getEntriesByType('resource');
+var cache = 0;
+for (var i = 0; i < recursos.length; i++) {
+    if (recursos[i].transferSize === 0 && recursos[i].decodedBodySize > 0) { cache++; }
+}
+return [recursos.length, cache];
+"""
+
+
+def precalentar(driver, urls):
+    """
+    Carga el esqueleto de la aplicación (cada URL en orden) para dejar la caché,
+    las conexiones y el proceso de render listos antes de asignar trabajo.
+    Retorna los segundos que tomó; los fallos solo se informan.
+    """
+    inicio = time.monotonic()
+    for url in urls:
+        try:
+            driver.get(url)
+            total, cache = driver.execute_script(_JS_RECURSOS_CACHE)
+            print(f"🔥 Precalentado {url}: {cache}/{total} recursos desde caché")
+        except Exception as e:
+            print(f"⚠️ No se pudo precalentar {url}: {str(e)[:100]}")
+    return time.monotonic() - inicio
@@ -0,0 +1,136 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from supervisor import Supervisor
+from web_medifolios import HistoriasClinicasExtractor
+
+# Máximo de navegadores simultáneos contra Medifolios, para no saturar el servidor
+MAX_WORKERS_CORTESIA = int(os.getenv("MEDIFOLIOS_MAX_WORKERS", "4"))
+
+
+def calcular_workers(num_workers, num_pacientes, max_workers=MAX_WORKERS_CORTESIA):
+    """Número efectivo de workers: limitado por núcleos, pacientes y el tope de cortesía"""
+    nucleos = os.cpu_count() or 1
+    return max(1, min(num_workers, nucleos, max_workers, num_pacientes))
+
+
+def repartir_indices(num_pacientes, num_workers):
+    """
+    Reparte los índices del listado entre los workers de forma intercalada
+    (0, n, 2n... para el primero), así las historias largas quedan repartidas.
+    """
+    return [list(range(w, num_pacientes, num_workers)) for w in range(num_workers)]
+
+
+def _crear_extractor(worker_id, usuario, password, output_dir, opciones):
+    """Extractor precalentado, con la sesión iniciada y el listado abierto, o None si falla el login"""
+    extractor = HistoriasClinicasExtractor(output_dir=output_dir, **opciones)
+    extractor.precalentar()
+    if not extractor.login(usuario, password):
+        print(f"❌ Worker {worker_id}: falló el inicio de sesión")
+        extractor.cerrar()
+        return None
+    extractor.navegar_a_pacientes()
+    extractor.abrir_listado_pacientes()
+    extractor.en_listado = True
+    return extractor
+
+
+def _ejecutar_worker(worker_id, asignados, usuario, password, output_dir, opciones_extractor):
+    """
+    Abre su propio Chrome, inicia sesión y descarga los pacientes asignados:
+    entradas del índice de pacientes (se buscan por ID) o posiciones del listado.
+
+    Por ID cada paciente corre bajo un Supervisor: si Chrome se cuelga o se infla,
+    se mata, se recrea con la sesión guardada y el paciente se vuelve a intentar.
+
+    Retorna (resultados, asignados que no se llegaron a procesar porque no hubo navegador).
+    """
+    por_id = bool(asignados) and isinstance(asignados[0], dict)
+    etiquetas = [p["id"] for p in asignados] if por_id else asignados
+    print(f"🧵 Worker {worker_id}: {len(asignados)} pacientes asignados {etiquetas}")
+    inicio = time.monotonic()
+    # Cada worker guarda y reutiliza su propia sesión: no comparten estado en el servidor
+    opciones = dict(opciones_extractor or {}, ranura_sesion=worker_id)
+
+    if por_id:
+        supervisor = Supervisor(
+            f"worker {worker_id}",
+            crear=lambda: _crear_extractor(worker_id, usuario, password, output_dir, opciones),
+            procesar=lambda extractor, paciente: extractor.descargar_paciente(paciente),
+        )
+        resultados = supervisor.ejecutar(asignados)
+        print(f"✅ Worker {worker_id}: {len(resultados)}/{len(asignados)} historias en {time.monotonic() - inicio:.1f}s")
+        return resultados, supervisor.sin_procesar
+
+    extractor = HistoriasClinicasExtractor(output_dir=output_dir, **opciones)
+    try:
+        if not extractor.login(usuario, password):
+            print(f"❌ Worker {worker_id}: falló el inicio de sesión")
+            return [], list(asignados)
+        extractor.navegar_a_pacientes()
+        resultados = extractor.descargar_historias_clinicas(indices=asignados)
+        print(f"✅ Worker {worker_id}: {len(resultados)}/{len(asignados)} historias en {time.monotonic() - inicio:.1f}s")
+        return resultados, []
+    finally:
+        extractor.cerrar()
+
+
+def descargar_en_paralelo(usuario, password, num_pacientes, num_workers=2, output_dir="output",
+                          max_workers=MAX_WORKERS_CORTESIA, opciones_extractor=None, pacientes=None):
+    """
+    Descarga las historias de los primeros `num_pacientes` del listado con varios
+    navegadores en paralelo, cada uno con su propia sesión. `opciones_extractor` se pasa
+    al constructor de HistoriasClinicasExtractor de cada worker.
+
+    Con `pacientes` (índice de construir_indice_pacientes) los workers reciben entradas
+    del índice y las buscan por ID, sin depender de la página del listado en que estén.
+
+    Retorna la lista pdfs_info combinada, ordenada por posición en el listado.
+    """
+    if pacientes is not None:
+        num_pacientes = len(pacientes)
+    num_workers = calcular_workers(num_workers, num_pacientes, max_workers)
+    repartos = repartir_indices(num_pacientes, num_workers)
+    if pacientes is not None:
+        repartos = [[pacientes[i] for i in reparto] for reparto in repartos]
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"🚀 Descargando {num_pacientes} pacientes con {num_workers} workers")
+    inicio = time.monotonic()
+    pdfs_info = []
+    sin_procesar = []
+
+    with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="medifolios") as pool:
+        futuros = {
+            pool.submit(_ejecutar_worker, w, indices, usuario, password, output_dir, opciones_extractor): w
+            for w, indices in enumerate(repartos)
+        }
+        for futuro in as_completed(futuros):
+            worker_id = futuros[futuro]
+            try:
+                resultados, restantes = futuro.result()
+                pdfs_info.extend(resultados)
+                sin_procesar.extend(restantes)
+            except Exception as e:
+                print(f"❌ Worker {worker_id} terminó con error: {str(e)}")
+
+    if sin_procesar:
+        # Lo que quedó de workers sin navegador (login o Chrome fallido) se intenta una vez más en uno nuevo
+        print(f"🔁 {len(sin_procesar)} pacientes sin procesar por workers sin navegador; se reintentan")
+        try:
+            resultados, sin_procesar = _ejecutar_worker(num_workers, sin_procesar, usuario, password, output_dir,
+                                                        opciones_extractor)
+            pdfs_info.extend(resultados)
+        except Exception as e:
+            print(f"❌ Worker {num_workers} terminó con error: {str(e)}")
+        if sin_procesar:
+            etiquetas = [p["id"] if isinstance(p, dict) else p for p in sin_procesar]
+            print(f"❌ Pacientes sin descargar: {etiquetas}")
+
+    pdfs_info.sort(key=lambda info: info.get("indice") if info.get("indice") is not None else num_pacientes)
+    duracion = time.monotonic() - inicio
+    print(f"\n📊 RESUMEN PARALELO: {len(pdfs_info)}/{num_pacientes} historias en {duracion:.1f}s "
+          f"({len(pdfs_info) / duracion * 3600 if duracion else 0:.0f} pacientes/hora)")
+    return pdfs_info
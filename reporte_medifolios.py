@@ -0,0 +1,289 @@
+"""
+Lectura del reporte HTML de historias clínicas de Medifolios (el documento que
+carga iframe_visualizar_reporte_formato) en secciones estructuradas, sin pasar
+por PDF.
+
+El resultado se puede convertir a un texto compacto con las mismas etiquetas
+que usa el prompt FHIR (IDENTIFICACIÓN:, EDAD:, SEXO:, FECHA ATENCIÓN:, ...).
+"""
+import re
+from bs4 import BeautifulSoup
+
+# Elementos que cierran una línea de texto en el reporte
+_BLOQUES = ["p", "div", "tr", "li", "h1", "h2", "h3", "h4", "h5", "h6", "table", "section"]
+_CELDAS = ["td", "th"]
+
+RE_FECHA_ATENCION = re.compile(
+    r'FECHA\s+(?:DE\s+)?ATENCI[ÓO]N\s*:?\s*(\d{4}-\d{2}-\d{2}(?:\s+\d{1,2}:\d{2}(?::\d{2})?)?'
+    r'|\d{1,2}/\d{1,2}/\d{4}(?:\s+\d{1,2}:\d{2}(?::\d{2})?)?)',
+    re.IGNORECASE
+)
+
+# Candidatas a etiqueta: hasta 4 palabras en mayúscula justo antes de ":"
+RE_ETIQUETA = re.compile(r'((?:[A-ZÁÉÍÓÚÑ][A-ZÁÉÍÓÚÑ.()°/]*\s+){0,3}[A-ZÁÉÍÓÚÑ][A-ZÁÉÍÓÚÑ.()°/]*)\s*:\s*')
+
+CAMPOS_PACIENTE = {
+    "identificacion": re.compile(r'^IDENTIFICACI[ÓO]N$|^DOCUMENTO$', re.IGNORECASE),
+    "nombre": re.compile(r'^(NOMBRE|PACIENTE|NOMBRES? Y APELLIDOS)$', re.IGNORECASE),
+    "fecha_nacimiento": re.compile(r'^FECHA DE NACIMIENTO$', re.IGNORECASE),
+    "edad": re.compile(r'^EDAD$', re.IGNORECASE),
+    "sexo": re.compile(r'^(SEXO|G[ÉE]NERO)$', re.IGNORECASE),
+    "aseguradora": re.compile(r'^(ENTIDAD|EPS|ASEGURADORA)$', re.IGNORECASE),
+}
+
+SIGNOS_VITALES = {
+    "peso": re.compile(r'PESO\s*:?\s*([0-9]+(?:[.,][0-9]+)?)\s*(kgs?|kg)?', re.IGNORECASE),
+    "talla": re.compile(r'TALLA\s*:?\s*([0-9]+(?:[.,][0-9]+)?)\s*(cms?|cm|m)?', re.IGNORECASE),
+    "presion_arterial": re.compile(
+        r'(?:T\.?A\.?|TENSI[ÓO]N ARTERIAL|PRESI[ÓO]N ARTERIAL)\s*:?\s*(\d{2,3}\s*/\s*\d{2,3})\s*(mmHg)?', re.IGNORECASE),
+    "frecuencia_cardiaca": re.compile(
+        r'(?:F\.?C\.?|FRECUENCIA CARD[IÍ]ACA)\s*:?\s*(\d{2,3})\s*(lpm|x\'|por min)?', re.IGNORECASE),
+    "frecuencia_respiratoria": re.compile(
+        r'(?:F\.?R\.?|FRECUENCIA RESPIRATORIA)\s*:?\s*(\d{1,2})\s*(rpm|x\'|por min)?', re.IGNORECASE),
+    "temperatura": re.compile(r'(?:TEMPERATURA|T°)\s*:?\s*(\d{2}(?:[.,]\d)?)\s*(°C|C)?', re.IGNORECASE),
+    "saturacion": re.compile(r'(?:SATURACI[ÓO]N|SAT\s*O2|SPO2)\s*:?\s*(\d{2,3})\s*(%)?', re.IGNORECASE),
+    "imc": re.compile(r'IMC\s*:?\s*([0-9]+(?:[.,][0-9]+)?)', re.IGNORECASE),
+}
+
+RE_DIAGNOSTICO = re.compile(r'\b([A-Z]\d{2}[0-9X]?)\s*[-–:]\s*([A-ZÁÉÍÓÚÑ][^|\n]{3,})')
+
+# Encabezados de sección dentro de cada atención; el valor puede seguir en la misma
+# línea, con o sin ":" ("TRATAMIENTO ACETAMINOFEN 500 MG" cuando viene en otra celda)
+SECCIONES = {
+    "motivo": re.compile(r'^MOTIVO DE CONSULTA\b', re.IGNORECASE),
+    "enfermedad_actual": re.compile(r'^ENFERMEDAD ACTUAL\b', re.IGNORECASE),
+    "antecedentes": re.compile(r'^ANTECEDENTES\b', re.IGNORECASE),
+    "revision_sistemas": re.compile(r'^REVISI[ÓO]N POR SISTEMAS\b', re.IGNORECASE),
+    "examen_fisico": re.compile(r'^(EXAMEN F[IÍ]SICO|SIGNOS VITALES)\b', re.IGNORECASE),
+    "paraclinicos": re.compile(r'^(PARACL[IÍ]NICOS|RESULTADOS|LABORATORIOS?)\b', re.IGNORECASE),
+    "analisis": re.compile(r'^(AN[ÁA]LISIS|IMPRESI[ÓO]N DIAGN[ÓO]STICA)\b', re.IGNORECASE),
+    "diagnosticos": re.compile(r'^DIAGN[ÓO]STICOS?\b', re.IGNORECASE),
+    "plan": re.compile(r'^(PLAN|CONDUCTA|TRATAMIENTO|F[ÓO]RMULA|ORDENES|ÓRDENES|RECOMENDACIONES)\b', re.IGNORECASE),
+}
+
+
+def html_a_lineas(html):
+    """Convierte el HTML del reporte en líneas de texto normalizadas, una por bloque o fila"""
+    soup = BeautifulSoup(html, "html.parser")
+    for etiqueta in soup(["script", "style", "head", "noscript"]):
+        etiqueta.decompose()
+    for salto in soup.find_all("br"):
+        salto.replace_with("\n")
+    for celda in soup.find_all(_CELDAS):
+        celda.append(" ")
+    for bloque in soup.find_all(_BLOQUES):
+        bloque.append("\n")
+
+    lineas = []
+    for linea in soup.get_text().split("\n"):
+        linea = re.sub(r'\s+', ' ', linea).strip()
+        if linea and (not lineas or lineas[-1] != linea):
+            lineas.append(linea)
+    return lineas
+
+
+def _recortar_etiqueta(candidata):
+    """
+    'MASCULINO EDAD' -> 'EDAD': se queda con el sufijo que es una etiqueta conocida,
+    o con la última palabra si ninguno lo es (el resto pertenece al valor anterior).
+    """
+    palabras = candidata.split()
+    for n in range(len(palabras), 0, -1):
+        sufijo = " ".join(palabras[-n:])
+        if any(patron.match(sufijo) for patron in CAMPOS_PACIENTE.values()):
+            return sufijo
+    return palabras[-1]
+
+
+def _pares_etiqueta(linea):
+    """Separa 'EDAD: 64 Años SEXO: FEMENINO' en [('EDAD', '64 Años'), ('SEXO', 'FEMENINO')]"""
+    marcas = []
+    for marca in RE_ETIQUETA.finditer(linea):
+        etiqueta = _recortar_etiqueta(marca.group(1))
+        marcas.append((etiqueta, marca.end(1) - len(etiqueta), marca.end()))
+
+    pares = []
+    for i, (etiqueta, _, fin_etiqueta) in enumerate(marcas):
+        fin = marcas[i + 1][1] if i + 1 < len(marcas) else len(linea)
+        valor = linea[fin_etiqueta:fin].strip(" |;,")
+        pares.append((etiqueta, valor))
+    return pares
+
+
+def _extraer_paciente(lineas, otros=None):
+    """
+    Campos conocidos del paciente. Si se pasa `otros` (dict), ahí quedan los demás
+    pares etiqueta: valor (RH, TELÉFONO, ESTADO CIVIL...), para no perderlos.
+    """
+    paciente = {}
+    for linea in lineas:
+        for etiqueta, valor in _pares_etiqueta(linea):
+            conocido = False
+            for campo, patron in CAMPOS_PACIENTE.items():
+                if patron.match(etiqueta):
+                    conocido = True
+                    if campo not in paciente and valor:
+                        paciente[campo] = valor
+            if not conocido and valor and otros is not None:
+                otros.setdefault(etiqueta.upper(), valor)
+    return paciente
+
+
+def _extraer_signos(texto):
+    signos = {}
+    for nombre, patron in SIGNOS_VITALES.items():
+        coincidencias = patron.findall(texto)
+        if coincidencias:
+            valor, unidad = coincidencias[-1]
+            signos[nombre] = f"{valor.replace(',', '.')} {unidad}".strip()
+    return signos
+
+
+def _seccion_de(linea):
+    """(nombre de la sección, texto que sigue al encabezado en la línea) o (None, None)"""
+    for nombre, patron in SECCIONES.items():
+        encabezado = patron.match(linea)
+        if encabezado:
+            return nombre, linea[encabezado.end():].strip().lstrip(":").strip()
+    return None, None
+
+
+def _extraer_atencion(lineas):
+    """Estructura una atención: fecha, secciones, signos vitales, diagnósticos y plan"""
+    fecha = RE_FECHA_ATENCION.search(lineas[0])
+    atencion = {
+        "fecha": fecha.group(1) if fecha else None,
+        "secciones": {},
+        "signos_vitales": {},
+        "diagnosticos": [],
+    }
+
+    actual = "general"
+    # Lo que acompaña a la fecha en la primera línea (profesional, sede...) queda en "general"
+    resto_inicial = RE_FECHA_ATENCION.sub("", lineas[0]).strip(" |;,")
+    if resto_inicial:
+        atencion["secciones"]["general"] = [resto_inicial]
+
+    for linea in lineas[1:]:
+        seccion, resto = _seccion_de(linea)
+        if seccion:
+            actual = seccion
+            # El contenido puede venir en la misma línea del encabezado
+            if resto:
+                atencion["secciones"].setdefault(actual, []).append(resto)
+            continue
+        atencion["secciones"].setdefault(actual, []).append(linea)
+
+    texto = "\n".join(lineas)
+    atencion["signos_vitales"] = _extraer_signos(texto)
+
+    vistos = set()
+    for codigo, descripcion in RE_DIAGNOSTICO.findall(texto):
+        if codigo not in vistos:
+            vistos.add(codigo)
+            atencion["diagnosticos"].append({"codigo": codigo, "descripcion": descripcion.strip()})
+
+    atencion["secciones"] = {k: " ".join(v) for k, v in atencion["secciones"].items()}
+    return atencion
+
+
+def parsear_reporte_html(html):
+    """
+    Estructura el reporte en {'paciente': {...}, 'atenciones': [...]}.
+
+    Cada atención empieza en una línea con FECHA ATENCIÓN; lo anterior a la
+    primera atención es el encabezado del paciente.
+    """
+    lineas = html_a_lineas(html)
+    inicios = [i for i, linea in enumerate(lineas) if RE_FECHA_ATENCION.search(linea)]
+
+    encabezado = lineas[:inicios[0]] if inicios else lineas
+    otros = {}
+    paciente = _extraer_paciente(encabezado, otros)
+    if otros:
+        paciente["otros"] = otros
+    if inicios:
+        # Algunos reportes repiten los datos del paciente dentro de la atención
+        for campo, valor in _extraer_paciente(lineas[inicios[0]:]).items():
+            paciente.setdefault(campo, valor)
+
+    atenciones = []
+    for n, inicio in enumerate(inicios):
+        fin = inicios[n + 1] if n + 1 < len(inicios) else len(lineas)
+        atenciones.append(_extraer_atencion(lineas[inicio:fin]))
+
+    return {"paciente": paciente, "atenciones": atenciones, "lineas": len(lineas)}
+
+
+_ETIQUETAS_PACIENTE = {
+    "identificacion": "IDENTIFICACIÓN",
+    "nombre": "NOMBRE",
+    "fecha_nacimiento": "FECHA DE NACIMIENTO",
+    "edad": "EDAD",
+    "sexo": "SEXO",
+    "aseguradora": "ENTIDAD",
+}
+
+_ETIQUETAS_SECCION = {
+    "general": "DATOS",
+    "motivo": "MOTIVO DE CONSULTA",
+    "enfermedad_actual": "ENFERMEDAD ACTUAL",
+    "antecedentes": "ANTECEDENTES",
+    "revision_sistemas": "REVISIÓN POR SISTEMAS",
+    "examen_fisico": "EXAMEN FÍSICO",
+    "paraclinicos": "PARACLÍNICOS",
+    "analisis": "ANÁLISIS",
+    "plan": "PLAN",
+}
+
+
+def reporte_a_texto(estructura):
+    """Texto compacto para el LLM a partir de la estructura de parsear_reporte_html"""
+    partes = ["PACIENTE"]
+    for campo, etiqueta in _ETIQUETAS_PACIENTE.items():
+        valor = estructura["paciente"].get(campo)
+        if valor:
+            partes.append(f"{etiqueta}: {valor}")
+    # Los demás datos del encabezado (RH, TELÉFONO...) también llegan al LLM
+    for etiqueta, valor in estructura["paciente"].get("otros", {}).items():
+        partes.append(f"{etiqueta}: {valor}")
+
+    for n, atencion in enumerate(estructura["atenciones"], start=1):
+        partes.append("")
+        partes.append(f"ATENCIÓN {n} - FECHA ATENCIÓN: {atencion['fecha'] or 'sin fecha'}")
+        for clave, etiqueta in _ETIQUETAS_SECCION.items():
+            contenido = atencion["secciones"].get(clave)
+            if contenido:
+                partes.append(f"{etiqueta}: {contenido}")
+        # Secciones sin etiqueta propia: se envían con su nombre en lugar de perderse
+        for clave, contenido in atencion["secciones"].items():
+            if clave not in _ETIQUETAS_SECCION and clave != "diagnosticos" and contenido:
+                partes.append(f"{clave.replace('_', ' ').upper()}: {contenido}")
+        if atencion["signos_vitales"]:
+            signos = "; ".join(f"{k.replace('_', ' ').upper()} {v}" for k, v in atencion["signos_vitales"].items())
+            partes.append(f"SIGNOS VITALES: {signos}")
+        if atencion["diagnosticos"]:
+            diagnosticos = "; ".join(f"{d['codigo']} - {d['descripcion']}" for d in atencion["diagnosticos"])
+            partes.append(f"DIAGNÓSTICOS: {diagnosticos}")
+        if atencion["secciones"].get("diagnosticos"):
+            # El texto de la sección va siempre: puede traer diagnósticos sin código CIE-10 reconocible
+            etiqueta = "DIAGNÓSTICOS (TEXTO)" if atencion["diagnosticos"] else "DIAGNÓSTICOS"
+            partes.append(f"{etiqueta}: {atencion['secciones']['diagnosticos']}")
+
+    return "\n".join(partes)
+
+
+# Limpieza de cada página del PDF impreso, en orden: espacios normalizados y
+# "EDAD:"/"SEXO:" separados del valor para que los patrones los reconozcan
+REGLAS_PAGINA_PDF = (
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r'EDAD:(\d)', re.IGNORECASE), r'EDAD: \1'),
+    (re.compile(r'SEXO:([A-Za-z])', re.IGNORECASE), r'SEXO: \1'),
+)
+
+
+def normalizar_pagina_pdf(texto, reglas=REGLAS_PAGINA_PDF):
+    """Aplica las reglas (patrón compilado, reemplazo) a una página extraída del PDF"""
+    for patron, reemplazo in reglas:
+        texto = patron.sub(reemplazo, texto)
+    return texto
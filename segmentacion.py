@@ -0,0 +1,340 @@
+"""
+Segmentación de una historia clínica en atenciones, para procesarla por bloques
+en lugar de recortarla: el texto se parte en cada FECHA ATENCIÓN (o FECHA DE
+CONSULTA / INGRESO / EVOLUCIÓN) y se arma un encabezado con lo que hay antes de
+la primera atención y los datos de identificación del paciente.
+
+    from segmentacion import combinar_json, mapear_bloques, segmentar_historia
+
+    historia = segmentar_historia(paginas)
+    bloques = historia.bloques(max_caracteres=12000)
+    resultados = mapear_bloques(llamar_llm, bloques)
+    datos = combinar_json(resultados)
+
+Cada segmento trae sus desplazamientos en caracteres y en bytes (UTF-8) dentro
+del texto unido y las páginas que abarca; `indice()` los entrega como JSON. Los
+bloques juntan atenciones completas hasta el presupuesto y repiten el encabezado,
+así una historia larga cuesta llamadas proporcionales a su largo y no se pierde
+lo que antes quedaba después del recorte. Una atención que sola pasa del
+presupuesto se parte en trozos.
+
+    python segmentacion.py output/historia_paciente_0.pdf --max-caracteres 3000
+"""
+import argparse
+import bisect
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# Bloques de una misma historia que se procesan a la vez (llamadas al LLM en paralelo)
+WORKERS_BLOQUES = int(os.getenv("BLOQUES_WORKERS", "4"))
+
+# Un texto previo a la primera atención más largo que esto no es un encabezado:
+# se procesa una sola vez como un segmento más en lugar de repetirse en cada bloque
+MAX_CARACTERES_ENCABEZADO = 1500
+
+# Largo máximo de los datos de identificación que se copian al encabezado
+MAX_CARACTERES_IDENTIFICACION = 600
+
+# Inicio de una atención: la etiqueta de fecha seguida de la fecha
+RE_INICIO_ATENCION = re.compile(
+    r'FECHA\s+(?:DE\s+)?(?:ATENCI[ÓO]N|CONSULTA|INGRESO|EVOLUCI[ÓO]N)\s*:?\s*'
+    r'(\d{4}-\d{2}-\d{2}(?:\s+\d{1,2}:\d{2}(?::\d{2})?)?'
+    r'|\d{1,2}/\d{1,2}/\d{4}(?:\s+\d{1,2}:\d{2}(?::\d{2})?)?)',
+    re.IGNORECASE
+)
+
+# Título de la atención justo antes de la fecha ("EVOLUCIÓN CITAS DE CONTROL",
+# "HISTORIA CLINICA GENERAL", "ATENCIÓN 2 -"): pertenece a la atención que empieza
+_TITULOS_ATENCION = (
+    r'EVOLUCI[ÓO]N', r'HISTORIA\s+CL[ÍI]NICA', r'NOTA', r'EPICRISIS', r'CONSULTA', r'CONTROL',
+    r'URGENCIAS', r'INGRESO', r'ATENCI[ÓO]N\s+\d+\s*-',
+)
+RE_TITULO_ATENCION = re.compile(
+    r'(?:^|(?<=\s))(?:' + '|'.join(_TITULOS_ATENCION) + r')(?:[ \t]+[A-ZÁÉÍÓÚÜÑ]{2,}){0,4}\s*$'
+)
+
+# Los datos del paciente: desde el título o el nombre hasta la primera sección clínica
+RE_IDENTIFICACION = re.compile(r'DATOS\s+DE\s+IDENTIFICACI[ÓO]N|NOMBRE\s*:', re.IGNORECASE)
+RE_FIN_IDENTIFICACION = re.compile(
+    r'TIPO\s+DE\s+CONSULTA|MOTIVO\s+DE\s+CONSULTA|ENFERMEDAD\s+ACTUAL|\bEVOLUCI[ÓO]N\b', re.IGNORECASE
+)
+RE_PACIENTE_EN_TEXTO = re.compile(r'IDENTIFICACI[ÓO]N\s*:|NOMBRE\s*:', re.IGNORECASE)
+
+# Cuánto antes de la fecha se busca el título
+_VENTANA_TITULO = 80
+
+
+def _inicio_con_titulo(texto, posicion):
+    ventana = texto[max(0, posicion - _VENTANA_TITULO):posicion]
+    titulo = RE_TITULO_ATENCION.search(ventana)
+    return posicion - len(ventana) + titulo.start() if titulo else posicion
+
+
+def _inicios_atencion(texto):
+    """[(posición, fecha)] de cada atención; una fecha repetida seguida (encabezado de página) no abre otra"""
+    inicios = []
+    for coincidencia in RE_INICIO_ATENCION.finditer(texto):
+        fecha = re.sub(r'\s+', ' ', coincidencia.group(1))
+        if inicios and inicios[-1][1] == fecha:
+            continue
+        posicion = _inicio_con_titulo(texto, coincidencia.start())
+        if inicios and posicion < inicios[-1][0]:
+            posicion = coincidencia.start()
+        inicios.append((posicion, fecha))
+    return inicios
+
+
+def _identificacion(texto, inicio, fin):
+    """(inicio, fin) de los datos del paciente dentro de texto[inicio:fin], o None"""
+    coincidencia = RE_IDENTIFICACION.search(texto, inicio, fin)
+    if not coincidencia:
+        return None
+    limite = min(fin, coincidencia.start() + MAX_CARACTERES_IDENTIFICACION)
+    final = RE_FIN_IDENTIFICACION.search(texto, coincidencia.end(), limite)
+    return coincidencia.start(), final.start() if final else limite
+
+
+def _corte(texto, inicio, limite):
+    """Posición donde cortar texto[inicio:] en a lo sumo `limite` caracteres, en un salto de línea o espacio"""
+    fin = inicio + limite
+    if fin >= len(texto):
+        return len(texto)
+    for separador in ("\n", " "):
+        posicion = texto.rfind(separador, inicio + limite // 2, fin)
+        if posicion != -1:
+            return posicion + 1
+    return fin
+
+
+class HistoriaSegmentada:
+    """
+    Texto de una historia partido en encabezado y atenciones. Cada segmento es un
+    dict con tipo ("preambulo", "identificacion", "atencion"), fecha, inicio/fin en
+    caracteres, byte_inicio/byte_fin en UTF-8 y pagina_inicio/pagina_fin (desde 1).
+    """
+
+    def __init__(self, paginas, separador="\n\n"):
+        self.separador = separador
+        self.texto = separador.join(paginas)
+        self.paginas = len(paginas)
+        self._inicios_pagina = []
+        posicion = 0
+        for pagina in paginas:
+            self._inicios_pagina.append(posicion)
+            posicion += len(pagina) + len(separador)
+
+        inicios = _inicios_atencion(self.texto)
+        primera = inicios[0][0] if inicios else len(self.texto)
+        cortes = [(0, primera, "preambulo", None)]
+        for n, (inicio, fecha) in enumerate(inicios):
+            fin = inicios[n + 1][0] if n + 1 < len(inicios) else len(self.texto)
+            cortes.append((inicio, fin, "atencion", fecha))
+        preambulo = self.texto[:primera]
+        if not preambulo.strip():
+            cortes.pop(0)
+
+        # Datos del paciente: en el preámbulo (reporte HTML) o en la primera atención (PDF de Medifolios)
+        identificacion = None
+        if not RE_PACIENTE_EN_TEXTO.search(preambulo) and inicios:
+            identificacion = _identificacion(self.texto, inicios[0][0], cortes[-len(inicios)][1])
+
+        posiciones = sorted({0, len(self.texto)} | {p for inicio, fin, _, _ in cortes for p in (inicio, fin)}
+                            | set(identificacion or ()))
+        self._bytes = self._desplazamientos_bytes(posiciones)
+
+        segmentos = [self._segmento(tipo, inicio, fin, fecha) for inicio, fin, tipo, fecha in cortes]
+        self.encabezado = []
+        if segmentos and segmentos[0]["tipo"] == "preambulo" and len(preambulo) <= MAX_CARACTERES_ENCABEZADO:
+            self.encabezado.append(segmentos.pop(0))
+        if identificacion:
+            self.encabezado.append(self._segmento("identificacion", *identificacion))
+        # Las atenciones, y el preámbulo si es largo o si no se encontró ninguna fecha
+        self.atenciones = segmentos
+
+    def _desplazamientos_bytes(self, posiciones):
+        """{posición en caracteres: posición en bytes UTF-8}, codificando el texto una sola vez por tramo"""
+        bytes_ = {}
+        anterior = total = 0
+        for posicion in posiciones:
+            total += len(self.texto[anterior:posicion].encode("utf-8"))
+            bytes_[posicion] = total
+            anterior = posicion
+        return bytes_
+
+    def _byte(self, posicion, referencia=0):
+        if posicion not in self._bytes:
+            self._bytes[posicion] = self._bytes[referencia] + len(
+                self.texto[referencia:posicion].encode("utf-8"))
+        return self._bytes[posicion]
+
+    def _pagina(self, posicion):
+        return max(1, bisect.bisect_right(self._inicios_pagina, posicion))
+
+    def _segmento(self, tipo, inicio, fin, fecha=None, referencia=None):
+        referencia = inicio if referencia is None else referencia
+        return {
+            "tipo": tipo,
+            "fecha": fecha,
+            "inicio": inicio,
+            "fin": fin,
+            "byte_inicio": self._byte(inicio, referencia),
+            "byte_fin": self._byte(fin, referencia),
+            "pagina_inicio": self._pagina(inicio),
+            "pagina_fin": self._pagina(max(inicio, fin - 1)),
+        }
+
+    def texto_de(self, segmento):
+        return self.texto[segmento["inicio"]:segmento["fin"]]
+
+    def texto_encabezado(self):
+        return "\n".join(self.texto_de(s).strip() for s in self.encabezado)
+
+    def _partir(self, segmento, limite):
+        """Trozos de a lo sumo `limite` caracteres de un segmento que no cabe en un bloque"""
+        if segmento["fin"] - segmento["inicio"] <= limite:
+            return [segmento]
+        trozos = []
+        inicio = segmento["inicio"]
+        while inicio < segmento["fin"]:
+            fin = min(segmento["fin"], _corte(self.texto, inicio, limite))
+            trozo = self._segmento(segmento["tipo"], inicio, fin, segmento["fecha"], referencia=segmento["inicio"])
+            trozo["parte"] = len(trozos) + 1
+            trozos.append(trozo)
+            inicio = fin
+        return trozos
+
+    def bloques(self, max_caracteres):
+        """
+        Agrupa las atenciones, en orden, en bloques de a lo sumo `max_caracteres`
+        contando el encabezado que se repite al inicio de cada uno. Retorna una lista
+        de dicts con numero, texto, segmentos y paginas (primera, última).
+        """
+        encabezado = self.texto_encabezado()
+        # El encabezado nunca deja menos de la mitad del bloque para las atenciones
+        espacio = max(max_caracteres - len(encabezado) - len(self.separador), max_caracteres // 2)
+        grupos, actual, largo = [], [], 0
+        for atencion in self.atenciones:
+            for trozo in self._partir(atencion, espacio):
+                tamano = trozo["fin"] - trozo["inicio"] + (len(self.separador) if actual else 0)
+                if actual and largo + tamano > espacio:
+                    grupos.append(actual)
+                    actual, largo = [], 0
+                    tamano = trozo["fin"] - trozo["inicio"]
+                actual.append(trozo)
+                largo += tamano
+        if actual:
+            grupos.append(actual)
+        if not grupos and encabezado:
+            grupos.append([])
+
+        bloques = []
+        for numero, segmentos in enumerate(grupos, start=1):
+            partes = ([encabezado] if encabezado else []) + [self.texto_de(s).strip() for s in segmentos]
+            extremos = segmentos or self.encabezado
+            bloques.append({
+                "numero": numero,
+                "texto": self.separador.join(partes),
+                "segmentos": segmentos,
+                "paginas": (extremos[0]["pagina_inicio"], extremos[-1]["pagina_fin"]),
+            })
+        return bloques
+
+    def indice(self):
+        """Índice serializable a JSON: encabezado y atenciones con sus desplazamientos"""
+        return {
+            "caracteres": len(self.texto),
+            "bytes": self._bytes[len(self.texto)],
+            "paginas": self.paginas,
+            "encabezado": self.encabezado,
+            "atenciones": self.atenciones,
+        }
+
+
+def segmentar_historia(paginas, separador="\n\n"):
+    """Segmenta una historia dada por el texto de sus páginas (ver HistoriaSegmentada)"""
+    return HistoriaSegmentada(list(paginas), separador)
+
+
+def segmentar_texto(texto, separador=None):
+    """
+    Segmenta un texto ya unido. Con `separador` se parte en páginas (exacto si las
+    páginas no lo contienen, como las normalizadas con normalizar_pagina_pdf); sin
+    él, todo el texto cuenta como una página.
+    """
+    if separador:
+        return HistoriaSegmentada(texto.split(separador), separador)
+    return HistoriaSegmentada([texto], "\n\n")
+
+
+def mapear_bloques(funcion, bloques, workers=None):
+    """
+    Aplica `funcion` a cada bloque, varios a la vez en hilos (son llamadas a la API),
+    y retorna los resultados en el orden de los bloques
+    """
+    workers = max(1, min(len(bloques), workers or WORKERS_BLOQUES))
+    if workers == 1:
+        return [funcion(bloque) for bloque in bloques]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bloque") as pool:
+        return list(pool.map(funcion, bloques))
+
+
+def _clave(valor):
+    return json.dumps(valor, sort_keys=True, ensure_ascii=False)
+
+
+def combinar_json(partes):
+    """
+    Une los JSON obtenidos de cada bloque: las listas se concatenan sin repetir
+    elementos idénticos, los objetos se combinan recursivamente y en los valores
+    simples queda el primero no vacío. Las partes None (bloques fallidos) se omiten.
+    """
+    partes = [p for p in partes if p is not None]
+    if not partes:
+        return None
+    if all(isinstance(p, list) for p in partes):
+        vistos, lista = set(), []
+        for elemento in (e for p in partes for e in p):
+            clave = _clave(elemento)
+            if clave not in vistos:
+                vistos.add(clave)
+                lista.append(elemento)
+        return lista
+    if all(isinstance(p, dict) for p in partes):
+        combinado = {}
+        for clave in dict.fromkeys(k for p in partes for k in p):
+            combinado[clave] = combinar_json([p[clave] for p in partes if clave in p])
+        return combinado
+    return next((p for p in partes if p not in ("", [], {})), partes[0])
+
+
+if __name__ == "__main__":
+    from texto_pdf import paginas_pdf
+    from reporte_medifolios import normalizar_pagina_pdf
+
+    parser = argparse.ArgumentParser(description="Segmenta historias clínicas en PDF por atención")
+    parser.add_argument("pdfs", nargs="+", help="PDFs a segmentar")
+    parser.add_argument("--max-caracteres", type=int, default=12000, help="Presupuesto de cada bloque")
+    parser.add_argument("--json", help="Guardar el índice de cada PDF en este archivo")
+    args = parser.parse_args()
+
+    indices = {}
+    for ruta in args.pdfs:
+        historia = segmentar_historia(paginas_pdf(ruta, normalizar=normalizar_pagina_pdf))
+        bloques = historia.bloques(args.max_caracteres)
+        indices[ruta] = dict(historia.indice(), bloques=[
+            {"numero": b["numero"], "caracteres": len(b["texto"]), "paginas": b["paginas"]} for b in bloques
+        ])
+        print(f"📑 {ruta}: {historia.paginas} páginas, {len(historia.texto)} caracteres, "
+              f"{len(historia.atenciones)} segmentos, {len(bloques)} bloques de hasta {args.max_caracteres}")
+        for segmento in historia.encabezado + historia.atenciones:
+            parte = f" (parte {segmento['parte']})" if "parte" in segmento else ""
+            print(f"   {segmento['tipo']:<15}{segmento['fecha'] or '-':<21}"
+                  f"págs {segmento['pagina_inicio']}-{segmento['pagina_fin']:<4}"
+                  f"bytes {segmento['byte_inicio']}-{segmento['byte_fin']}{parte}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(indices, f, ensure_ascii=False, indent=2)
+        print(f"💾 Índice guardado en {args.json}")
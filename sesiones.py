@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import time
+
+# Carpeta donde se guardan las sesiones; contiene cookies de sesión, no versionar
+DIR_SESIONES = os.getenv(
+    "DIR_SESIONES", os.path.join(os.path.expanduser("~"), ".historia_clinica", "sesiones")
+)
+
+# Pasado este tiempo la sesión guardada se descarta sin probarla
+VIGENCIA_HORAS = float(os.getenv("VIGENCIA_SESION_HORAS", "8"))
+
+_JS_LEER_LOCAL_STORAGE = """
+var datos = {};
+for (var i = 0; i < window.localStorage.length; i++) {
+    var clave = window.localStorage.key(i);
+    datos[clave] = window.localStorage.getItem(clave);
+}
+return datos;
+"""
+
+# Se inyecta antes de los scripts de la página para que la app lea el localStorage restaurado
+_JS_ESCRIBIR_LOCAL_STORAGE = """
+(function() {
+    var origen = %s;
+    if (window.location.origin !== origen) { return; }
+    var datos = %s;
+    for (var clave in datos) { window.localStorage.setItem(clave, datos[clave]); }
+})();
+"""
+
+
+def _cookie_para_cdp(cookie):
+    """Convierte una cookie de Network.getAllCookies al formato de Network.setCookies"""
+    campos = {k: cookie[k] for k in ("name", "value", "domain", "path", "secure", "httpOnly") if k in cookie}
+    if cookie.get("sameSite"):
+        campos["sameSite"] = cookie["sameSite"]
+    if not cookie.get("session", False) and cookie.get("expires", -1) > 0:
+        campos["expires"] = cookie["expires"]
+    return campos
+
+
+class AlmacenSesiones:
+    """
+    Guarda y restaura sesiones del navegador (cookies y localStorage) por sitio y usuario,
+    para no repetir el login (ni el captcha) en cada arranque.
+
+    Las cookies se leen y escriben por CDP, así se cubren todos los dominios del sitio
+    sin tener que navegar a cada uno. `ranura` separa sesiones del mismo usuario
+    (por ejemplo, una por worker del pool).
+    """
+
+    def __init__(self, directorio=DIR_SESIONES, vigencia_horas=VIGENCIA_HORAS):
+        self.directorio = directorio
+        self.vigencia = vigencia_horas * 3600
+
+    def _ruta(self, sitio, usuario, ranura=0):
+        # El usuario no va en claro en el nombre del archivo
+        huella = hashlib.sha1(str(usuario).encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.directorio, f"{sitio}_{huella}_{ranura}.json")
+
+    def guardar(self, driver, sitio, usuario, ranura=0):
+        """Guarda la sesión actual del navegador; la URL actual se usa luego para la sonda"""
+        try:
+            cookies = driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies", [])
+            datos = {
+                "guardado": time.time(),
+                "url": driver.current_url,
+                "origen": driver.execute_script("return window.location.origin;"),
+                "cookies": cookies,
+                "local_storage": driver.execute_script(_JS_LEER_LOCAL_STORAGE),
+            }
+
+            os.makedirs(self.directorio, exist_ok=True)
+            ruta = self._ruta(sitio, usuario, ranura)
+            temporal = ruta + ".tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(datos, f)
+            os.chmod(temporal, 0o600)
+            os.replace(temporal, ruta)
+            print(f"💾 Sesión de {sitio} guardada ({len(cookies)} cookies)")
+            return True
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar la sesión de {sitio}: {str(e)}")
+            return False
+
+    def cargar(self, sitio, usuario, ranura=0):
+        """Datos de la sesión guardada, o None si no existe o ya venció"""
+        ruta = self._ruta(sitio, usuario, ranura)
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - datos.get("guardado", 0) > self.vigencia:
+            print(f"⌛ Sesión guardada de {sitio} vencida")
+            self.invalidar(sitio, usuario, ranura)
+            return None
+        return datos
+
+    def invalidar(self, sitio, usuario, ranura=0):
+        try:
+            os.remove(self._ruta(sitio, usuario, ranura))
+        except OSError:
+            pass
+
+    def restaurar(self, driver, sitio, usuario, sonda, ranura=0):
+        """
+        Restaura la sesión guardada y la verifica con `sonda(driver)`, que debe
+        devolver True si la página cargada corresponde a una sesión autenticada.
+
+        Retorna True si la sesión sigue vigente; si no, la descarta y retorna False.
+        """
+        datos = self.cargar(sitio, usuario, ranura)
+        if not datos:
+            return False
+
+        inicio = time.monotonic()
+        id_script = None
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd(
+                "Network.setCookies", {"cookies": [_cookie_para_cdp(c) for c in datos["cookies"]]}
+            )
+            if datos.get("local_storage"):
+                fuente = _JS_ESCRIBIR_LOCAL_STORAGE % (
+                    json.dumps(datos["origen"]), json.dumps(datos["local_storage"])
+                )
+                id_script = driver.execute_cdp_cmd(
+                    "Page.addScriptToEvaluateOnNewDocument", {"source": fuente}
+                ).get("identifier")
+
+            driver.get(datos["url"])
+            vigente = bool(sonda(driver))
+        except Exception as e:
+            print(f"⚠️ Error restaurando la sesión de {sitio}: {str(e)}")
+            vigente = False
+        finally:
+            if id_script:
+                try:
+                    driver.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument", {"identifier": id_script})
+                except Exception:
+                    pass
+
+        if vigente:
+            print(f"✅ Sesión de {sitio} restaurada en {time.monotonic() - inicio:.1f}s, se omite el login")
+            return True
+
+        print(f"⚠️ La sesión guardada de {sitio} ya no es válida, se inicia sesión de nuevo")
+        self.invalidar(sitio, usuario, ranura)
+        try:
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        except Exception:
+            pass
+        return False
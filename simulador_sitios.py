@@ -0,0 +1,642 @@
+"""
+Servidor local que imita las partes de Medifolios y Avicena de las que dependen los
+scrapers (mismos IDs del DOM y mismo flujo), para medir cambios de velocidad sin
+tocar los sitios reales.
+
+    python simulador_sitios.py --puerto 8765 --latencia 0.2 --tasa-fallos 0.05
+
+y luego, en el entorno de los scrapers:
+
+    MEDIFOLIOS_URL=http://127.0.0.1:8765/medifolios
+    MEDIFOLIOS_URL_SERVIDOR=http://127.0.0.1:8765
+    AVICENA_URL=http://127.0.0.1:8765
+
+Medifolios: portal con enlace INGRESO, login, menú, listado paginado de pacientes
+(btnCodPacienteListado), panel histórico y visor con iframe_visualizar_reporte_formato.
+Avicena: login con captcha numérico, sucursal, menú, búsqueda por documento y
+ventana de folios (form:ctlFolios:{i}:verhcSophia) con el PDF de cada folio.
+
+Cualquier usuario y contraseña no vacíos son válidos. En Avicena no se encuentran
+los documentos terminados en "00".
+"""
+import argparse
+import hashlib
+import html
+import json
+import random
+import threading
+import time
+import uuid
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image, ImageDraw, ImageFont
+
+COOKIE_SESION = "SIMSESION"
+
+NOMBRES = ["ANA", "LUIS", "MARIA", "JORGE", "SOFIA", "CARLOS", "LAURA", "ANDRES", "PAULA", "DIEGO"]
+APELLIDOS = ["GOMEZ", "RODRIGUEZ", "LOPEZ", "MARTINEZ", "GARCIA", "PEREZ", "SANCHEZ", "RAMIREZ", "TORRES", "DIAZ"]
+DIAGNOSTICOS = ["I10 - HIPERTENSION ESENCIAL", "E119 - DIABETES MELLITUS TIPO 2", "N40X - HIPERPLASIA DE LA PROSTATA",
+                "J449 - ENFERMEDAD PULMONAR OBSTRUCTIVA CRONICA", "E785 - HIPERLIPIDEMIA"]
+
+
+class ConfigSimulador:
+    """Tamaño de los datos simulados, latencias (segundos) e inyección de fallos"""
+
+    def __init__(self, pacientes=200, tamano_pagina=50, historias_max=6, folios_max=5,
+                 latencia=0.05, latencia_reporte=0.5, tasa_fallos=0.0, tasa_cuelgues=0.0,
+                 duracion_cuelgue=300, formato_reporte="html", tamano_pdf_kb=200,
+                 captcha_libre=False, semilla=1):
+        self.pacientes = pacientes
+        self.tamano_pagina = tamano_pagina
+        self.historias_max = historias_max
+        self.folios_max = folios_max
+        self.latencia = latencia
+        self.latencia_reporte = latencia_reporte
+        self.tasa_fallos = tasa_fallos
+        self.tasa_cuelgues = tasa_cuelgues
+        self.duracion_cuelgue = duracion_cuelgue
+        self.formato_reporte = formato_reporte
+        self.tamano_pdf_kb = tamano_pdf_kb
+        self.captcha_libre = captcha_libre
+        self.semilla = semilla
+
+
+def _numero(texto, modulo):
+    """Entero estable derivado de un texto, para que los datos no cambien entre corridas"""
+    return int(hashlib.md5(texto.encode("utf-8")).hexdigest()[:8], 16) % modulo
+
+
+def generar_pacientes(config):
+    pacientes = []
+    for i in range(config.pacientes):
+        id_paciente = str(10000000 + i * 7919 + config.semilla)
+        nombre = (f"{NOMBRES[_numero(id_paciente + 'n', len(NOMBRES))]} "
+                  f"{APELLIDOS[_numero(id_paciente + 'a', len(APELLIDOS))]} "
+                  f"{APELLIDOS[_numero(id_paciente + 'b', len(APELLIDOS))]}")
+        historias = [
+            {"valor": f"{id_paciente}-{k}", "fecha": f"2024-{1 + (k * 2) % 12:02d}-{1 + (i + k) % 28:02d}"}
+            for k in range(1 + _numero(id_paciente, config.historias_max))
+        ]
+        pacientes.append({"id": id_paciente, "nombre": nombre, "historias": historias})
+    return pacientes
+
+
+def imagen_captcha(codigo, escala=3):
+    """Captcha numérico en escala de grises: dígitos separados sobre fondo blanco"""
+    fuente = ImageFont.load_default()
+    imagen = Image.new("L", (10 * len(codigo) + 8, 16), 255)
+    dibujo = ImageDraw.Draw(imagen)
+    for k, digito in enumerate(codigo):
+        dibujo.text((4 + 10 * k, 2), digito, fill=0, font=fuente)
+    return imagen.resize((imagen.width * escala, imagen.height * escala), Image.NEAREST)
+
+
+def escapar_texto_pdf(texto):
+    texto = texto.encode("latin-1", "replace").decode("latin-1")
+    return texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def pdf_paginas(contenidos, relleno_kb=0):
+    """
+    PDF válido con una página por flujo de contenido (operadores de texto ya armados,
+    con /F1 Helvetica y /F2 Helvetica-Bold), rellenado hasta ~relleno_kb
+    """
+    fuentes = b"<< /F1 3 0 R /F2 4 0 R >>"
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            b" ".join(b"%d 0 R" % (5 + 2 * n) for n in range(len(contenidos))), len(contenidos)),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    for n, contenido in enumerate(contenidos):
+        contenido = contenido.encode("latin-1")
+        objetos.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font %s >> /Contents %d 0 R >>" % (fuentes, 6 + 2 * n))
+        objetos.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(contenido), contenido))
+    if relleno_kb:
+        # Objeto sin referencias: solo da al archivo un tamaño realista
+        relleno = random.Random(len(contenidos[0])).randbytes(relleno_kb * 1024)
+        objetos.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(relleno), relleno))
+
+    salida = bytearray(b"%PDF-1.4\n")
+    posiciones = []
+    for n, objeto in enumerate(objetos, 1):
+        posiciones.append(len(salida))
+        salida += b"%d 0 obj\n%s\nendobj\n" % (n, objeto)
+    inicio_xref = len(salida)
+    salida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    for posicion in posiciones:
+        salida += b"%010d 00000 n \n" % posicion
+    salida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref)
+    return bytes(salida)
+
+
+def pdf_simple(lineas, relleno_kb=0):
+    """PDF válido de una página con las líneas de texto, rellenado hasta ~relleno_kb"""
+    contenido = "BT /F1 10 Tf 40 800 Td 13 TL " + " ".join(f"({escapar_texto_pdf(l)}) '" for l in lineas) + " ET"
+    return pdf_paginas([contenido], relleno_kb)
+
+
+def _pagina(titulo, cuerpo, script=""):
+    return (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{titulo}</title></head>"
+            f"<body>{cuerpo}<script>{script}</script></body></html>")
+
+
+# ---------------------------------------------------------------- Medifolios
+
+_JS_MEDIFOLIOS = """
+var pagina = 0, filtro = '', pacienteActual = null;
+function pedir(url) {
+    return fetch(url).then(function(r) { if (!r.ok) { throw new Error('HTTP ' + r.status); } return r.json(); });
+}
+function abrirListado() {
+    document.getElementById('vistaPaciente').style.display = 'none';
+    document.getElementById('vistaListado').style.display = 'block';
+    pagina = 0; filtro = ''; document.getElementById('filtro').value = '';
+    cargarPagina();
+}
+function cargarPagina() {
+    pedir('/index.php/SALUD_HOME/listado?pagina=' + pagina + '&buscar=' + encodeURIComponent(filtro))
+    .then(function(datos) {
+        var filas = datos.filas.map(function(p) {
+            return '<tr><td><button type="button" class="btnCodPacienteListado" id="btnPac_' + p.id +
+                   '" onclick="abrirPaciente(\\'' + p.id + '\\')">Ver</button></td><td title="' + p.id + '">' + p.id +
+                   '</td><td>CC</td><td title="' + p.nombre + '">' + p.nombre + '</td></tr>';
+        });
+        document.getElementById('filasListado').innerHTML = filas.join('');
+        document.getElementById('siguiente').className = 'paginate_button next' + (datos.hay_siguiente ? '' : ' disabled');
+    });
+}
+function siguiente() { pagina += 1; cargarPagina(); }
+function filtrar(valor) { filtro = valor; pagina = 0; cargarPagina(); }
+function abrirPaciente(id) {
+    pedir('/index.php/SALUD_HOME/paciente_datos?id=' + id).then(function(datos) {
+        pacienteActual = datos;
+        document.getElementById('vistaListado').style.display = 'none';
+        document.getElementById('panelHistorico').style.display = 'none';
+        document.getElementById('nombrePaciente').innerText = datos.nombre;
+        document.getElementById('documentoPaciente').innerText = 'CC ' + datos.id;
+        document.getElementById('vistaPaciente').style.display = 'block';
+    });
+}
+function abrirPanel() {
+    document.getElementById('historias').innerHTML = pacienteActual.historias.map(function(h) {
+        return '<tr><td><input type="checkbox" class="historia" value="' + h.valor + '"></td><td>Consulta ' + h.fecha + '</td></tr>';
+    }).join('');
+    document.getElementById('btnSeleccionarHistorias').checked = false;
+    document.getElementById('panelHistorico').style.display = 'block';
+}
+function seleccionarTodas(marcar) {
+    document.querySelectorAll('#historias input.historia').forEach(function(c) { c.checked = marcar; });
+}
+function visualizar() {
+    var valores = [];
+    document.querySelectorAll('#historias input.historia:checked').forEach(function(c) { valores.push(c.value); });
+    var overlay = document.createElement('div');
+    overlay.className = 'ui-widget-overlay';
+    overlay.style.cssText = 'position:fixed;top:0;left:0;width:100%;height:100%;background:rgba(0,0,0,.3)';
+    document.body.appendChild(overlay);
+    var iframe = document.getElementById('iframe_visualizar_reporte_formato');
+    iframe.removeAttribute('src');
+    document.getElementById('dialogo').style.display = 'block';
+    pedir('/index.php/generar_reporte?id=' + pacienteActual.id + '&h=' + valores.join(','))
+    .then(function(datos) { iframe.src = location.origin + datos.url; });
+}
+function cerrarVisor() {
+    document.getElementById('dialogo').style.display = 'none';
+    document.querySelectorAll('.ui-widget-overlay').forEach(function(o) { o.remove(); });
+}
+"""
+
+_HTML_PACIENTES = """
+<h2>Pacientes</h2>
+<button type="button" class="btnListadoPacientes" onclick="abrirListado()">Listado Pacientes</button>
+<div id="vistaListado" style="display:none">
+  <input type="search" id="filtro" oninput="filtrar(this.value)">
+  <table id="tablaListado"><thead><tr><th></th><th>Documento</th><th>Tipo</th><th>Nombre</th></tr></thead>
+  <tbody id="filasListado"></tbody></table>
+  <a href="#" id="siguiente" class="paginate_button next" onclick="siguiente(); return false;">Siguiente</a>
+</div>
+<div id="vistaPaciente" style="display:none">
+  <h3 class="titulo_historia_paciente"><span id="nombrePaciente"></span></h3>
+  <span class="documento_paciente" id="documentoPaciente"></span>
+  <button type="button" class="btnVolverListadoPacientes" onclick="abrirListado()">Volver al listado</button>
+  <button type="button" id="btnPanelHistorico" onclick="abrirPanel()">Histórico</button>
+  <div id="panelHistorico" style="display:none">
+    <table>
+      <tr><td><input type="checkbox" id="btnSeleccionarHistorias" onclick="seleccionarTodas(this.checked)"></td><td>Todas</td></tr>
+      <tbody id="historias"></tbody>
+    </table>
+    <button type="button" id="btnVisualizarSeleccionado" onclick="visualizar()">Visualizar</button>
+  </div>
+</div>
+<div id="dialogo" class="ui-dialog" style="display:none;position:fixed;top:5%;left:5%;width:90%;height:90%;background:#fff;z-index:10">
+  <button type="button" class="ui-dialog-titlebar-close ui-button-icon-only" title="Close" onclick="cerrarVisor()">x</button>
+  <iframe id="iframe_visualizar_reporte_formato" style="width:100%;height:90%"></iframe>
+</div>
+"""
+
+
+def reporte_medifolios_html(paciente, valores):
+    historias = [h for h in paciente["historias"] if h["valor"] in valores] or paciente["historias"]
+    partes = [
+        "<h1>HISTORIA CLÍNICA</h1><table>",
+        f"<tr><td>IDENTIFICACIÓN: {paciente['id']}</td><td>NOMBRE: {html.escape(paciente['nombre'])}</td></tr>",
+        f"<tr><td>EDAD: {40 + _numero(paciente['id'], 40)} AÑOS</td>"
+        f"<td>SEXO: {'MASCULINO' if _numero(paciente['id'], 2) else 'FEMENINO'}</td></tr>",
+        "<tr><td>ENTIDAD: EPS SIMULADA</td></tr></table>",
+    ]
+    for h in historias:
+        partes.append(
+            f"<div><h3>FECHA DE ATENCIÓN: {h['fecha']} 08:00</h3>"
+            f"<p>MOTIVO DE CONSULTA</p><p>Control de enfermedad crónica</p>"
+            f"<p>SIGNOS VITALES</p><p>PESO: {60 + _numero(h['valor'], 30)} kg TALLA: 170 cm "
+            f"T.A.: {110 + _numero(h['valor'] + 't', 40)}/80 mmHg FC: 72</p>"
+            f"<p>DIAGNÓSTICOS</p><p>{DIAGNOSTICOS[_numero(h['valor'], len(DIAGNOSTICOS))]}</p>"
+            f"<p>PLAN</p><p>Continuar manejo y control en 3 meses</p></div>"
+        )
+    return _pagina("Reporte", "".join(partes))
+
+
+# ---------------------------------------------------------------- Avicena
+
+_JS_AVICENA_PRERREQUISITOS = """
+function buscar() {
+    var tipo = document.getElementById('formPrerrequisitos:ctlTipoIdentificacion').value;
+    var numero = document.getElementById('formPrerrequisitos:ctlNumeroDocumento').value;
+    var resultados = document.getElementById('resultados');
+    resultados.innerHTML = '';
+    fetch('/His/buscar?tipo=' + tipo + '&numero=' + encodeURIComponent(numero))
+    .then(function(r) { return r.json(); })
+    .then(function(datos) {
+        if (!datos.encontrado) { resultados.innerHTML = '<span>No se encontraron registros</span>'; return; }
+        var url = '/His/historia.seam?tipo=' + tipo + '&numero=' + encodeURIComponent(numero);
+        resultados.innerHTML = '<table><tr><td>' + datos.nombre + '</td><td>' +
+            '<button type="button" id="formPrerrequisitos:ctlFolios:0:sophiaBtn" onclick="window.open(\\'' + url +
+            '\\')">Historia</button></td></tr></table>';
+    });
+}
+"""
+
+_JS_AVICENA_HISTORIA = """
+var tabla = null;
+function verFolio(i) {
+    var contenedor = document.getElementById('contenido');
+    tabla = contenedor.innerHTML;
+    contenedor.innerHTML = '<button type="button" id="form:botonVolver" onclick="volver()">Regresar</button>' +
+        '<iframe style="width:100%;height:600px" src="/His/folio.pdf?numero=' + NUMERO + '&i=' + i + '"></iframe>';
+}
+function volver() { document.getElementById('contenido').innerHTML = tabla; }
+"""
+
+
+def folios_documento(config, numero):
+    return 1 + _numero(numero, config.folios_max)
+
+
+# ---------------------------------------------------------------- Servidor
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    # -- utilidades
+
+    def _sesion(self):
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        clave = cookie[COOKIE_SESION].value if COOKIE_SESION in cookie else None
+        with self.server.candado:
+            if clave not in self.server.sesiones:
+                clave = uuid.uuid4().hex
+                self.server.sesiones[clave] = {}
+            return clave, self.server.sesiones[clave]
+
+    def _responder(self, cuerpo, tipo="text/html; charset=utf-8", estado=200, cabeceras=None):
+        if isinstance(cuerpo, str):
+            cuerpo = cuerpo.encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.send_header("Set-Cookie", f"{COOKIE_SESION}={self._clave}; Path=/; HttpOnly")
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(cuerpo)
+
+    def _json(self, datos):
+        self._responder(json.dumps(datos), "application/json")
+
+    def _redirigir(self, ruta):
+        self._responder("", estado=303, cabeceras={"Location": ruta})
+
+    def _formulario(self):
+        largo = int(self.headers.get("Content-Length") or 0)
+        datos = parse_qs(self.rfile.read(largo).decode("utf-8"))
+        return {k: v[0] for k, v in datos.items()}
+
+    def _falla(self):
+        """Inyección de fallos en los endpoints costosos: cuelgue o error 500"""
+        azar = random.random()
+        if azar < self.config.tasa_cuelgues:
+            time.sleep(self.config.duracion_cuelgue)
+        elif azar < self.config.tasa_cuelgues + self.config.tasa_fallos:
+            self._responder("Error interno simulado", "text/plain", estado=500)
+            return True
+        return False
+
+    def _base(self):
+        return f"http://{self.headers.get('Host')}"
+
+    # -- despacho
+
+    def do_GET(self):
+        self._despachar()
+
+    def do_HEAD(self):
+        self._despachar()
+
+    def do_POST(self):
+        self._despachar()
+
+    def _despachar(self):
+        self._clave, self.sesion = self._sesion()
+        url = urlparse(self.path)
+        self.parametros = {k: v[0] for k, v in parse_qs(url.query).items()}
+        manejador = getattr(self, "_" + self.command.lower() + url.path.replace("/", "_").replace(".", "_"), None)
+        if self.config.latencia:
+            time.sleep(self.config.latencia)
+        if manejador is None:
+            self._responder("No encontrado", "text/plain", estado=404)
+            return
+        try:
+            manejador()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    # -- Medifolios
+
+    def _get_(self):
+        self._redirigir("/index.php/login")
+
+    def _get_medifolios_(self):
+        self._responder(_pagina("Medifolios", f"<a class='block-menu' href='{self._base()}/index.php/login'>INGRESO</a>"))
+
+    _get_medifolios = _get_medifolios_
+
+    def _get_index_php_login(self):
+        self._responder(_pagina("Ingreso", """
+            <form method="post" action="/index.php/login">
+              <input id="txt_usuario_login" name="usuario"><input id="txt_password_login" name="password" type="password">
+              <button type="submit">Ingresar</button>
+            </form>"""))
+
+    def _post_index_php_login(self):
+        datos = self._formulario()
+        if datos.get("usuario") and datos.get("password"):
+            self.sesion["medifolios"] = True
+            self._redirigir("/index.php/SALUD_HOME")
+        else:
+            self._get_index_php_login()
+
+    def _autenticado_medifolios(self):
+        if self.sesion.get("medifolios"):
+            return True
+        self._redirigir("/index.php/login")
+        return False
+
+    def _get_index_php_SALUD_HOME(self):
+        if self._autenticado_medifolios():
+            self._responder(_pagina("Inicio", """
+                <button type="button" id="OpenMenuMedifolios"
+                        onclick="document.getElementById('menu').style.display='block'">Bienvenido</button>
+                <div id="menu" class="item_menu_board" style="display:none">
+                  <a href="/index.php/SALUD_HOME/paciente">Pacientes</a>
+                </div>"""))
+
+    def _get_index_php_SALUD_HOME_paciente(self):
+        if self._autenticado_medifolios():
+            self._responder(_pagina("Pacientes", _HTML_PACIENTES, _JS_MEDIFOLIOS))
+
+    def _get_index_php_SALUD_HOME_listado(self):
+        if not self._autenticado_medifolios() or self._falla():
+            return
+        buscar = self.parametros.get("buscar", "")
+        filas = [p for p in self.server.pacientes if buscar in p["id"]]
+        tamano = self.config.tamano_pagina
+        pagina = int(self.parametros.get("pagina", 0))
+        self._json({
+            "filas": [{"id": p["id"], "nombre": p["nombre"]} for p in filas[pagina * tamano:(pagina + 1) * tamano]],
+            "hay_siguiente": (pagina + 1) * tamano < len(filas),
+        })
+
+    def _get_index_php_SALUD_HOME_paciente_datos(self):
+        if self._autenticado_medifolios():
+            self._json(self.server.por_id[self.parametros["id"]])
+
+    def _get_index_php_generar_reporte(self):
+        if not self._autenticado_medifolios() or self._falla():
+            return
+        time.sleep(self.config.latencia_reporte)
+        self._json({"url": f"/index.php/reporte?id={self.parametros['id']}&h={self.parametros.get('h', '')}"})
+
+    def _get_index_php_reporte(self):
+        if not self.sesion.get("medifolios"):
+            # Como el sitio real: sin sesión responde con el formulario de ingreso
+            self._get_index_php_login()
+            return
+        if self._falla():
+            return
+        paciente = self.server.por_id[self.parametros["id"]]
+        valores = set(filter(None, self.parametros.get("h", "").split(",")))
+        if self.config.formato_reporte == "pdf":
+            lineas = [f"IDENTIFICACION: {paciente['id']}", f"NOMBRE: {paciente['nombre']}"]
+            lineas += [f"FECHA DE ATENCION: {h['fecha']}" for h in paciente["historias"]]
+            self._responder(pdf_simple(lineas, self.config.tamano_pdf_kb), "application/pdf")
+        else:
+            self._responder(reporte_medifolios_html(paciente, valores))
+
+    # -- Avicena
+
+    def _get_His_login_seam(self, error=""):
+        self.sesion["captcha"] = "".join(random.choice("0123456789") for _ in range(5))
+        aviso = f"<span class='mensajeErrorLogin'>{error}</span>" if error else ""
+        self._responder(_pagina("Avicena", f"""
+            <form id="ctlFormLogin" method="post" action="/His/login.seam">
+              <input id="ctlFormLogin:idUserNameLogin" name="usuario">
+              <input id="ctlFormLogin:idPwdLogin" name="password" type="password">
+              <img id="ctlFormLogin:j_id27" src="/His/captcha.png?t={time.time()}">
+              <input id="ctlFormLogin:idCodSegCaptcha" name="captcha">
+              <button type="submit" id="ctlFormLogin:botonValidar">Validar</button>
+              {aviso}
+            </form>"""))
+
+    def _get_His_captcha_png(self):
+        from io import BytesIO
+        salida = BytesIO()
+        imagen_captcha(self.sesion.get("captcha", "00000")).save(salida, "PNG")
+        self._responder(salida.getvalue(), "image/png")
+
+    def _post_His_login_seam(self):
+        datos = self._formulario()
+        if not (datos.get("usuario") and datos.get("password")):
+            self._get_His_login_seam("Usuario o contraseña inválidos")
+        elif not self.config.captcha_libre and datos.get("captcha") != self.sesion.get("captcha"):
+            self._get_His_login_seam("El código captcha ingresado es incorrecto")
+        else:
+            self.sesion["avicena_usuario"] = True
+            self._redirigir("/His/ingreso.seam")
+
+    def _get_His_ingreso_seam(self):
+        if not self.sesion.get("avicena_usuario"):
+            self._redirigir("/His/login.seam")
+            return
+        self._responder(_pagina("Sucursal", """
+            <form id="formIngreso" method="post" action="/His/ingreso.seam">
+              <select id="formIngreso:ctlSucursales" name="sucursal">
+                <option value="">Seleccione</option><option value="29374">SEDE PRINCIPAL</option>
+                <option value="10001">SEDE NORTE</option>
+              </select>
+              <button type="submit" id="formIngreso:btnIngresar">Ingresar</button>
+            </form>"""))
+
+    def _post_His_ingreso_seam(self):
+        if self.sesion.get("avicena_usuario") and self._formulario().get("sucursal"):
+            self.sesion["avicena"] = True
+            self._redirigir("/His/menu.seam")
+        else:
+            self._get_His_ingreso_seam()
+
+    def _autenticado_avicena(self):
+        if self.sesion.get("avicena"):
+            return True
+        self._redirigir("/His/login.seam")
+        return False
+
+    def _get_His_menu_seam(self):
+        if self._autenticado_avicena():
+            self._responder(_pagina("Menú", """
+                <style>#formMenu .submenu {display:none} #formMenu:hover .submenu {display:block}</style>
+                <form id="formMenu"><span>Historia Clínica</span>
+                  <div class="submenu">
+                    <a id="formMenu:ctlItemConsultarHistoria:anchor" href="/His/prerrequisitos.seam">Consultar historia</a>
+                  </div>
+                </form>"""))
+
+    def _get_His_prerrequisitos_seam(self):
+        if self._autenticado_avicena():
+            self._responder(_pagina("Consulta", """
+                <form id="formPrerrequisitos" onsubmit="return false;">
+                  <select id="formPrerrequisitos:ctlTipoIdentificacion">
+                    <option value="433">CEDULA DE CIUDADANIA</option><option value="434">TARJETA DE IDENTIDAD</option>
+                    <option value="435">CEDULA DE EXTRANJERIA</option>
+                  </select>
+                  <input id="formPrerrequisitos:ctlNumeroDocumento">
+                  <button type="button" id="formPrerrequisitos:buscar1" onclick="buscar()">Buscar</button>
+                  <div id="resultados"></div>
+                </form>""", _JS_AVICENA_PRERREQUISITOS))
+
+    def _get_His_buscar(self):
+        if not self._autenticado_avicena() or self._falla():
+            return
+        numero = self.parametros.get("numero", "")
+        encontrado = bool(numero) and not numero.endswith("00")
+        nombre = f"{NOMBRES[_numero(numero, len(NOMBRES))]} {APELLIDOS[_numero(numero + 'a', len(APELLIDOS))]}"
+        self._json({"encontrado": encontrado, "nombre": nombre if encontrado else ""})
+
+    def _get_His_historia_seam(self):
+        if not self._autenticado_avicena():
+            return
+        numero = self.parametros.get("numero", "")
+        filas = "".join(
+            f"<tr><td>Folio {i + 1}</td><td><button type='button' id='form:ctlFolios:{i}:verhcSophia' "
+            f"onclick='verFolio({i})'>Ver</button></td></tr>"
+            for i in range(folios_documento(self.config, numero))
+        )
+        self._responder(_pagina(
+            "Historia", f"<form id='form'><div id='contenido'><table id='form:ctlFolios'>{filas}</table></div></form>",
+            f"var NUMERO = {json.dumps(numero)};" + _JS_AVICENA_HISTORIA
+        ))
+
+    def _get_His_folio_pdf(self):
+        if not self._autenticado_avicena() or self._falla():
+            return
+        time.sleep(self.config.latencia_reporte)
+        numero, i = self.parametros.get("numero", ""), self.parametros.get("i", "0")
+        lineas = [f"HISTORIA CLINICA - DOCUMENTO {numero}", f"FOLIO {int(i) + 1}",
+                  f"DIAGNOSTICO: {DIAGNOSTICOS[_numero(numero + i, len(DIAGNOSTICOS))]}"]
+        self._responder(pdf_simple(lineas, self.config.tamano_pdf_kb), "application/pdf")
+
+
+def iniciar_simulador(config=None, puerto=0, host="127.0.0.1"):
+    """
+    Arranca el simulador en un hilo en segundo plano.
+    Retorna (servidor, url_base); servidor.shutdown() lo detiene.
+    """
+    config = config or ConfigSimulador()
+    servidor = ThreadingHTTPServer((host, puerto), _Manejador)
+    servidor.daemon_threads = True
+    servidor.config = config
+    servidor.candado = threading.Lock()
+    servidor.sesiones = {}
+    servidor.pacientes = generar_pacientes(config)
+    servidor.por_id = {p["id"]: p for p in servidor.pacientes}
+    threading.Thread(target=servidor.serve_forever, name="simulador", daemon=True).start()
+    return servidor, f"http://{host}:{servidor.server_address[1]}"
+
+
+def variables_entorno(url_base):
+    """Variables que apuntan los scrapers al simulador"""
+    return {
+        "MEDIFOLIOS_URL": f"{url_base}/medifolios",
+        "MEDIFOLIOS_URL_SERVIDOR": url_base,
+        "AVICENA_URL": url_base,
+    }
+
+
+def agregar_argumentos(parser):
+    """Opciones del simulador, compartidas con benchmark_scrapers.py"""
+    parser.add_argument("--pacientes-simulados", type=int, default=200, help="Pacientes en el listado de Medifolios")
+    parser.add_argument("--latencia", type=float, default=0.05, help="Retardo de cada petición (s)")
+    parser.add_argument("--latencia-reporte", type=float, default=0.5, help="Retardo al generar reportes y PDFs (s)")
+    parser.add_argument("--tasa-fallos", type=float, default=0.0, help="Probabilidad de error 500 en endpoints costosos")
+    parser.add_argument("--tasa-cuelgues", type=float, default=0.0, help="Probabilidad de que una petición no responda")
+    parser.add_argument("--formato-reporte", choices=["html", "pdf"], default="html", help="Formato del reporte de Medifolios")
+    parser.add_argument("--tamano-pdf-kb", type=int, default=200, help="Tamaño aproximado de cada PDF")
+    parser.add_argument("--captcha-libre", action="store_true", help="Aceptar cualquier captcha en Avicena")
+    parser.add_argument("--semilla", type=int, default=1, help="Semilla de los datos y los fallos")
+
+
+def config_desde_argumentos(args):
+    random.seed(args.semilla)
+    return ConfigSimulador(
+        pacientes=args.pacientes_simulados, latencia=args.latencia, latencia_reporte=args.latencia_reporte,
+        tasa_fallos=args.tasa_fallos, tasa_cuelgues=args.tasa_cuelgues, formato_reporte=args.formato_reporte,
+        tamano_pdf_kb=args.tamano_pdf_kb, captcha_libre=args.captcha_libre, semilla=args.semilla,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador local de Medifolios y Avicena")
+    parser.add_argument("--puerto", type=int, default=8765)
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+
+    servidor, url_base = iniciar_simulador(config_desde_argumentos(args), args.puerto)
+    print(f"🧪 Simulador escuchando en {url_base}")
+    for nombre, valor in variables_entorno(url_base).items():
+        print(f"   {nombre}={valor}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -0,0 +1,278 @@
+"""
+Supervisor de un worker con navegador: detecta Chrome colgado o inflado, lo mata,
+lo recrea (restaurando la sesión guardada) y vuelve a encolar el elemento en curso.
+
+El worker marca su avance con latido(paso); las Esperas del navegador lo llaman
+solas después de cada espera. Un hilo vigilante revisa cada pocos segundos:
+  - tiempo sin latidos (una llamada a Selenium que nunca volvió),
+  - plazo máximo del paso actual (por defecto, un elemento completo),
+  - memoria del árbol de procesos de Chrome (requiere psutil).
+"""
+import collections
+import collections.abc
+import os
+import signal
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Plazo máximo (segundos) por paso supervisado; "default" aplica a pasos no listados
+PLAZOS_SUPERVISOR = {
+    "default": 600,
+    "elemento": 900,
+}
+
+# Sin latidos durante este tiempo el navegador se da por colgado
+MAX_SIN_LATIDO = int(os.getenv("SUPERVISOR_MAX_SIN_LATIDO", "180"))
+
+# Memoria de Chrome (chromedriver y todos sus hijos) a partir de la cual se recicla el navegador
+MAX_MEMORIA_MB = int(os.getenv("SUPERVISOR_MAX_MEMORIA_MB", "3000"))
+
+# Veces que se reintenta un mismo elemento tras reiniciar el navegador
+MAX_REINTENTOS_ELEMENTO = 2
+
+INTERVALO_VIGILANCIA = 5
+
+
+def _procesos_chrome(driver):
+    """Proceso de chromedriver y todos sus descendientes (Chrome, renderers, GPU)"""
+    try:
+        proceso = psutil.Process(driver.service.process.pid)
+        return [proceso] + proceso.children(recursive=True)
+    except (AttributeError, psutil.Error):
+        return []
+
+
+def memoria_navegador_mb(driver):
+    """RSS total del árbol de procesos del navegador en MB, o None sin psutil"""
+    if psutil is None:
+        return None
+    total = 0
+    for proceso in _procesos_chrome(driver):
+        try:
+            total += proceso.memory_info().rss
+        except psutil.Error:
+            pass
+    return total / (1024 * 1024)
+
+
+def navegador_responde(driver):
+    """True si WebDriver todavía contesta (Chrome no se cerró ni se cayó)"""
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+
+def matar_navegador(driver):
+    """
+    Mata el navegador sin pasar por WebDriver (que es justo lo que está colgado).
+    La llamada de Selenium bloqueada falla en cuanto desaparece chromedriver.
+    """
+    if psutil is not None:
+        for proceso in reversed(_procesos_chrome(driver)):
+            try:
+                proceso.kill()
+            except psutil.Error:
+                pass
+        return
+    try:
+        # Sin psutil solo se puede matar chromedriver; Chrome puede quedar huérfano
+        os.kill(driver.service.process.pid, signal.SIGTERM)
+    except (AttributeError, OSError) as e:
+        print(f"⚠️ No se pudo matar el navegador: {str(e)}")
+
+
+class Supervisor:
+    """
+    Ejecuta `procesar(navegador, elemento)` sobre cada elemento con un navegador
+    creado por `crear()` (que ya debe dejarlo con la sesión iniciada), y lo recrea
+    cuando se cuelga, se infla o falla sin responder.
+
+    `navegador` debe tener `driver` y `cerrar()`; si tiene `esperas`, sus esperas
+    cuentan como latidos.
+    """
+
+    def __init__(self, nombre, crear, procesar, plazos=None, max_sin_latido=MAX_SIN_LATIDO,
+                 max_memoria_mb=MAX_MEMORIA_MB, max_reintentos=MAX_REINTENTOS_ELEMENTO):
+        self.nombre = nombre
+        self.crear = crear
+        self.procesar = procesar
+        self.plazos = dict(PLAZOS_SUPERVISOR)
+        if plazos:
+            self.plazos.update(plazos)
+        self.max_sin_latido = max_sin_latido
+        self.max_memoria_mb = max_memoria_mb
+        self.max_reintentos = max_reintentos
+
+        self.navegador = None
+        self.reinicios = []
+        self.sin_procesar = []
+        self._candado = threading.Lock()
+        self._paso = None
+        self._inicio_paso = self._ultimo_latido = time.monotonic()
+        self._matado = None
+        self._reciclar = False
+        self._con_latidos = False
+        self._detener = threading.Event()
+
+    def latido(self, paso=None):
+        """Marca avance del worker; con `paso` además empieza a correr el plazo de ese paso"""
+        ahora = time.monotonic()
+        with self._candado:
+            self._ultimo_latido = ahora
+            if paso in self.plazos:
+                self._paso, self._inicio_paso = paso, ahora
+
+    def _motivo_reinicio(self, navegador):
+        """Razón para matar el navegador ahora mismo, o None si está sano"""
+        with self._candado:
+            if self._matado or self._paso is None:
+                # Sin elemento en curso (p. ej. esperando la cola) no se exigen latidos
+                return None
+            ahora = time.monotonic()
+            if self._con_latidos and ahora - self._ultimo_latido > self.max_sin_latido:
+                return f"sin latidos hace {ahora - self._ultimo_latido:.0f}s"
+            plazo = self.plazos.get(self._paso, self.plazos["default"])
+            if ahora - self._inicio_paso > plazo:
+                return f"paso '{self._paso}' excedió {plazo}s"
+
+        memoria = memoria_navegador_mb(navegador.driver)
+        if memoria is not None and memoria > self.max_memoria_mb:
+            # Inflado pero respondiendo: se recicla al terminar el elemento actual,
+            # salvo que se haya ido muy por encima del límite
+            if memoria > 1.5 * self.max_memoria_mb:
+                return f"memoria {memoria:.0f} MB"
+            if not self._reciclar:
+                print(f"⚠️ {self.nombre}: Chrome usa {memoria:.0f} MB, se reciclará tras el elemento actual")
+                self._reciclar = True
+        return None
+
+    def _vigilar(self):
+        while not self._detener.wait(INTERVALO_VIGILANCIA):
+            navegador = self.navegador
+            if navegador is None:
+                continue  # creando el navegador: el login tiene sus propios plazos
+            motivo = self._motivo_reinicio(navegador)
+            if motivo:
+                print(f"🛑 {self.nombre}: navegador colgado ({motivo}), se mata y se recrea")
+                with self._candado:
+                    self._matado = motivo
+                matar_navegador(navegador.driver)
+
+    def _iniciar_navegador(self):
+        self._matado, self._reciclar = None, False
+        navegador = self.crear()
+        if navegador is None:
+            raise RuntimeError("No se pudo crear el navegador")
+        # Sin Esperas no hay latidos intermedios: solo se vigila el plazo del paso
+        self._con_latidos = getattr(navegador, "esperas", None) is not None
+        if self._con_latidos:
+            navegador.esperas.latido = self.latido
+        self.navegador = navegador
+
+    def _asegurar_navegador(self):
+        """Crea el navegador si no hay uno vivo; False si no se pudo"""
+        if self.navegador is not None:
+            return True
+        try:
+            self._iniciar_navegador()
+            return True
+        except Exception as e:
+            print(f"❌ {self.nombre}: no se pudo iniciar el navegador: {str(e)}")
+            self._descartar_navegador(f"inicio fallido: {str(e)}")
+            return False
+
+    def _descartar_navegador(self, motivo=None):
+        """Cierra el navegador actual; con `motivo` cuenta como reinicio"""
+        navegador, self.navegador = self.navegador, None
+        if motivo:
+            self.reinicios.append({"ts": time.time(), "motivo": motivo})
+        if navegador is not None:
+            try:
+                navegador.cerrar()
+            except Exception:
+                pass
+
+    def ejecutar(self, elementos):
+        """
+        Procesa los elementos (cualquier iterable, incluso uno que lee de una cola)
+        y retorna la lista de resultados que no son None.
+
+        Un elemento que falla con el navegador muerto se vuelve a encolar hasta
+        `max_reintentos` veces; uno que falla con el navegador sano se da por perdido.
+
+        Si el navegador no se puede crear (ni al inicio ni al reiniciarlo) se deja de
+        procesar: el elemento en curso y los reencolados quedan en `sin_procesar`,
+        y con una secuencia (no una cola) también los que faltaban, para que quien
+        llama los informe o se los pase a otro worker.
+        """
+        pendientes = collections.deque()  # (elemento, reintentos) por reencolar
+        fuente = iter(elementos)
+        resultados = []
+        self.sin_procesar = []
+
+        vigilante = threading.Thread(target=self._vigilar, name=f"vigilante-{self.nombre}", daemon=True)
+        vigilante.start()
+        try:
+            # El primer navegador se crea (y precalienta) antes de pedir trabajo, así el
+            # arranque se solapa con la espera de la cola; los reinicios, al necesitarlo
+            listo = self._asegurar_navegador()
+            while listo:
+                if pendientes:
+                    elemento, reintentos = pendientes.popleft()
+                else:
+                    elemento, reintentos = next(fuente, None), 0
+                    if elemento is None:
+                        break
+                if not self._asegurar_navegador():
+                    # Sin navegador no se puede seguir: el elemento vuelve a quien llama
+                    pendientes.appendleft((elemento, reintentos))
+                    listo = False
+                    break
+
+                try:
+                    self.latido("elemento")
+                    resultado = self.procesar(self.navegador, elemento)
+                    if resultado is not None:
+                        resultados.append(resultado)
+                    muerto = self._matado
+                except Exception as e:
+                    muerto = self._matado or (None if navegador_responde(self.navegador.driver) else str(e))
+                    if not muerto:
+                        print(f"❌ {self.nombre}: error procesando elemento: {str(e)}")
+                finally:
+                    with self._candado:
+                        self._paso = None
+
+                if muerto:
+                    self._descartar_navegador(muerto)
+                    if reintentos < self.max_reintentos:
+                        print(f"🔁 {self.nombre}: elemento reencolado "
+                              f"(reintento {reintentos + 1}/{self.max_reintentos})")
+                        pendientes.append((elemento, reintentos + 1))
+                    else:
+                        print(f"❌ {self.nombre}: elemento descartado tras {self.max_reintentos} reinicios")
+                elif self._reciclar:
+                    self._descartar_navegador("memoria")
+        finally:
+            self._detener.set()
+            vigilante.join()
+            self._descartar_navegador()
+
+        if not listo:
+            self.sin_procesar = [elemento for elemento, _ in pendientes]
+            if isinstance(elementos, collections.abc.Sequence):
+                self.sin_procesar.extend(fuente)
+            if self.sin_procesar:
+                print(f"❌ {self.nombre}: sin navegador, {len(self.sin_procesar)} elementos quedan sin procesar")
+
+        if self.reinicios:
+            print(f"🔄 {self.nombre}: {len(self.reinicios)} reinicios de navegador "
+                  f"({', '.join(r['motivo'] for r in self.reinicios)})")
+        return resultados
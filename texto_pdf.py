@@ -0,0 +1,50 @@
+"""
+Lectura del texto de un PDF página por página, normalizada y con presupuesto:
+las páginas se leen a medida que se piden (desde la caché de textos o del PDF) y
+la lectura se corta al llegar a los caracteres o tokens que el flujo va a usar, en
+lugar de extraer todo el documento para después recortarlo.
+
+    from texto_pdf import paginas_pdf, texto_pdf
+
+    for pagina in paginas_pdf(ruta, normalizar=normalizar_pagina_pdf):
+        ...
+    texto, paginas = texto_pdf(ruta, max_caracteres=12000)
+"""
+from cache_textos import iterar_paginas
+
+# Aproximación para presupuestos en tokens sin depender del tokenizador del modelo
+CARACTERES_POR_TOKEN = 4
+
+
+def _limite(max_caracteres, max_tokens):
+    limites = [n for n in (max_caracteres, max_tokens and max_tokens * CARACTERES_POR_TOKEN) if n]
+    return min(limites) if limites else None
+
+
+def paginas_pdf(ruta, normalizar=None, max_caracteres=None, max_tokens=None, backend=None, estadisticas=None):
+    """
+    Genera el texto de cada página, pasado por `normalizar` si se indica. Se detiene
+    en cuanto las páginas generadas suman `max_caracteres` (o `max_tokens`
+    aproximados): recortar el resultado a ese límite da lo mismo que leer todo.
+    """
+    limite = _limite(max_caracteres, max_tokens)
+    total = 0
+    paginas = iterar_paginas(ruta, backend, estadisticas=estadisticas)
+    try:
+        for pagina in paginas:
+            if normalizar:
+                pagina = normalizar(pagina)
+            yield pagina
+            total += len(pagina)
+            if limite is not None and total >= limite:
+                return
+    finally:
+        # Cierra la lectura aunque quien consume corte antes: guarda en la caché lo leído
+        paginas.close()
+
+
+def texto_pdf(ruta, separador="\n\n", normalizar=None, max_caracteres=None, max_tokens=None, backend=None,
+              estadisticas=None):
+    """Texto del PDF con las páginas unidas una sola vez. Retorna (texto, paginas leídas)"""
+    paginas = list(paginas_pdf(ruta, normalizar, max_caracteres, max_tokens, backend, estadisticas))
+    return separador.join(paginas), len(paginas)
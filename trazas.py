@@ -0,0 +1,208 @@
+"""
+Tramos de tiempo por etapa (login, navegación, descarga, extracción, LLM, escritura...)
+para ver dónde se va el tiempo de una corrida sin leer la salida de print.
+
+    from trazas import tramo
+
+    @tramo("medifolios.login")
+    def login(self, ...): ...
+
+    with tramo("medifolios.llm", paciente=id_paciente):
+        ...
+
+Los tramos se guardan en memoria; al terminar el proceso se imprime p50/p95/p99 por
+etapa y, si TRAZAS_SALIDA tiene una ruta, se exportan: `.jsonl` un tramo por línea,
+cualquier otra extensión en formato Chrome trace (abrir en chrome://tracing o Perfetto).
+"""
+import atexit
+import collections
+import functools
+import json
+import os
+import threading
+import time
+
+# Archivo donde se exportan los tramos al terminar; vacío para no exportar
+TRAZAS_SALIDA = os.getenv("TRAZAS_SALIDA", "")
+
+# Imprimir el resumen por etapa al terminar el proceso
+TRAZAS_RESUMEN = os.getenv("TRAZAS_RESUMEN", "1").lower() in ("1", "true", "si", "sí")
+
+# Tramos conservados como máximo; los más viejos se descartan en corridas muy largas
+MAX_TRAMOS = int(os.getenv("TRAZAS_MAX_TRAMOS", "200000"))
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentil(valores_ordenados, p):
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not valores_ordenados:
+        return None
+    k = max(0, min(len(valores_ordenados) - 1, -(-p * len(valores_ordenados) // 100) - 1))
+    return valores_ordenados[k]
+
+
+class _Tramo:
+    """Un tramo abierto con `with`, o un decorador que abre uno por llamada"""
+
+    def __init__(self, trazador, nombre, atributos):
+        self.trazador = trazador
+        self.nombre = nombre
+        self.atributos = atributos
+
+    def __enter__(self):
+        self._inicio_epoca = time.time()
+        self._inicio = time.perf_counter()
+        self.trazador._pila().append(self.nombre)
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        duracion = time.perf_counter() - self._inicio
+        pila = self.trazador._pila()
+        pila.pop()
+        self.trazador._agregar({
+            "nombre": self.nombre,
+            "inicio": self._inicio_epoca,
+            "segundos": duracion,
+            "ok": tipo is None and self.atributos.get("ok", True),
+            "padre": pila[-1] if pila else None,
+            "hilo": threading.current_thread().name,
+            "tid": threading.get_ident(),
+            "atributos": {k: v for k, v in self.atributos.items() if k != "ok"},
+            **({"error": f"{tipo.__name__}: {str(valor)[:200]}"} if tipo else {}),
+        })
+        return False
+
+    def marcar(self, **atributos):
+        """Agrega atributos al tramo en curso (ok=False lo marca como fallido)"""
+        self.atributos.update(atributos)
+
+    def __call__(self, funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with _Tramo(self.trazador, self.nombre, dict(self.atributos)) as actual:
+                resultado = funcion(*args, **kwargs)
+                # Convención del repo: los pasos fallidos retornan False en vez de lanzar
+                if resultado is False:
+                    actual.marcar(ok=False)
+                return resultado
+        return envoltura
+
+
+class Trazador:
+    """Registro de tramos compartido por todos los hilos del proceso"""
+
+    def __init__(self, max_tramos=MAX_TRAMOS):
+        self.tramos = collections.deque(maxlen=max_tramos)
+        self._candado = threading.Lock()
+        self._local = threading.local()
+
+    def _pila(self):
+        if not hasattr(self._local, "pila"):
+            self._local.pila = []
+        return self._local.pila
+
+    def _agregar(self, registro):
+        with self._candado:
+            self.tramos.append(registro)
+
+    def tramo(self, nombre, **atributos):
+        return _Tramo(self, nombre, atributos)
+
+    def resumen(self):
+        """{etapa: {n, errores, total, p50, p95, p99, max}} en segundos"""
+        with self._candado:
+            tramos = list(self.tramos)
+        por_etapa = collections.defaultdict(list)
+        errores = collections.Counter()
+        for t in tramos:
+            por_etapa[t["nombre"]].append(t["segundos"])
+            errores[t["nombre"]] += not t["ok"]
+        resumen = {}
+        for nombre, duraciones in por_etapa.items():
+            duraciones.sort()
+            resumen[nombre] = {
+                "n": len(duraciones),
+                "errores": errores[nombre],
+                "total": sum(duraciones),
+                **{f"p{p}": percentil(duraciones, p) for p in PERCENTILES},
+                "max": duraciones[-1],
+            }
+        return resumen
+
+    def imprimir_resumen(self):
+        resumen = self.resumen()
+        if not resumen:
+            return
+        print(f"\n⏱️ TIEMPOS POR ETAPA ({sum(r['n'] for r in resumen.values())} tramos)")
+        print(f"   {'etapa':<34}{'n':>6}{'err':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'total':>10}")
+        for nombre, r in sorted(resumen.items(), key=lambda e: -e[1]["total"]):
+            print(f"   {nombre:<34}{r['n']:>6}{r['errores']:>5}{r['p50']:>8.2f}s{r['p95']:>8.2f}s"
+                  f"{r['p99']:>8.2f}s{r['total']:>9.1f}s")
+
+    def exportar_jsonl(self, ruta):
+        with self._candado:
+            tramos = list(self.tramos)
+        with open(ruta, "w", encoding="utf-8") as f:
+            for t in tramos:
+                f.write(json.dumps(t, ensure_ascii=False, default=str) + "\n")
+        return ruta
+
+    def exportar_chrome(self, ruta):
+        """Formato Chrome trace: eventos completos ("X") con microsegundos, un carril por hilo"""
+        with self._candado:
+            tramos = list(self.tramos)
+        pid = os.getpid()
+        eventos = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": hilo}}
+            for tid, hilo in {t["tid"]: t["hilo"] for t in tramos}.items()
+        ]
+        for t in tramos:
+            eventos.append({
+                "name": t["nombre"],
+                "cat": t["nombre"].split(".", 1)[0],
+                "ph": "X",
+                "ts": int(t["inicio"] * 1e6),
+                "dur": int(t["segundos"] * 1e6),
+                "pid": pid,
+                "tid": t["tid"],
+                "args": dict(t["atributos"], ok=t["ok"], **({"error": t["error"]} if "error" in t else {})),
+            })
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": eventos, "displayTimeUnit": "ms"}, f, ensure_ascii=False, default=str)
+        return ruta
+
+    def exportar(self, ruta):
+        """Exporta según la extensión: .jsonl un tramo por línea, si no Chrome trace"""
+        if not self.tramos:
+            return None
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        if ruta.endswith(".jsonl"):
+            self.exportar_jsonl(ruta)
+        else:
+            self.exportar_chrome(ruta)
+        print(f"🧭 {len(self.tramos)} tramos exportados a {ruta}")
+        return ruta
+
+
+TRAZADOR = Trazador()
+
+
+def tramo(nombre, **atributos):
+    """Tramo del trazador global, usable con `with` o como decorador"""
+    return TRAZADOR.tramo(nombre, **atributos)
+
+
+def _al_terminar():
+    if TRAZAS_RESUMEN:
+        TRAZADOR.imprimir_resumen()
+    if TRAZAS_SALIDA:
+        try:
+            TRAZADOR.exportar(TRAZAS_SALIDA)
+        except Exception as e:
+            print(f"⚠️ No se pudieron exportar las trazas: {str(e)}")
+
+
+atexit.register(_al_terminar)
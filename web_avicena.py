@@ -2,10 +2,11 @@ import time
 import os
 import json
 import tempfile
+import shutil
 import base64
-import requests
 import re
 import traceback
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
@@ -15,23 +16,50 @@ from selenium.common.exceptions import TimeoutException
 from selenium.webdriver.support.ui import Select
 from selenium import webdriver
 from selenium.webdriver.common.action_chains import ActionChains
-from selenium.common.exceptions import StaleElementReferenceException, ElementClickInterceptedException
+from selenium.common.exceptions import StaleElementReferenceException, ElementClickInterceptedException, NoSuchElementException
 from dotenv import load_dotenv
 from openai import OpenAI
 from PIL import Image, ImageEnhance
+from escucha_cdp import EscuchaCDP
+from descargas_pdf import GestorDescargas
+from sesiones import AlmacenSesiones
+from captcha_local import ReconocedorCaptcha
+from trazas import tramo
+from perfiles import PerfilChrome, USAR_PERFILES, precalentar
+from opciones_navegador import BLOQUEAR_RECURSOS, HEADLESS, bloquear_recursos, configurar_ventana
 
 
 load_dotenv()
 
+# Intentos de login antes de rendirse cuando el captcha es rechazado
+MAX_INTENTOS_LOGIN = 3
+
+# Raíz del sitio; se cambia para apuntar a simulador_sitios.py
+URL_AVICENA = os.getenv("AVICENA_URL", "https://avicena.colsanitas.com")
+
+
+def _websocket_disponible():
+    try:
+        import websocket
+        return True
+    except ImportError:
+        return False
+
+
 class AvicenaLogin:
-    def __init__(self, download_dir=None):
+    def __init__(self, download_dir=None, usar_cache_sesion=True, ranura_sesion=0, perfil_persistente=USAR_PERFILES,
+                 headless=HEADLESS, bloquear=BLOQUEAR_RECURSOS):
         """Inicializa el navegador para login en Avicena y cliente OpenAI"""
         chrome_options = Options()
-        chrome_options.add_argument("--start-maximized")
+        configurar_ventana(chrome_options, headless)
         chrome_options.add_argument("--disable-notifications")
-        chrome_options.set_capability(
-            "goog:loggingPrefs", {"performance": "ALL"}
-        )
+        # Sin websocket-client no hay escucha CDP: se recurre a los logs de rendimiento. Con
+        # él no se habilitan (chromedriver los acumula hasta leerlos, y no se leerían)
+        self.logs_rendimiento = not _websocket_disponible()
+        if self.logs_rendimiento:
+            chrome_options.set_capability(
+                "goog:loggingPrefs", {"performance": "ALL"}
+            )
         if download_dir:
             prefs = {
                 "download.default_directory": download_dir,
@@ -39,15 +67,29 @@ class AvicenaLogin:
             }
             chrome_options.add_experimental_option("prefs", prefs)
 
-        self.driver = webdriver.Chrome(options=chrome_options)
+        # Perfil persistente por worker: la caché HTTP evita bajar de nuevo el JS/CSS de la app
+        self.perfil = PerfilChrome("avicena", ranura_sesion, persistente=perfil_persistente)
+        self.perfil.aplicar(chrome_options)
+        try:
+            self.driver = webdriver.Chrome(options=chrome_options)
+        except Exception:
+            self.perfil.liberar()
+            raise
         self.driver.execute_cdp_cmd("Network.enable", {})
+        # Sin indicación explícita, los recursos pesados se bloquean solo en headless
+        self.bloquear = headless if bloquear is None else bloquear
+        if self.bloquear:
+            bloquear_recursos(self.driver, "avicena")
         self.wait = WebDriverWait(self.driver, 10)
+        self.escucha_red = EscuchaCDP(self.driver)
+        self.descargas = None
+        self.sesiones = AlmacenSesiones() if usar_cache_sesion else None
+        self.ranura_sesion = ranura_sesion
 
-        api_key = os.environ.get("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("No se encontró la API key de OpenAI en las variables de entorno")
-        self.openai_client = OpenAI(api_key=api_key)
+        self._openai_client = None
+        self.reconocedor_captcha = ReconocedorCaptcha()
 
+    @tramo("avicena.navegacion")
     def presionar_consultar_historia_clinica(self):
         try:
 
@@ -67,12 +109,16 @@ class AvicenaLogin:
             consultar_historia_btn.click()  # Hacer clic en el enlace
             print("✅ Historia Clínica Avicena abierta")
 
-            time.sleep(5)
+            self.wait.until(
+                EC.element_to_be_clickable((By.ID, "formPrerrequisitos:ctlTipoIdentificacion"))
+            )
+            return True
 
         except Exception as e:
             print(f"❌ Error al abrir Historia Clínica Avicena: {str(e)}")
+            return False
     
-    def seleccionar_tipo_identificacion(self):
+    def seleccionar_tipo_identificacion(self, valor_tipo="433"):
         try:
             select_element = self.wait.until(
                 EC.element_to_be_clickable((By.ID, "formPrerrequisitos:ctlTipoIdentificacion"))
@@ -80,13 +126,15 @@ class AvicenaLogin:
         
             select = Select(select_element)
             
-            select.select_by_value("433")
+            select.select_by_value(valor_tipo)
             
-            print("✅ 'Cédula de ciudadanía' seleccionada correctamente.")
+            print(f"✅ Tipo de identificación '{select.first_selected_option.text.strip()}' seleccionado correctamente.")
+            return True
         
         except Exception as e:
             print(f"❌ Error al seleccionar el tipo de identificación: {str(e)}")
             traceback.print_exc()
+            return False
 
     def ingresar_numero_documento(self, numero_documento="41389309"):
         try:
@@ -94,17 +142,24 @@ class AvicenaLogin:
                 EC.element_to_be_clickable((By.ID, "formPrerrequisitos:ctlNumeroDocumento"))
             )
             
+            # Limpiar el número de la búsqueda anterior
+            campo_documento.clear()
             campo_documento.send_keys(numero_documento)
             
             print(f"✅ Número de documento '{numero_documento}' ingresado correctamente.")
+            return True
         
         except Exception as e:
             print(f"❌ Error al ingresar el número de documento: {str(e)}")
             traceback.print_exc()
+            return False
 
+    @tramo("avicena.busqueda")
     def clic_buscar(self):
         """Hace clic en el botón 'Buscar'."""
         try:
+            # Resultado de una búsqueda anterior: hay que esperar a que se reemplace
+            previo = self.driver.find_elements(By.ID, "formPrerrequisitos:ctlFolios:0:sophiaBtn")
     
             boton_buscar = self.wait.until(
                 EC.element_to_be_clickable((By.ID, "formPrerrequisitos:buscar1"))
@@ -113,11 +168,20 @@ class AvicenaLogin:
             boton_buscar.click()
             
             print("✅ Botón 'Buscar' clickeado correctamente.")
+
+            if previo:
+                try:
+                    WebDriverWait(self.driver, 15).until(EC.staleness_of(previo[0]))
+                except TimeoutException:
+                    print("⚠️ El resultado de la búsqueda anterior no se actualizó")
+            return True
         
         except Exception as e:
             print(f"❌ Error al hacer clic en el botón 'Buscar': {str(e)}")
             traceback.print_exc()
+            return False
        
+    @tramo("avicena.seleccion_paciente")
     def clic_consultar_historia_sophia(self):
         """Hace clic en el botón de consultar historia clínica."""
         try:
@@ -128,24 +192,40 @@ class AvicenaLogin:
             boton_consultar.click()
             
             print("✅ Botón 'Consultar Historia Clínica' clickeado correctamente.")
+            return True
         
         except Exception as e:
             print(f"❌ Error al hacer clic en el botón 'Consultar Historia Clínica': {str(e)}")
             traceback.print_exc()
+            return False
 
     def cambiar_a_nueva_ventana(self):
         try:
-            time.sleep(2)
+            WebDriverWait(self.driver, 15).until(lambda d: len(d.window_handles) > 1)
 
             ventanas = self.driver.window_handles
             print(len(ventanas))
-            self.driver.switch_to.window(ventanas[1])
+            self.driver.switch_to.window(ventanas[-1])
             print("✅ Cambiado al contexto de la nueva ventana.")
+            if self.bloquear:
+                # Los bloqueos son por pestaña; el visor de folios carga después de este punto
+                bloquear_recursos(self.driver, "avicena")
+            return True
         
         except Exception as e:
             print(f"❌ Error al cambiar a la nueva ventana: {str(e)}")
             traceback.print_exc()
+            return False
+
+    def cerrar_ventanas_secundarias(self):
+        """Cierra las ventanas de historia abiertas y vuelve a la ventana principal"""
+        principal = self.driver.window_handles[0]
+        for ventana in self.driver.window_handles[1:]:
+            self.driver.switch_to.window(ventana)
+            self.driver.close()
+        self.driver.switch_to.window(principal)
         
+    @tramo("avicena.navegacion")
     def presionar_boton_regresar(self):
         """Método mejorado para hacer clic en el botón 'Regresar' con verificación de éxito"""
         max_intentos = 3
@@ -217,36 +297,65 @@ class AvicenaLogin:
             print(f"❌ Error al cargar el PDF #{indice}: {str(e)}")
             traceback.print_exc()
 
+    def _gestor_descargas(self):
+        """Gestor de descargas con una sesión HTTP keep-alive compartida por todo el login"""
+        if self.descargas is None:
+            self.descargas = GestorDescargas(self.driver)
+        return self.descargas
+
     def descargar_pdf_con_url(self, pdf_url, save_path):
         """Descarga un PDF directamente usando la URL proporcionada"""
         try:
             print(f"📥 Descargando PDF desde URL: {pdf_url}")
-            
-            # Construir sesión requests con cookies de Selenium
-            session = requests.Session()
-            for ck in self.driver.get_cookies():
-                session.cookies.set(ck["name"], ck["value"])
-            
-            # Hacer la petición y guardar el contenido
-            resp = session.get(pdf_url, stream=True, timeout=30)
-            resp.raise_for_status()
-            
-            # Guardar el PDF
-            with open(save_path, "wb") as f:
-                total_size = 0
-                for chunk in resp.iter_content(1024 * 50):
-                    f.write(chunk)
-                    total_size += len(chunk)
-            
-            print(f"✅ PDF descargado correctamente en: {save_path} (Tamaño: {total_size/1024:.2f} KB)")
-            return save_path
+            return self._gestor_descargas().encolar(pdf_url, save_path).result()
         except Exception as e:
             print(f"❌ Error al descargar PDF: {str(e)}")
             traceback.print_exc()
             raise
 
-    def obtener_url_pdf(self, timeout=20):
-        """Método mejorado para obtener la URL del PDF con registro de intentos y limpieza de logs"""
+    def esperar_url_pdf(self):
+        """
+        Registra la espera de la respuesta PDF en la pestaña actual.
+
+        Llamar antes del clic que abre el visor, para no perder la respuesta.
+        Retorna un Future, o None si la escucha CDP no está disponible.
+        """
+        try:
+            self.escucha_red.asegurar_ventana(self.driver.current_window_handle)
+            return self.escucha_red.esperar_respuesta("application/pdf")
+        except Exception as e:
+            print(f"⚠️ No se pudo escuchar la red por CDP: {str(e)}")
+            return None
+
+    @tramo("avicena.descarga_reporte")
+    def obtener_url_pdf(self, timeout=20, futuro=None):
+        """
+        Obtiene la URL del PDF a partir del evento Network.responseReceived.
+
+        `futuro` es el devuelto por esperar_url_pdf antes del clic; si no se pasa,
+        se empieza a escuchar en este momento.
+        """
+        if futuro is None:
+            futuro = self.esperar_url_pdf()
+        if futuro is None:
+            if not self.logs_rendimiento:
+                # Los logs de rendimiento no están habilitados: esperarlos solo agotaría el timeout
+                raise RuntimeError("La escucha CDP no está disponible y no hay logs de rendimiento de respaldo")
+            return self._obtener_url_pdf_de_logs(timeout)
+
+        print("🔍 Esperando la respuesta PDF por CDP...")
+        inicio = time.monotonic()
+        try:
+            respuesta = futuro.result(timeout=timeout)
+        except FutureTimeoutError:
+            futuro.cancel()
+            raise TimeoutError(f"No se recibió ninguna respuesta PDF después de {timeout}s")
+        url = respuesta["url"]
+        print(f"✅ URL de PDF recibida en {time.monotonic() - inicio:.2f}s: {url}")
+        return url
+
+    def _obtener_url_pdf_de_logs(self, timeout=20):
+        """Respaldo sin websocket-client: sondea los logs de rendimiento de Selenium"""
         print("🔍 Buscando URL del PDF en los logs de red...")
         
         # Limpiar logs anteriores para evitar confusiones
@@ -277,27 +386,55 @@ class AvicenaLogin:
         raise TimeoutError(f"No se encontró ninguna respuesta PDF después de {timeout}s y {intentos} intentos")
 
     def descargar_pdf_directo(self, save_path):
-        # 1) Extraer la URL desde el log
+        # 1) Obtener la URL de la respuesta PDF
         pdf_url = self.obtener_url_pdf()
 
-        # 2) Construir sesión requests con cookies de Selenium
-        session = requests.Session()
-        for ck in self.driver.get_cookies():
-            session.cookies.set(ck["name"], ck["value"])
+        # 2) Descargar con la sesión compartida del gestor
+        return self.descargar_pdf_con_url(pdf_url, save_path)
+
+    def _sesion_activa(self, driver):
+        """Sonda de sesión: la página cargada muestra el menú principal y no el formulario de ingreso"""
+        try:
+            WebDriverWait(driver, 5).until(EC.presence_of_element_located((By.ID, "formMenu")))
+        except TimeoutException:
+            return False
+        return not driver.find_elements(By.ID, "ctlFormLogin:idUserNameLogin")
+
+    def iniciar_sesion(self, usuario, password, valor_sucursal="29374"):
+        """
+        Deja el navegador en el menú principal de Avicena.
+
+        Reutiliza la sesión guardada si sigue vigente; si no, hace el login completo
+        (captcha, sucursal e ingreso) y guarda la nueva sesión.
+        """
+        if self.sesiones is not None and self.sesiones.restaurar(
+            self.driver, "avicena", usuario, self._sesion_activa, self.ranura_sesion
+        ):
+            return True
+
+        if not self.login(usuario, password):
+            return False
+        self.seleccionar_sucursal(valor_sucursal)
+        if not self.presionar_ingresar():
+            return False
 
-        # 3) Hacer la petición y guardar el contenido
-        resp = session.get(pdf_url, stream=True)
-        resp.raise_for_status()
-        with open(save_path, "wb") as f:
-            for chunk in resp.iter_content(1024 * 50):
-                f.write(chunk)
+        if self.sesiones is not None and self._sesion_activa(self.driver):
+            self.sesiones.guardar(self.driver, "avicena", usuario, self.ranura_sesion)
+        return True
 
-        print(f"✅ PDF descargado correctamente en: {save_path}")
-        return save_path
+    @tramo("avicena.precalentar")
+    def precalentar(self):
+        """Carga la página de ingreso antes de recibir trabajo, con la caché del perfil"""
+        return precalentar(self.driver, [f"{URL_AVICENA}/His/login.seam"])
 
-    def login(self, usuario, password):
-        print(f"🔑 Iniciando sesión en Avicena con usuario: {usuario}")
-        self.driver.get("https://avicena.colsanitas.com/His/login.seam")
+    @tramo("avicena.login")
+    def login(self, usuario, password, intento=1, omitir_local=False):
+        print(f"🔑 Iniciando sesión en Avicena con usuario: {usuario} (intento {intento}/{MAX_INTENTOS_LOGIN})")
+        if intento == 1:
+            # Un login completo parte sin las cookies que el perfil persistente haya guardado
+            self.driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        # Cada intento carga la página de nuevo para tener un captcha nuevo
+        self.driver.get(f"{URL_AVICENA}/His/login.seam")
 
         try:
             usuario_input = self.wait.until(
@@ -308,19 +445,14 @@ class AvicenaLogin:
             usuario_input.send_keys(usuario)
             password_input.send_keys(password)
 
-            print("🤖 Resolviendo captcha con OpenAI...")
-            captcha_value = self._resolver_captcha_con_openai()
-
-            if not captcha_value:
-                print("❌ No se pudo resolver el captcha automáticamente")
-
-                captcha_value = self._resolver_captcha_manual()
+            captcha_path = self._capturar_captcha()
+            captcha_value, fuente = self._resolver_captcha(captcha_path, omitir_local)
 
             if not captcha_value:
                 print("❌ No se ingresó el captcha")
                 return False
 
-            print(f"✅ Captcha resuelto: {captcha_value}")
+            print(f"✅ Captcha resuelto ({fuente}): {captcha_value}")
 
             captcha_input = self.driver.find_element(By.ID, "ctlFormLogin:idCodSegCaptcha")
             captcha_input.send_keys(captcha_value)
@@ -333,16 +465,26 @@ class AvicenaLogin:
                     EC.presence_of_element_located((By.ID, "ctlFormLogin:botonValidar"))
                 )
                 print("✅ Inicio de sesión exitoso")
+                if fuente != "local":
+                    # El código fue aceptado: sirve como ejemplo etiquetado para el reconocedor local.
+                    # Un fallo al entrenar no debe hacer fallar un login que ya se aceptó
+                    try:
+                        self.reconocedor_captcha.registrar(captcha_path, captcha_value)
+                    except Exception as e:
+                        print(f"⚠️ No se pudo agregar el captcha al entrenamiento: {str(e)}")
                 return True
             except TimeoutException:
                 try:
                     error_msg = self.driver.find_element(By.CLASS_NAME, "mensajeErrorLogin").text
                     print(f"❌ Error en el inicio de sesión: {error_msg}")
 
-                    if "captcha" in error_msg.lower():
+                    if "captcha" in error_msg.lower() and intento < MAX_INTENTOS_LOGIN:
                         print("🔄 Reintentando con un nuevo captcha...")
-                        return self.login(usuario, password)
-                except:
+                        # Una lectura local rechazada no se repite: el resto de intentos
+                        # va a OpenAI o a mano, para no agotarlos y bloquear la cuenta
+                        return self.login(usuario, password, intento + 1,
+                                          omitir_local or fuente == "local")
+                except NoSuchElementException:
                     print("❌ Error en el inicio de sesión: Tiempo de espera excedido")
                 return False
 
@@ -350,19 +492,58 @@ class AvicenaLogin:
             print(f"❌ Error en el formulario de login: {str(e)}")
             return False
 
-    def _resolver_captcha_con_openai(self):
-
-        try:
-            captcha_img = self.driver.find_element(By.XPATH, "//img[contains(@id, 'ctlFormLogin:j_id')]")
+    def _capturar_captcha(self):
+        """Guarda la imagen del captcha tal como se ve en pantalla y retorna su ruta"""
+        captcha_img = self.driver.find_element(By.XPATH, "//img[contains(@id, 'ctlFormLogin:j_id')]")
 
-            captcha_path = os.path.join(tempfile.gettempdir(), "captcha.png")
-            captcha_img.screenshot(captcha_path)
+        # Un archivo por navegador: varios procesos pueden estar iniciando sesión a la vez
+        captcha_path = os.path.join(tempfile.gettempdir(), f"captcha_{os.getpid()}_{id(self)}.png")
+        captcha_img.screenshot(captcha_path)
 
-            print(f"🔍 Captcha guardado en: {captcha_path}")
+        print(f"🔍 Captcha guardado en: {captcha_path}")
+        return captcha_path
+
+    @tramo("avicena.captcha")
+    def _resolver_captcha(self, captcha_path, omitir_local=False):
+        """
+        Lee el captcha primero con el reconocedor local; si no hay lectura confiable
+        (o `omitir_local`, porque el sitio ya rechazó una lectura local) recurre a
+        OpenAI y por último a la entrada manual. Retorna (valor, fuente).
+        """
+        inicio = time.perf_counter()
+        captcha_value = None if omitir_local else self.reconocedor_captcha.reconocer(captcha_path)
+        if captcha_value:
+            print(f"🧠 Captcha leído localmente en {(time.perf_counter() - inicio) * 1000:.0f} ms")
+            return captcha_value, "local"
+
+        print("🤖 Resolviendo captcha con OpenAI...")
+        captcha_value = self._resolver_captcha_con_openai(captcha_path)
+        if captcha_value:
+            return captcha_value, "openai"
+
+        print("❌ No se pudo resolver el captcha automáticamente")
+        return self._resolver_captcha_manual(captcha_path), "manual"
+
+    @property
+    def openai_client(self):
+        """Cliente de OpenAI, creado solo si el reconocedor local no alcanza"""
+        if self._openai_client is None:
+            api_key = os.environ.get("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("No se encontró la API key de OpenAI en las variables de entorno")
+            self._openai_client = OpenAI(api_key=api_key)
+        return self._openai_client
+
+    @tramo("avicena.llm")
+    def _resolver_captcha_con_openai(self, captcha_path):
 
-            self._mejorar_imagen_captcha(captcha_path)
+        try:
+            # El realce se hace sobre una copia: la original queda para el entrenamiento local
+            mejorada_path = os.path.splitext(captcha_path)[0] + "_openai.png"
+            shutil.copyfile(captcha_path, mejorada_path)
+            self._mejorar_imagen_captcha(mejorada_path)
 
-            with open(captcha_path, "rb") as image_file:
+            with open(mejorada_path, "rb") as image_file:
                 base64_image = base64.b64encode(image_file.read()).decode('utf-8')
 
             response = self.openai_client.chat.completions.create(
@@ -411,21 +592,17 @@ class AvicenaLogin:
         except Exception as e:
             print(f"⚠️ Error al mejorar imagen: {str(e)}")
 
-    def _resolver_captcha_manual(self):
+    def _resolver_captcha_manual(self, captcha_path):
         
-        captcha_img = self.driver.find_element(By.XPATH, "//img[contains(@id, 'ctlFormLogin:j_id')]")
-
-        captcha_path = os.path.join(tempfile.gettempdir(), "captcha.png")
-        captcha_img.screenshot(captcha_path)
-
         print(f"🔍 Captcha guardado en: {captcha_path}")
         print("⚠️ Resolución automática falló. Por favor, abre esta imagen y revisa el código del captcha")
 
         captcha_value = input("📝 Ingresa el código del captcha que ves en la imagen: ")
 
-        return captcha_value
+        return captcha_value.strip()
 
     
+    @tramo("avicena.navegacion")
     def seleccionar_sucursal(self, valor_sucursal="29374"):
         print(f"🔄 Seleccionando sucursal con valor: {valor_sucursal}")
         try:
@@ -449,6 +626,7 @@ class AvicenaLogin:
             raise
 
 
+    @tramo("avicena.navegacion")
     def presionar_ingresar(self, retries=3, delay=0.5):
 
         print("🔄 Ejecutando la función presionar_ingresar...")
@@ -505,17 +683,39 @@ class AvicenaLogin:
     def cerrar(self):
         """Cierra el navegador"""
         try:
+            if self.descargas is not None:
+                self.descargas.cerrar()
+            self.escucha_red.detener()
             self.driver.quit()
             print("✅ Navegador cerrado correctamente")
         except Exception as e:
             print(f"⚠️ Error al cerrar el navegador: {str(e)}")
+        finally:
+            self.perfil.liberar()
             
-    def descargar_multiples_historias(self, cantidad=3):
-        """Descarga múltiples historias clínicas en secuencia"""
-        download_dir = os.path.join(os.getcwd(), "descargas")
+    def contar_folios(self):
+        """Número de folios en la tabla form:ctlFolios, en una sola llamada JS"""
+        WebDriverWait(self.driver, 15).until(
+            EC.presence_of_element_located((By.ID, "form:ctlFolios"))
+        )
+        return self.driver.execute_script(
+            "return document.querySelectorAll('[id^=\"form:ctlFolios:\"][id$=\":verhcSophia\"]').length;"
+        )
+
+    def descargar_multiples_historias(self, cantidad=None, download_dir=None):
+        """
+        Recorre las historias clínicas del listado y encola la descarga de cada PDF;
+        las descargas avanzan en segundo plano mientras se navega a la siguiente.
+
+        Sin `cantidad` se descargan todos los folios de la tabla.
+        """
+        download_dir = download_dir or os.path.join(os.getcwd(), "descargas")
         os.makedirs(download_dir, exist_ok=True)
         
-        pdfs_descargados = []
+        gestor = self._gestor_descargas()
+        if cantidad is None:
+            cantidad = self.contar_folios()
+            print(f"📚 {cantidad} folios en la historia clínica")
         
         for i in range(cantidad):
             try:
@@ -543,49 +743,101 @@ class AvicenaLogin:
                 self.driver.execute_script("arguments[0].scrollIntoView(true);", boton)
                 time.sleep(2)  # Esperar después del scroll
                 
+                # Escuchar la respuesta PDF antes del clic para no perderla
+                futuro_pdf = self.esperar_url_pdf()
+
                 # Hacer clic en el botón
                 boton.click()
                 print(f"✅ Clic en botón {boton_id} realizado.")
                 
-                # Esperar a que el visor PDF se cargue completamente
-                print("⏳ Esperando a que el visor PDF se cargue completamente...")
+                # Esperar a que el visor PDF se cargue
+                print("⏳ Esperando a que el visor PDF se cargue...")
                 WebDriverWait(self.driver, 15).until(
                     EC.presence_of_element_located((By.ID, "form:botonVolver"))
                 )
-                time.sleep(7)  # Tiempo ampliado para asegurar carga completa del PDF
                 
                 # IMPORTANTE: Obtener la URL del PDF SOLO UNA VEZ y usarla directamente
                 try:
-                    pdf_url = self.obtener_url_pdf(timeout=20)
+                    pdf_url = self.obtener_url_pdf(timeout=20, futuro=futuro_pdf)
                     print(f"✅ URL de PDF encontrada: {pdf_url}")
                     
-                    # Descargar el PDF DIRECTAMENTE usando la URL que ya tenemos
-                    self.descargar_pdf_con_url(pdf_url, pdf_path)
-                    
-                    # Verificar que el archivo existe y no tiene tamaño cero
-                    if os.path.exists(pdf_path) and os.path.getsize(pdf_path) > 0:
-                        print(f"✅ PDF #{i+1} descargado correctamente: {pdf_path}")
-                        pdfs_descargados.append(pdf_path)
-                    else:
-                        print(f"⚠️ El archivo PDF #{i+1} no se descargó correctamente o está vacío")
+                    # Encolar la descarga; el gestor la valida al terminar
+                    gestor.encolar(pdf_url, pdf_path)
                 except Exception as e:
-                    print(f"❌ Error al descargar PDF #{i+1}: {str(e)}")
+                    print(f"❌ Error al obtener la URL del PDF #{i+1}: {str(e)}")
                     traceback.print_exc()
                 
                 # Presionar el botón "Regresar" para volver a la lista
                 print("⏳ Presionando botón Regresar...")
                 self.presionar_boton_regresar()
                 
-                # Esperar tiempo suficiente para que se cierre el modal y se actualice la interfaz
-                print("⏳ Esperando a que la interfaz se actualice completamente...")
-                time.sleep(5)  # Tiempo entre descargas
-                
             except Exception as e:
                 print(f"❌ Error al procesar historia clínica #{i+1}: {str(e)}")
                 traceback.print_exc()
-                
+        
+        print(f"⏳ Esperando {len(gestor.pendientes())} descargas pendientes...")
+        with tramo("avicena.descarga_pdf", folios=cantidad):
+            pdfs_descargados = gestor.esperar_todas()
+        print(f"✅ {len(pdfs_descargados)}/{cantidad} PDFs descargados correctamente")
         return pdfs_descargados
 
+    @tramo("avicena.paciente")
+    def procesar_documento(self, tipo, numero, download_dir):
+        """
+        Busca un paciente por tipo y número de documento con la sesión ya iniciada,
+        descarga todos sus folios en `download_dir` y vuelve a la búsqueda.
+
+        Retorna un dict con el resultado y el tiempo de cada etapa.
+        """
+        resultado = {"tipo": tipo, "numero": numero, "pdfs": [], "ok": False, "error": ""}
+        tiempos = {}
+        inicio = marca = time.monotonic()
+
+        def etapa(nombre):
+            nonlocal marca
+            ahora = time.monotonic()
+            tiempos[nombre] = round(ahora - marca, 2)
+            marca = ahora
+
+        try:
+            # Si el formulario de búsqueda sigue abierto no hace falta volver al menú
+            if not self.driver.find_elements(By.ID, "formPrerrequisitos:ctlNumeroDocumento"):
+                if not self.presionar_consultar_historia_clinica():
+                    raise RuntimeError("No se pudo abrir la consulta de historia clínica")
+            if not (self.seleccionar_tipo_identificacion(tipo)
+                    and self.ingresar_numero_documento(numero)
+                    and self.clic_buscar()):
+                raise RuntimeError("No se pudo buscar el documento")
+            etapa("busqueda")
+
+            if not (self.clic_consultar_historia_sophia() and self.cambiar_a_nueva_ventana()):
+                raise RuntimeError("Documento sin historia clínica o no se abrió el visor")
+            etapa("apertura")
+
+            folios = self.contar_folios()
+            print(f"📚 {folios} folios en la historia clínica")
+            resultado["pdfs"] = self.descargar_multiples_historias(cantidad=folios, download_dir=download_dir)
+            etapa("descarga")
+            # Solo es exitoso si bajó un PDF por cada folio de la tabla
+            if not folios:
+                raise RuntimeError("La historia clínica no tiene folios")
+            if len(resultado["pdfs"]) < folios:
+                raise RuntimeError(f"Solo se descargaron {len(resultado['pdfs'])} de {folios} folios")
+            resultado["ok"] = True
+        except Exception as e:
+            resultado["error"] = str(e)[:200]
+            print(f"❌ Error procesando documento {tipo} {numero}: {resultado['error']}")
+        finally:
+            try:
+                self.cerrar_ventanas_secundarias()
+            except Exception as e:
+                print(f"⚠️ No se pudo volver a la ventana principal: {str(e)}")
+
+        resultado["segundos"] = round(time.monotonic() - inicio, 2)
+        resultado["tiempos"] = tiempos
+        print(f"⏱️ Documento {tipo} {numero}: {len(resultado['pdfs'])} PDFs en {resultado['segundos']}s {tiempos}")
+        return resultado
+
 
 
 if __name__ == "__main__":
@@ -595,10 +847,12 @@ if __name__ == "__main__":
     PASSWORD = os.environ.get("AVICENA_PASSWORD")
     API_KEY  = os.environ.get("OPENAI_API_KEY")
 
-    if not (USUARIO and PASSWORD and API_KEY):
+    if not (USUARIO and PASSWORD):
         print("❌ Faltan variables de entorno. Asegúrate de tener en .env:")
-        print("   AVICENA_USUARIO, AVICENA_PASSWORD, OPENAI_API_KEY")
+        print("   AVICENA_USUARIO, AVICENA_PASSWORD (y OPENAI_API_KEY como respaldo del captcha)")
         exit(1)
+    if not API_KEY:
+        print("⚠️ Sin OPENAI_API_KEY: los captchas que no se lean localmente se pedirán por consola")
 
     download_dir = os.path.join(os.getcwd(), "descargas")
     os.makedirs(download_dir, exist_ok=True)
@@ -607,12 +861,10 @@ if __name__ == "__main__":
     try:
         avicena = AvicenaLogin(download_dir=download_dir)
 
-        if not avicena.login(USUARIO, PASSWORD):
+        if not avicena.iniciar_sesion(USUARIO, PASSWORD, "29374"):
             print("❌ Falló el inicio de sesión. Saliendo.")
             exit(1)
 
-        avicena.seleccionar_sucursal("29374")
-        avicena.presionar_ingresar()
         avicena.presionar_consultar_historia_clinica()
         avicena.seleccionar_tipo_identificacion()
         avicena.ingresar_numero_documento("41389309")
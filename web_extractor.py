@@ -14,14 +14,46 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 import re
+from sesiones import AlmacenSesiones
+from capturas import BufferCapturas, CAPTURAS_DEBUG
+from trazas import tramo
+from opciones_navegador import BLOQUEAR_RECURSOS, HEADLESS, TAMANO_VENTANA, bloquear_recursos
+
+# Primera celda (nombre) de cada fila del listado de pacientes
+_JS_LISTA_PACIENTES = """
+var filas = document.querySelectorAll('datatable-row-wrapper');
+var pacientes = [];
+for (var i = 0; i < filas.length; i++) {
+    var celda = filas[i].querySelector('datatable-body-cell');
+    var nombre = celda ? celda.innerText.trim() : '';
+    if (nombre) { pacientes.push({index: i, nombre: nombre}); }
+}
+return pacientes;
+"""
+
+# Celda del paciente cuyo nombre (en minúsculas, sin comas) contiene el buscado
+_JS_CELDA_PACIENTE = """
+var buscado = arguments[0];
+var filas = document.querySelectorAll('datatable-row-wrapper');
+for (var i = 0; i < filas.length; i++) {
+    var celda = filas[i].querySelector('datatable-body-cell');
+    if (!celda) { continue; }
+    var texto = celda.innerText.toLowerCase().replace(/,/g, '').trim();
+    if (texto.indexOf(buscado) !== -1) { return celda; }
+}
+return null;
+"""
 
 class HistoriasClinicasExtractor:
-    def __init__(self, output_folder="datos_extraidos"):
+    def __init__(self, output_folder="datos_extraidos", usar_cache_sesion=True, capturas_debug=CAPTURAS_DEBUG,
+                 headless=HEADLESS, bloquear=BLOQUEAR_RECURSOS):
         print("🔄 Inicializando el extractor de historias clínicas...")
         
         # Configurar opciones de Chrome
         options = uc.ChromeOptions()
-        options.add_argument("--window-size=1920,1080")
+        options.add_argument(f"--window-size={TAMANO_VENTANA}")
+        if headless:
+            options.add_argument("--headless=new")
         options.add_argument("--disable-notifications")
         options.add_argument("--no-sandbox")
         options.add_argument("--disable-dev-shm-usage")
@@ -30,11 +62,17 @@ class HistoriasClinicasExtractor:
         try:
             self.driver = uc.Chrome(options=options)
             print("✅ Navegador inicializado correctamente")
+            # Sin indicación explícita, los recursos pesados se bloquean solo en headless
+            if headless if bloquear is None else bloquear:
+                bloquear_recursos(self.driver, "extractor")
         except Exception as e:
             print(f"❌ Error al inicializar el navegador: {str(e)}")
             raise e
             
         self.wait = WebDriverWait(self.driver, 10)
+        self.sesiones = AlmacenSesiones() if usar_cache_sesion else None
+        # Capturas de diagnóstico solo si se piden; se escriben a disco únicamente ante un fallo
+        self.capturas = BufferCapturas(activo=capturas_debug)
         
         # Configurar rutas de salida
         self.output_folder = output_folder
@@ -55,16 +93,28 @@ class HistoriasClinicasExtractor:
             "PSA", "Presion_Arterial", "Diagnostico", "Tratamiento"
         ])
     
+    def _sesion_activa(self, driver):
+        """Sonda de sesión: la URL guardada del panel carga sin redirigir al login"""
+        try:
+            WebDriverWait(driver, 5).until(lambda d: d.execute_script("return document.readyState") == "complete")
+        except Exception:
+            return False
+        return "panel" in driver.current_url and not driver.find_elements(By.CSS_SELECTOR, "input[type='password']")
+
+    @tramo("extractor.login")
     def login(self, email, password):
+        if self.sesiones is not None and self.sesiones.restaurar(
+            self.driver, "programahistoriasclinicas", email, self._sesion_activa
+        ):
+            return True
+
         print(f"🔑 Iniciando sesión con usuario: {email}")
         try:
             # Abrir la página
             self.driver.get("https://programahistoriasclinicas.com/")
             time.sleep(3)  # Esperamos más tiempo para que cargue completamente
             
-            # Tomar captura de pantalla de diagnóstico
-            self.driver.save_screenshot("login_page.png")
-            print(f"📸 Captura de pantalla guardada en login_page.png")
+            self.capturas.capturar(self.driver, "login_page")
             
             # Intentar encontrar el botón de iniciar sesión de diferentes maneras
             try:
@@ -110,9 +160,7 @@ class HistoriasClinicasExtractor:
             
             time.sleep(3)
             
-            # Tomar otra captura para ver la página de login
-            self.driver.save_screenshot("login_form.png")
-            print(f"📸 Captura de pantalla guardada en login_form.png")
+            self.capturas.capturar(self.driver, "login_form")
             
             # Completar formulario de login (con más robustez)
             try:
@@ -184,31 +232,35 @@ class HistoriasClinicasExtractor:
                 time.sleep(3)
                 
                 # Verificar si el login fue exitoso
-                self.driver.save_screenshot("post_login.png")
-                print(f"📸 Captura de pantalla guardada en post_login.png")
+                self.capturas.capturar(self.driver, "post_login")
                 
                 # Verificar si estamos en la página principal
                 if "panel" in self.driver.current_url:
                     print("✅ Sesión iniciada correctamente")
+                    if self.sesiones is not None:
+                        self.sesiones.guardar(self.driver, "programahistoriasclinicas", email)
+                    self.capturas.descartar()
                     return True
                 else:
                     print("⚠️ URL después del login no contiene 'panel'. URL actual:", self.driver.current_url)
+                    self.capturas.volcar("login")
                     return False
                 
             except Exception as e:
                 print(f"❌ Error al completar el formulario de login: {str(e)}")
+                self.capturas.volcar("login")
                 return False
                 
         except Exception as e:
             print(f"❌ Error al iniciar sesión: {str(e)}")
+            self.capturas.volcar("login")
             return False
     
+    @tramo("extractor.navegacion")
     def ir_a_pacientes(self):
         print("👥 Navegando a la sección de pacientes...")
         try:
-            # Tomar captura para diagnóstico
-            self.driver.save_screenshot("dashboard.png")
-            print(f"📸 Captura de pantalla guardada en dashboard.png")
+            self.capturas.capturar(self.driver, "dashboard")
             
             # Esperar a que cargue completamente la página
             time.sleep(3)
@@ -270,9 +322,7 @@ class HistoriasClinicasExtractor:
             # Esperar a que cargue la página de pacientes
             time.sleep(3)
             
-            # Tomar captura para ver si cargó correctamente
-            self.driver.save_screenshot("pacientes_page.png")
-            print(f"📸 Captura de pantalla guardada en pacientes_page.png")
+            self.capturas.capturar(self.driver, "pacientes_page")
             
             # Verificar si la página de pacientes cargó correctamente
             # Buscar elementos típicos de la página de pacientes
@@ -299,33 +349,29 @@ class HistoriasClinicasExtractor:
                 print("🔄 Intentando navegar directamente a la URL de pacientes...")
                 self.driver.get("https://programahistoriasclinicas.com/panel/pacientes")
                 time.sleep(3)
-                self.driver.save_screenshot("direct_pacientes.png")
+                self.capturas.capturar(self.driver, "direct_pacientes")
                 
                 # Verificar si funcionó
                 if "pacientes" in self.driver.current_url.lower():
                     print("✅ Navegación directa exitosa")
                     return True
                 else:
+                    self.capturas.volcar("ir_a_pacientes")
                     return False
             except:
+                self.capturas.volcar("ir_a_pacientes")
                 return False
     
+    @tramo("extractor.listado")
     def obtener_lista_pacientes(self):
         print("📋 Obteniendo lista de pacientes desde el HTML...")
         lista_pacientes = []
         try:
             self.wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "datatable-row-wrapper")))
-            filas = self.driver.find_elements(By.CSS_SELECTOR, "datatable-row-wrapper")
-
-            for index, fila in enumerate(filas):
-                try:
-                    celda = fila.find_element(By.CSS_SELECTOR, "datatable-body-cell")
-                    nombre = celda.text.strip()
-                    if nombre:
-                        lista_pacientes.append({"index": index, "nombre": nombre})
-                        print(f"✅ Paciente encontrado: {nombre}")
-                except Exception as e:
-                    print(f"⚠️ Error leyendo fila {index}: {str(e)}")
+            # Todas las filas en una sola llamada, en lugar de una consulta por celda
+            lista_pacientes = self.driver.execute_script(_JS_LISTA_PACIENTES) or []
+            for paciente in lista_pacientes:
+                print(f"✅ Paciente encontrado: {paciente['nombre']}")
 
             print(f"✅ Total pacientes encontrados: {len(lista_pacientes)}")
             return lista_pacientes
@@ -353,6 +399,7 @@ class HistoriasClinicasExtractor:
             print(f"❌ Error al crear cliente OpenAI: {str(e)}")
             return None
 
+    @tramo("extractor.paciente")
     def procesar_paciente(self, paciente_info, credenciales=None):
         """
         Procesa la información de un paciente.
@@ -361,6 +408,16 @@ class HistoriasClinicasExtractor:
             paciente_info: Información del paciente (dict o índice)
             credenciales: Tupla opcional (email, password) para reinicios de sesión
         """
+        resultado = self._procesar_paciente(paciente_info, credenciales)
+        # Las capturas del paciente solo interesan si falló
+        if resultado:
+            self.capturas.descartar()
+        else:
+            indice = paciente_info.get('index', 0) if isinstance(paciente_info, dict) else paciente_info
+            self.capturas.volcar(f"paciente_{indice}")
+        return resultado
+
+    def _procesar_paciente(self, paciente_info, credenciales=None):
         if isinstance(paciente_info, dict):
             paciente_index = paciente_info.get('index', 0)
             nombre_paciente = paciente_info.get('nombre', f"Paciente #{paciente_index+1}")
@@ -371,34 +428,28 @@ class HistoriasClinicasExtractor:
         print(f"\U0001F464 Procesando paciente: {nombre_paciente}...")
 
         try:
-            self.driver.save_screenshot(f"pre_click_paciente_{paciente_index}.png")
+            self.capturas.capturar(self.driver, "pre_click_paciente")
             clicked = False
 
             # MÉTODO: Clic por contenido HTML
             try:
                 print("🔍 Buscando fila del paciente por HTML...")
                 nombre_limpio = nombre_paciente.lower().replace(",", "").strip()
-                filas = self.driver.find_elements(By.CSS_SELECTOR, "datatable-row-wrapper")
-                for fila in filas:
-                    try:
-                        celda = fila.find_element(By.CSS_SELECTOR, "datatable-body-cell")
-                        texto = celda.text.lower().replace(",", "").strip()
-                        if nombre_limpio in texto:
-                            self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", celda)
-                            time.sleep(1)
-                            celda.click()
-                            print(f"✅ Clic exitoso sobre {texto}")
-                            clicked = True
-                            break
-                    except Exception as e:
-                        print(f"⚠️ Error leyendo celda: {str(e)}")
+                # La fila se busca por nombre en el navegador, así no importa si el listado cambió de orden
+                celda = self.driver.execute_script(_JS_CELDA_PACIENTE, nombre_limpio)
+                if celda is not None:
+                    self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", celda)
+                    time.sleep(1)
+                    celda.click()
+                    print(f"✅ Clic exitoso sobre {nombre_paciente}")
+                    clicked = True
                 
                 if not clicked:
                     print("❌ No se pudo hacer clic en el paciente por HTML")
                     return False
 
                 time.sleep(3)
-                self.driver.save_screenshot(f"post_click_paciente_{paciente_index}.png")
+                self.capturas.capturar(self.driver, "post_click_paciente")
 
                 # Ir a pestaña de Consultas H.Clínica
                 print("🔍 Buscando el tab de Consultas H.Clínica por texto y rol...")
@@ -409,7 +460,7 @@ class HistoriasClinicasExtractor:
                 print("✅ Tab Consultas H.Clínica clickeado")
 
                 time.sleep(3)
-                self.driver.save_screenshot(f"consultas_tab_{paciente_index}.png")
+                self.capturas.capturar(self.driver, "consultas_tab")
 
                 # Procesar sección 'Más' y 'Imprimir Histórico'
                 print("🔍 Buscando botón 'Más'")
@@ -428,7 +479,7 @@ class HistoriasClinicasExtractor:
                 print("✅ Opción 'Imprimir Histórico' clicada")
 
                 time.sleep(3)
-                self.driver.save_screenshot(f"post_imprimir_{paciente_index}.png")
+                self.capturas.capturar(self.driver, "post_imprimir")
 
                 # MANEJO DE VENTANAS Y PROCESO DE EXTRACCIÓN
                 window_handles_count = len(self.driver.window_handles)
@@ -445,28 +496,7 @@ class HistoriasClinicasExtractor:
                     # Dar tiempo para que cargue completamente el PDF
                     time.sleep(5)
                     
-                    # Tomar capturas de cada página del PDF (si hay múltiples páginas)
-                    screenshot_paths = []
-                    
-                    # Capturar primera página
-                    pdf_screenshot_path = f"pdf_tab_{paciente_index}_p1.png"
-                    self.driver.save_screenshot(pdf_screenshot_path)
-                    screenshot_paths.append(pdf_screenshot_path)
-                    print(f"📸 Captura del PDF guardada: {pdf_screenshot_path}")
-                    
-                    # Probar si hay un botón para la siguiente página
-                    try:
-                        next_page_buttons = self.driver.find_elements(By.CSS_SELECTOR, ".next-button, .nextButton, [title='Next Page'], [aria-label='Next page']")
-                        if next_page_buttons:
-                            for i in range(1, 4):  # Limitamos a 3 páginas adicionales para evitar bucles infinitos
-                                next_page_buttons[0].click()
-                                time.sleep(2)
-                                pdf_screenshot_path = f"pdf_tab_{paciente_index}_p{i+1}.png"
-                                self.driver.save_screenshot(pdf_screenshot_path)
-                                screenshot_paths.append(pdf_screenshot_path)
-                                print(f"📸 Captura de página adicional guardada: {pdf_screenshot_path}")
-                    except Exception as page_error:
-                        print(f"ℹ️ No se encontraron más páginas para capturar: {str(page_error)}")
+                    self.capturas.capturar(self.driver, "pdf_tab")
                     
                     # Intentar primero la extracción de texto
                     resultado = None
@@ -493,10 +523,13 @@ class HistoriasClinicasExtractor:
                     except Exception as text_error:
                         print(f"⚠️ Error extrayendo texto: {str(text_error)}")
                     
-                    # Si no tenemos resultado con texto, usar la imagen
-                    if not resultado and screenshot_paths:
+                    # Si no tenemos resultado con texto, usar la imagen de la primera página
+                    # (solo entonces se toma la captura: con texto no hace falta)
+                    if not resultado:
+                        pdf_screenshot_path = f"pdf_tab_{paciente_index}_p1.png"
+                        self.driver.save_screenshot(pdf_screenshot_path)
                         print("🖼️ Intentando extraer información a partir de las imágenes...")
-                        resultado = self.extraer_info_por_imagen(screenshot_paths[0])  # Usamos la primera página
+                        resultado = self.extraer_info_por_imagen(pdf_screenshot_path)
                     
                     # Si tenemos resultado, guardarlo
                     if resultado:
@@ -546,7 +579,7 @@ class HistoriasClinicasExtractor:
                     except Exception as nav_error:
                         print(f"⚠️ Error al volver a la página de pacientes: {str(nav_error)}")
                     
-                    self.driver.save_screenshot(f"post_process_{paciente_index}.png")
+                    self.capturas.capturar(self.driver, "post_process")
                     print(f"✅ Procesamiento exitoso del paciente {nombre_paciente}")
                     return True
                 else:
@@ -572,6 +605,7 @@ class HistoriasClinicasExtractor:
                 pass
             return False
 
+    @tramo("extractor.extraccion_texto")
     def extraer_contenido_pdf_desde_navegador(self):
         """
         Intenta extraer el contenido de texto de un PDF abierto en el navegador 
@@ -657,6 +691,7 @@ class HistoriasClinicasExtractor:
             print(f"❌ Error general extrayendo texto del PDF: {str(e)}")
             return ""
 
+    @tramo("extractor.escritura_csv")
     def guardar_datos_paciente(self, paciente_dict):
         archivo = os.path.join("datos_extraidos", "pacientes.csv")
         campos = ["ID Paciente", "Nombre", "Edad", "Fecha"]
@@ -673,6 +708,7 @@ class HistoriasClinicasExtractor:
         except Exception as e:
             print(f"❌ Error guardando datos del paciente: {str(e)}")
 
+    @tramo("extractor.escritura_csv")
     def guardar_datos_consultas(self, lista_consultas):
         archivo = os.path.join("datos_extraidos", "consultas.csv")
         campos = [
@@ -693,6 +729,7 @@ class HistoriasClinicasExtractor:
         except Exception as e:
             print(f"❌ Error guardando consultas: {str(e)}")
 
+    @tramo("extractor.llm")
     def extraer_info_clinica_openai(self, pdf_text="", fallback_image_path=None):
         """
         Extrae información clínica usando OpenAI, procesando texto o imagen si es necesario.
@@ -820,6 +857,7 @@ class HistoriasClinicasExtractor:
                 },
                 "consultas": []
             }
+    @tramo("extractor.llm")
     def extraer_info_clinica_openai(self, pdf_text="", fallback_image_path=None):
         """
         Extrae información clínica usando OpenAI, procesando texto o imagen si es necesario.
@@ -4,21 +4,199 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC  
 from selenium.webdriver.chrome.options import Options  
 from dotenv import load_dotenv  
-import time, os, re, json, openai, base64
+import time, os, re, json, openai, base64, itertools
 import xml.etree.ElementTree as ET  
 from dicttoxml import dicttoxml
-import PyPDF2
 import requests
 from bs4 import BeautifulSoup
+from urllib.parse import urlparse
+from esperas import Esperas
+from escucha_cdp import EscuchaCDP
+from reporte_medifolios import html_a_lineas, normalizar_pagina_pdf, parsear_reporte_html, reporte_a_texto
+from extraccion_paralela import WORKERS_EXTRACCION, extraer_textos
+from extractores_pdf import BACKENDS, EXTRACTOR_PDF, obtener_backend
+from texto_pdf import texto_pdf
+from segmentacion import combinar_json, mapear_bloques, segmentar_texto
+from sesiones import AlmacenSesiones
+from manifiesto import Manifiesto
+from supervisor import navegador_responde
+from trazas import tramo
+from perfiles import PerfilChrome, USAR_PERFILES, precalentar
+from opciones_navegador import BLOQUEAR_RECURSOS, HEADLESS, bloquear_recursos, configurar_ventana
 
 # Cargar variables de entorno
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")  
 
+# Lee las historias listadas en el panel histórico: valor de cada casilla y texto de su fila
+_JS_HISTORIAS_PANEL = """
+var boton = document.getElementById('btnSeleccionarHistorias');
+var panel = boton ? boton.parentElement : null;
+while (panel && panel.querySelectorAll('input[type=checkbox]').length < 2 && panel !== document.body) {
+    panel = panel.parentElement;
+}
+if (!panel) { return []; }
+var historias = [];
+panel.querySelectorAll('input[type=checkbox]').forEach(function(casilla) {
+    if (casilla.id === 'btnSeleccionarHistorias') { return; }
+    var fila = casilla.closest('tr, li') || casilla.parentElement;
+    historias.push({
+        valor: casilla.value || casilla.id || '',
+        texto: (fila.innerText || '').replace(/\\s+/g, ' ').trim()
+    });
+});
+return historias;
+"""
+
+# Filas del listado de pacientes: ID (celda 1) y nombre (celda 3) desde el atributo title
+_JS_LISTADO_PACIENTES = """
+var botones = document.getElementsByClassName('btnCodPacienteListado');
+var pacientes = [];
+for (var i = 0; i < botones.length; i++) {
+    var fila = botones[i].closest('tr');
+    var celdas = fila ? fila.cells : [];
+    pacientes.push({
+        id: (celdas.length > 1 && celdas[1].getAttribute('title')) || 'Desconocido',
+        nombre: (celdas.length > 3 && celdas[3].getAttribute('title')) || 'Desconocido',
+        indice: i,
+        boton_id: botones[i].id || null
+    });
+}
+return pacientes;
+"""
+
+# Filas por página al recorrer listados paginados en el servidor
+TAMANO_PAGINA_LISTADO = 500
+
+# Tabla del listado si es un DataTable de jQuery; prepara la marca de fin de redibujado
+_JS_TABLA_LISTADO = """
+var boton = document.querySelector('.btnCodPacienteListado');
+var tabla = boton ? boton.closest('table') : document.querySelector('table.dataTable');
+if (!tabla || !window.jQuery || !jQuery.fn.dataTable || !jQuery.fn.dataTable.isDataTable(tabla)) {
+    return null;
+}
+window.__hcTablaListado = jQuery(tabla).DataTable();
+var info = window.__hcTablaListado.page.info();
+return {servidor: !!info.serverSide, paginas: info.pages, total: info.recordsDisplay};
+"""
+
+# Redibuja el DataTable con la operación indicada y marca cuando terminó (evento draw.dt)
+_JS_REDIBUJAR_LISTADO = """
+var dt = window.__hcTablaListado, operacion = arguments[0], valor = arguments[1];
+window.__hcDibujado = false;
+dt.one('draw.dt', function() { window.__hcDibujado = true; });
+if (operacion === 'largo') { dt.page.len(valor).draw(); }
+else if (operacion === 'pagina') { dt.page(valor).draw('page'); }
+else if (operacion === 'buscar') { dt.search(valor).draw(); }
+"""
+
+# Avanza la paginación genérica (sin DataTables); false si no hay página siguiente
+_JS_PAGINA_SIGUIENTE = """
+var siguiente = document.querySelector(
+    '.paginate_button.next:not(.disabled), li.next:not(.disabled) > a, a[rel=next], .pagination .next:not(.disabled) a'
+);
+if (!siguiente) { return false; }
+siguiente.scrollIntoView({block: 'center'});
+siguiente.click();
+return true;
+"""
+
+# Busca el botón del paciente por ID (o por el id del botón) y hace clic; false si no está.
+# El id del botón viene del índice (quizá de otra corrida o de otra página del listado):
+# solo se usa si su fila es la del paciente, si no se busca la fila por ID
+_JS_CLIC_PACIENTE = """
+var idPaciente = arguments[0], idBoton = arguments[1];
+var boton = idBoton ? document.getElementById(idBoton) : null;
+if (boton) {
+    var filaBoton = boton.closest('tr');
+    if (!filaBoton || filaBoton.cells.length < 2 || filaBoton.cells[1].getAttribute('title') !== idPaciente) {
+        boton = null;
+    }
+}
+if (!boton) {
+    var botones = document.getElementsByClassName('btnCodPacienteListado');
+    for (var i = 0; i < botones.length; i++) {
+        var fila = botones[i].closest('tr');
+        if (fila && fila.cells.length > 1 && fila.cells[1].getAttribute('title') === idPaciente) {
+            boton = botones[i];
+            break;
+        }
+    }
+}
+if (!boton) { return false; }
+boton.scrollIntoView({block: 'center'});
+boton.click();
+return true;
+"""
+
+RE_FECHA_HISTORIA = re.compile(r'(\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{4})')
+
+# Sufijo del reporte HTML nativo descargado del visor (evita chocar con el .html tabular generado)
+SUFIJO_REPORTE_HTML = "_reporte.html"
+
+# Lo que tiene todo reporte de historia y no tienen las páginas de error o de sesión vencida
+RE_MARCA_REPORTE = re.compile(rb'FECHA\s+(?:DE\s+)?ATENCI|IDENTIFICACI', re.IGNORECASE)
+
+# Caracteres por llamada al LLM; una historia más larga se parte en bloques de atenciones (ver segmentacion)
+MAX_CARACTERES_LLM = 12000  # Ajustar según el modelo
+
+OPCIONES_PRINT_TO_PDF = {
+    "landscape": False,
+    "displayHeaderFooter": False,
+    "printBackground": True,
+    "preferCSSPageSize": True,
+}
+
+# Bloque leído por IO.read al guardar un PDF impreso; fija la memoria por worker
+TAMANO_BLOQUE_STREAM = 1024 * 1024
+
+# Páginas por archivo al dividir historias muy largas con imprimir_por_partes
+PAGINAS_POR_PARTE_PDF = int(os.getenv("PAGINAS_POR_PARTE_PDF", "200"))
+
+# Portal de entrada y servidor de la aplicación; se cambian para apuntar a simulador_sitios.py
+URL_MEDIFOLIOS = os.getenv("MEDIFOLIOS_URL", "https://www.medifolios.net")
+URL_SERVIDOR_MEDIFOLIOS = os.getenv("MEDIFOLIOS_URL_SERVIDOR", "https://www.server0medifolios.net")
+_HOST_SERVIDOR_MEDIFOLIOS = urlparse(URL_SERVIDOR_MEDIFOLIOS).netloc.replace("www.", "", 1)
+
+
+def _volcar_stream_cdp(driver, stream, ruta, tamano_bloque=TAMANO_BLOQUE_STREAM):
+    """Copia un stream de CDP (IO.read) a `ruta` bloque a bloque; retorna los bytes escritos"""
+    escrito = 0
+    try:
+        with open(ruta, "wb") as f:
+            while True:
+                bloque = driver.execute_cdp_cmd("IO.read", {"handle": stream, "size": tamano_bloque})
+                datos = bloque.get("data", "")
+                if bloque.get("base64Encoded"):
+                    datos = base64.b64decode(datos)
+                else:
+                    datos = datos.encode("latin-1")
+                f.write(datos)
+                escrito += len(datos)
+                if bloque.get("eof"):
+                    break
+    finally:
+        try:
+            driver.execute_cdp_cmd("IO.close", {"handle": stream})
+        except Exception:
+            pass
+    return escrito
+
+
+def ruta_base_salida(ruta_documento):
+    """Ruta sin extensión usada para los .json/.xml/.html generados a partir de un documento"""
+    if ruta_documento.endswith(SUFIJO_REPORTE_HTML):
+        return ruta_documento[:-len(SUFIJO_REPORTE_HTML)]
+    return os.path.splitext(ruta_documento)[0]
+
+
 class HistoriasClinicasExtractor:
-    def __init__(self, output_dir="C:\\Users\\salos\\Downloads\\historia_clinica\\datos_medifolios"):
+    def __init__(self, output_dir="C:\\Users\\salos\\Downloads\\historia_clinica\\datos_medifolios", tiempos_espera=None,
+                 modo_descarga="directo", usar_cache_sesion=True, ranura_sesion=0, reanudar=False,
+                 incremental=False, perfil_persistente=USAR_PERFILES, headless=HEADLESS,
+                 bloquear=BLOQUEAR_RECURSOS, extractor_pdf=EXTRACTOR_PDF):
         chrome_options = Options()
-        chrome_options.add_argument("--start-maximized")
+        configurar_ventana(chrome_options, headless)
         chrome_options.add_argument("--disable-notifications")
         chrome_options.add_argument("--no-sandbox")
         chrome_options.add_argument("--disable-dev-shm-usage")
@@ -36,22 +214,92 @@ class HistoriasClinicasExtractor:
         
         self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
-        
-        self.driver = webdriver.Chrome(options=chrome_options)
+
+        # Perfil persistente por worker: la caché HTTP evita bajar de nuevo el JS/CSS de la app
+        self.perfil = PerfilChrome("medifolios", ranura_sesion, persistente=perfil_persistente)
+        self.perfil.aplicar(chrome_options)
+        try:
+            self.driver = webdriver.Chrome(options=chrome_options)
+        except Exception:
+            self.perfil.liberar()
+            raise
+        # Sin indicación explícita, los recursos pesados se bloquean solo en headless
+        if headless if bloquear is None else bloquear:
+            bloquear_recursos(self.driver, "medifolios")
         self.wait = WebDriverWait(self.driver, 10)
+
+        # Escucha de red por CDP para detectar inactividad; si no está disponible
+        # las esperas recurren a jQuery.active y al conteo de recursos
+        self.escucha_red = EscuchaCDP(self.driver)
+        try:
+            self.escucha_red.iniciar()
+        except Exception as e:
+            print(f"⚠️ Escucha de red CDP no disponible, se usará detección por JavaScript: {str(e)[:100]}")
+            self.escucha_red = None
+        self.esperas = Esperas(self.driver, tiempos=tiempos_espera, escucha_red=self.escucha_red)
+        
+        # "directo" descarga el reporte por HTTP; "impresion" lo abre en pestaña y lo imprime a PDF
+        self.modo_descarga = modo_descarga
+        self.sesion_http = None
+
+        # Sesión persistida entre ejecuciones; ranura_sesion separa la de cada worker
+        self.sesiones = AlmacenSesiones() if usar_cache_sesion else None
+        self.ranura_sesion = ranura_sesion
         
         # Lista para almacenar información sobre los PDFs descargados
         self.pdfs_info = []
 
+        # Si el navegador está en el listado de pacientes (y no en una ficha abierta);
+        # descargar_paciente vuelve al listado mientras sea False
+        self.en_listado = False
+
+        # Librería para extraer el texto de los PDFs (ver extractores_pdf)
+        self.extractor_pdf = extractor_pdf
+
+        # Avance de la corrida; con reanudar=True se omiten los pacientes ya completos.
+        # Con incremental=True solo se descargan los pacientes con historias nuevas
+        self.manifiesto = Manifiesto(self.output_dir)
+        self.incremental = incremental
+        self.reanudar = reanudar or incremental
+
+    def _sesion_activa(self, driver):
+        """Sonda de sesión: la página cargada muestra el menú principal y no el formulario de ingreso"""
+        try:
+            WebDriverWait(driver, 5).until(EC.presence_of_element_located((By.ID, "OpenMenuMedifolios")))
+        except Exception:
+            return False
+        return not driver.find_elements(By.ID, "txt_usuario_login")
+
+    @tramo("medifolios.precalentar")
+    def precalentar(self):
+        """Carga el esqueleto de la app antes de recibir trabajo; deja el navegador en el portal"""
+        return precalentar(self.driver, [URL_SERVIDOR_MEDIFOLIOS, URL_MEDIFOLIOS])
+
+    def _limpiar_cookies(self):
+        """Un login completo parte sin las cookies que el perfil persistente haya guardado"""
+        try:
+            self.driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        except Exception as e:
+            print(f"⚠️ No se pudieron borrar las cookies: {str(e)[:100]}")
+
+    @tramo("medifolios.login")
     def login(self, usuario, password):
+        if self.sesiones is not None and self.sesiones.restaurar(
+            self.driver, "medifolios", usuario, self._sesion_activa, self.ranura_sesion
+        ):
+            return True
+
         print(f"🔑 Iniciando sesión con usuario: {usuario}")
-        self.driver.get("https://www.medifolios.net")
+        self._limpiar_cookies()
+        if self.driver.current_url.rstrip("/") != URL_MEDIFOLIOS.rstrip("/"):
+            # Tras precalentar() el portal ya está cargado
+            self.driver.get(URL_MEDIFOLIOS)
 
         # Click en botón INGRESO
         try:
             # Usando el selector más específico según el HTML proporcionado
             ingreso_btn = self.wait.until(
-                EC.element_to_be_clickable((By.XPATH, "//a[contains(@href, 'server0medifolios.net') and contains(@class, 'block-menu')]"))
+                EC.element_to_be_clickable((By.XPATH, f"//a[contains(@href, '{_HOST_SERVIDOR_MEDIFOLIOS}') and contains(@class, 'block-menu')]"))
             )
             ingreso_btn.click()
             print("✅ Botón INGRESO clicado")
@@ -70,13 +318,17 @@ class HistoriasClinicasExtractor:
             login_btn.click()
             print("✅ Formulario de login enviado")
             
-            # Esperar a que cargue la página principal después del login
-            time.sleep(5)
+            # Esperar a que desaparezca el formulario y cargue la página principal
+            self.esperas.invisible((By.ID, "txt_usuario_login"), "login")
+            self.esperas.dom_listo("login")
+            if self.sesiones is not None:
+                self.sesiones.guardar(self.driver, "medifolios", usuario, self.ranura_sesion)
             return True
         except Exception as e:
             print(f"❌ Error en formulario de login: {str(e)}")
             return False
 
+    @tramo("medifolios.navegacion")
     def navegar_a_pacientes(self):
         try:
             # Click en menú Bienvenido (abre el menú)
@@ -85,7 +337,6 @@ class HistoriasClinicasExtractor:
             )
             menu_bienvenido.click()
             print("✅ Menú Bienvenido clicado")
-            time.sleep(3)
 
             # Click en Pacientes (según el selector HTML proporcionado)
             try:
@@ -103,10 +354,13 @@ class HistoriasClinicasExtractor:
                 )
                 pacientes_btn.click()
                 print("✅ Sección pacientes abierta (selector genérico)")
-            time.sleep(5)  # Esperar más tiempo para que cargue la sección de pacientes
+            # Esperar a que cargue la sección de pacientes
+            self.esperas.clickeable((By.CLASS_NAME, "btnListadoPacientes"), "menu")
+            self.esperas.red_inactiva("menu")
         except Exception as e:
             print(f"❌ Error navegando a pacientes: {str(e)}")
 
+    @tramo("medifolios.navegacion")
     def abrir_listado_pacientes(self):
         try:
             # Click en botón Listado Pacientes
@@ -115,7 +369,9 @@ class HistoriasClinicasExtractor:
             )
             listado_btn.click()
             print("✅ Listado de pacientes abierto")
-            time.sleep(5)  # Esperar a que cargue el listado completo
+            # Esperar a que cargue el listado completo
+            self.esperas.presente((By.CLASS_NAME, "btnCodPacienteListado"), "listado")
+            self.esperas.red_inactiva("listado")
         except Exception as e:
             print(f"❌ Error al abrir listado de pacientes: {str(e)}")
     
@@ -146,46 +402,165 @@ class HistoriasClinicasExtractor:
             print(f"⚠️ No se pudieron obtener datos del paciente: {str(e)}")
             return {"nombre": "Desconocido", "id": "Desconocido"}
     
-    def seleccionar_paciente_por_indice(self, indice=0):
-        """Selecciona un paciente del listado por su índice (0 es el primero)"""
+    def leer_listado_pacientes(self):
+        """
+        Lee todas las filas del listado en una sola llamada JS.
+
+        Retorna [{'id', 'nombre', 'indice', 'boton_id'}] en el orden actual del listado.
+        """
         try:
-            # Buscar todos los botones de editar pacientes
-            botones_editar = self.wait.until(
-                EC.presence_of_all_elements_located((By.CLASS_NAME, "btnCodPacienteListado"))
-            )
-            
-            if not botones_editar or len(botones_editar) <= indice:
-                print(f"⚠️ No hay suficientes pacientes en la lista (se encontraron {len(botones_editar)})")
+            self.esperas.presente((By.CLASS_NAME, "btnCodPacienteListado"), "listado")
+            pacientes = self.driver.execute_script(_JS_LISTADO_PACIENTES) or []
+            print(f"📋 Listado leído: {len(pacientes)} pacientes")
+            return pacientes
+        except Exception as e:
+            print(f"❌ Error al leer el listado de pacientes: {str(e)}")
+            return []
+
+    def _redibujar_listado(self, operacion, valor):
+        self.driver.execute_script(_JS_REDIBUJAR_LISTADO, operacion, valor)
+        self.esperas.hasta(lambda d: d.execute_script("return window.__hcDibujado === true;"),
+                           "listado", f"redibujar_{operacion}")
+
+    def _agregar_filas(self, indice, filas):
+        """Agrega al índice las filas nuevas (por ID) y retorna cuántas se agregaron"""
+        nuevas = 0
+        for fila in filas:
+            if fila["id"] != "Desconocido" and fila["id"] in indice:
+                continue
+            fila["indice"] = len(indice)
+            indice[fila["id"] if fila["id"] != "Desconocido" else f"sin_id_{len(indice)}"] = fila
+            nuevas += 1
+        return nuevas
+
+    @tramo("medifolios.listado")
+    def recorrer_listado_completo(self, limite=None):
+        """
+        Lee todas las páginas del listado de pacientes (o las necesarias para `limite` filas).
+
+        Con DataTables del lado del cliente muestra todas las filas en un solo redibujado;
+        paginado en el servidor recorre páginas de TAMANO_PAGINA_LISTADO. Sin DataTables
+        sigue el botón de página siguiente. Retorna la lista ordenada de pacientes.
+        """
+        indice = {}
+        self._agregar_filas(indice, self.leer_listado_pacientes())
+        if limite is not None and len(indice) >= limite:
+            return list(indice.values())[:limite]
+
+        try:
+            tabla = self.driver.execute_script(_JS_TABLA_LISTADO)
+        except Exception as e:
+            print(f"⚠️ No se pudo inspeccionar la tabla del listado: {str(e)[:100]}")
+            tabla = None
+
+        if tabla and not tabla["servidor"]:
+            print(f"📚 Listado en el cliente con {tabla['total']} pacientes, mostrando todos")
+            self._redibujar_listado("largo", -1)
+            self._agregar_filas(indice, self.leer_listado_pacientes())
+        elif tabla:
+            print(f"📚 Listado paginado en el servidor con {tabla['total']} pacientes")
+            self._redibujar_listado("largo", TAMANO_PAGINA_LISTADO)
+            paginas = self.driver.execute_script("return window.__hcTablaListado.page.info().pages;")
+            for pagina in range(paginas):
+                if limite is not None and len(indice) >= limite:
+                    break
+                if pagina > 0:
+                    self._redibujar_listado("pagina", pagina)
+                agregadas = self._agregar_filas(indice, self.leer_listado_pacientes())
+                print(f"   Página {pagina + 1}/{paginas}: {agregadas} pacientes ({len(indice)} en total)")
+        else:
+            while limite is None or len(indice) < limite:
+                if not self.driver.execute_script(_JS_PAGINA_SIGUIENTE):
+                    break
+                self.esperas.red_inactiva("listado")
+                if not self._agregar_filas(indice, self.leer_listado_pacientes()):
+                    # La página siguiente no trajo pacientes nuevos: fin del listado
+                    break
+
+        pacientes = list(indice.values())
+        print(f"✅ Índice de pacientes: {len(pacientes)} pacientes")
+        return pacientes[:limite] if limite is not None else pacientes
+
+    def construir_indice_pacientes(self, limite=None):
+        """
+        Índice de pacientes del listado completo, guardado en indice_pacientes.json
+        del directorio de salida. Al reanudar se reutiliza el guardado, así las
+        posiciones coinciden con las de la corrida anterior.
+        """
+        ruta = os.path.join(self.output_dir, "indice_pacientes.json")
+        if self.reanudar and os.path.exists(ruta):
+            with open(ruta, 'r', encoding='utf-8') as f:
+                pacientes = json.load(f)["pacientes"]
+            if limite is None or len(pacientes) >= limite:
+                print(f"📚 Índice de pacientes reutilizado: {len(pacientes)} pacientes")
+                return pacientes[:limite] if limite is not None else pacientes
+
+        self.abrir_listado_pacientes()
+        pacientes = self.recorrer_listado_completo(limite)
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump({"fecha": time.strftime("%Y-%m-%d %H:%M:%S"), "pacientes": pacientes}, f,
+                      ensure_ascii=False, indent=2)
+        return pacientes
+
+    def _buscar_en_listado(self, id_paciente):
+        """Filtra el listado por ID para que la fila aparezca aunque esté en otra página"""
+        try:
+            if self.driver.execute_script(_JS_TABLA_LISTADO):
+                self._redibujar_listado("buscar", id_paciente)
+                return True
+            filtro = self.driver.find_elements(By.CSS_SELECTOR, ".dataTables_filter input, input[type='search']")
+            if filtro:
+                filtro[0].clear()
+                filtro[0].send_keys(id_paciente)
+                self.esperas.red_inactiva("listado")
+                return True
+        except Exception as e:
+            print(f"⚠️ No se pudo buscar el paciente {id_paciente} en el listado: {str(e)[:100]}")
+        return False
+
+    @tramo("medifolios.seleccion_paciente")
+    def seleccionar_paciente(self, paciente):
+        """
+        Selecciona un paciente del listado por su ID (dict de leer_listado_pacientes),
+        así la selección no depende de que el listado conserve el orden.
+        """
+        id_paciente, nombre_paciente = paciente["id"], paciente["nombre"]
+        indice = paciente.get("indice")
+        try:
+            # Al reanudar, los pacientes ya descargados se omiten sin salir del listado
+            if self.reanudar and not self.incremental and self.manifiesto.completo(id_paciente, "descargado"):
+                print(f"⏭️ Paciente ya descargado en una corrida anterior: {nombre_paciente} (ID: {id_paciente})")
+                return {"id": id_paciente, "nombre": nombre_paciente, "indice": indice, "omitido": True}
+
+            registro = self.manifiesto.registro(id_paciente)
+            if not registro or registro["estado"] is None:
+                self.manifiesto.registrar(id_paciente, "listado", nombre_paciente=nombre_paciente, indice=indice)
+            
+            # Buscar la fila por ID y hacer clic en su botón, en la misma llamada;
+            # si está en otra página del listado, filtrarlo primero por su ID
+            clic = self.driver.execute_script(_JS_CLIC_PACIENTE, id_paciente, paciente.get("boton_id"))
+            if not clic and self._buscar_en_listado(id_paciente):
+                clic = self.driver.execute_script(_JS_CLIC_PACIENTE, id_paciente, None)
+            if not clic:
+                print(f"⚠️ El paciente {nombre_paciente} (ID: {id_paciente}) ya no está en el listado")
                 return False
+            print(f"✅ Paciente seleccionado: {nombre_paciente} (ID: {id_paciente})")
+            self.esperas.red_inactiva("seleccion_paciente")
+            self.esperas.sin_overlays("seleccion_paciente")
             
-            # Obtener el botón del paciente en el índice deseado
-            boton_paciente = botones_editar[indice]
-            
-            # Obtener datos del paciente antes de hacer clic
-            fila_paciente = boton_paciente.find_element(By.XPATH, "./ancestor::tr")
-            celdas = fila_paciente.find_elements(By.TAG_NAME, "td")
-            
-            id_paciente = "Desconocido"
-            nombre_paciente = "Desconocido"
-            
-            if len(celdas) > 1:
-                id_paciente = celdas[1].get_attribute("title") if celdas[1].get_attribute("title") else "Desconocido"
-            
-            if len(celdas) > 3:
-                nombre_paciente = celdas[3].get_attribute("title") if celdas[3].get_attribute("title") else "Desconocido"
-            
-            # Hacer clic en el botón del paciente
-            self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", boton_paciente)
-            time.sleep(1)
-            self.driver.execute_script("arguments[0].click();", boton_paciente)
-            print(f"✅ Paciente #{indice+1} seleccionado: {nombre_paciente} (ID: {id_paciente})")
-            time.sleep(3)
-            
-            return {"id": id_paciente, "nombre": nombre_paciente}
+            return {"id": id_paciente, "nombre": nombre_paciente, "indice": indice}
             
         except Exception as e:
-            print(f"❌ Error al seleccionar paciente por índice {indice}: {str(e)}")
+            print(f"❌ Error al seleccionar el paciente {id_paciente}: {str(e)}")
+            return False
+
+    def seleccionar_paciente_por_indice(self, indice=0):
+        """Selecciona un paciente del listado por su índice (0 es el primero)"""
+        pacientes = self.recorrer_listado_completo(limite=indice + 1)
+        if len(pacientes) <= indice:
+            print(f"⚠️ No hay suficientes pacientes en la lista (se encontraron {len(pacientes)})")
             return False
+        return self.seleccionar_paciente(pacientes[indice])
 
     def cerrar_ventana(self):
         try:
@@ -205,7 +580,8 @@ class HistoriasClinicasExtractor:
                     close_btn = self.wait.until(EC.element_to_be_clickable((By.XPATH, selector)))
                     close_btn.click()
                     print(f"✅ Ventana cerrada usando selector #{i+1}")
-                    time.sleep(3)  # Esperar a que se cierre la ventana
+                    # Esperar a que se cierre la ventana
+                    self.esperas.sin_overlays("cierre_visor")
                     return True
                 except Exception as e:
                     print(f"⚠️ Selector #{i+1} falló: {str(e)[:100]}...")
@@ -226,7 +602,7 @@ class HistoriasClinicasExtractor:
                     try:
                         self.driver.execute_script(cmd)
                         print("✅ Ventana cerrada usando JavaScript")
-                        time.sleep(3)
+                        self.esperas.sin_overlays("cierre_visor")
                         return True
                     except Exception as js_e:
                         print(f"⚠️ Comando JS falló: {str(js_e)[:50]}...")
@@ -240,7 +616,7 @@ class HistoriasClinicasExtractor:
             
             actions = ActionChains(self.driver)
             actions.send_keys(Keys.ESCAPE).perform()
-            time.sleep(2)
+            self.esperas.sin_overlays("cierre_visor")
             
             # Verificar si hay un overlay y removerlo si existe
             self._limpiar_overlays()
@@ -273,105 +649,259 @@ class HistoriasClinicasExtractor:
                     overlays[i].remove();
                 }
             """)
-            
-            time.sleep(1)  # Breve pausa
         except Exception as e:
             print(f"ℹ️ Limpieza de overlays: {str(e)[:100]}...")
  
-    def imprimir_con_cdp(self, path):
-        import base64
-        from pathlib import Path
-
-        result = self.driver.execute_cdp_cmd("Page.printToPDF", {
-            "landscape": False,
-            "displayHeaderFooter": False,
-            "printBackground": True,
-            "preferCSSPageSize": True
-        })
-
-        data = base64.b64decode(result['data'])
-        Path(path).write_bytes(data)
-        print(f"📥 PDF guardado en: {path}")
+    def imprimir_con_cdp(self, path, rango_paginas=""):
+        """
+        Imprime la pestaña actual a PDF con Page.printToPDF en modo stream: el PDF se
+        lee por bloques con IO.read y se escribe directo al archivo, sin tener el
+        documento completo en memoria. `rango_paginas` usa la sintaxis de Chrome ("1-50").
+        """
+        params = dict(OPCIONES_PRINT_TO_PDF, transferMode="ReturnAsStream")
+        if rango_paginas:
+            params["pageRanges"] = rango_paginas
+        result = self.driver.execute_cdp_cmd("Page.printToPDF", params)
+
+        temporal = path + ".part"
+        escrito = _volcar_stream_cdp(self.driver, result["stream"], temporal)
+        os.replace(temporal, path)
+        print(f"📥 PDF guardado en: {path} ({escrito/1024:.1f} KB)")
         return path
 
-    def visualizar_historia(self, paciente_info, intento=1):
-        max_intentos = 3
+    def imprimir_por_partes(self, path, paginas_por_parte=PAGINAS_POR_PARTE_PDF):
+        """
+        Imprime la pestaña actual en varios PDF de `paginas_por_parte` páginas
+        (`<path>_parte1.pdf`, `<path>_parte2.pdf`, ...) para historias muy largas.
+        Retorna la lista de rutas generadas.
+        """
+        base = os.path.splitext(path)[0]
+        partes = []
+        desde = 1
+        while True:
+            ruta_parte = f"{base}_parte{len(partes) + 1}.pdf"
+            try:
+                self.imprimir_con_cdp(ruta_parte, f"{desde}-{desde + paginas_por_parte - 1}")
+            except Exception as e:
+                # Chrome rechaza un rango que empieza después de la última página
+                if partes and "page range" in str(e).lower():
+                    break
+                raise
+            partes.append(ruta_parte)
+            desde += paginas_por_parte
+        print(f"📚 PDF dividido en {len(partes)} partes de hasta {paginas_por_parte} páginas")
+        return partes
+
+    @tramo("medifolios.historia")
+    def visualizar_historia(self, paciente_info, max_intentos=3):
+        for intento in range(1, max_intentos + 1):
+            try:
+                self.esperas.sin_overlays("panel_historico")
+                self._limpiar_overlays()
+
+                print("🔍 Buscando botón de historial clínico...")
+                historial_btn = self.esperas.presente((By.ID, "btnPanelHistorico"), "panel_historico")
+                self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", historial_btn)
+                self.driver.execute_script("arguments[0].click();", historial_btn)
+                print("✅ Historial de paciente abierto (JS)")
+
+                print("🔍 Seleccionando todas las historias...")
+                checkbox = self.esperas.presente((By.ID, "btnSeleccionarHistorias"), "panel_historico")
+                self.esperas.red_inactiva("panel_historico")
+
+                paciente_info["historias"] = self.leer_historias_panel()
+                if self.incremental and not self._hay_historias_nuevas(paciente_info):
+                    info = self._info_desde_manifiesto(paciente_info)
+                    self.pdfs_info.append(info)
+                    paciente_info["sin_cambios"] = True
+                    return info["ruta"]
+                self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", checkbox)
+                self.driver.execute_script("arguments[0].click();", checkbox)
+                print("✅ Historias seleccionadas")
+
+                print("🔍 Visualizando historias seleccionadas...")
+                visualizar_btn = self.esperas.clickeable((By.ID, "btnVisualizarSeleccionado"), "panel_historico")
+                self.esperas.red_inactiva("panel_historico")
+                self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", visualizar_btn)
+                self.driver.execute_script("arguments[0].click();", visualizar_btn)
+                print("✅ Visualización iniciada")
+
+                print("🔍 Localizando el iframe del visor...")
+                iframe = self.esperas.presente((By.ID, "iframe_visualizar_reporte_formato"), "visor")
+                # El src se asigna cuando el servidor termina de generar el reporte
+                self.esperas.hasta(
+                    lambda d: (iframe.get_attribute("src") or "").startswith("http"), "visor", "src_iframe"
+                )
+                src = iframe.get_attribute("src")
+                print(f"📄 URL del visor: {src}")
+
+                # Crear nombre de archivo con ID y nombre del paciente
+                nombre_archivo = f"{paciente_info['id']}_{paciente_info['nombre'].replace(' ', '_')}.pdf"
+                # Limpia el nombre de archivo de caracteres especiales
+                nombre_archivo = re.sub(r'[\\/*?:"<>|]', '', nombre_archivo)
+                ruta_pdf = os.path.join(self.output_dir, nombre_archivo)
+
+                # Primero intentar traer el documento nativo sin pasar por el navegador
+                descargado = None
+                if self.modo_descarga == "directo":
+                    try:
+                        descargado = self.descargar_reporte_directo(src, os.path.splitext(ruta_pdf)[0])
+                    except Exception as e:
+                        print(f"⚠️ Descarga directa falló, se imprimirá desde el navegador: {str(e)[:150]}")
+
+                if descargado:
+                    ruta_documento, formato = descargado
+                else:
+                    ruta_documento, formato = self._imprimir_reporte_en_pestana(src, ruta_pdf, paciente_info)
+
+                # Registrar la información del PDF
+                info = {
+                    "ruta": ruta_documento,
+                    "formato": formato,
+                    "id_paciente": paciente_info['id'],
+                    "nombre_paciente": paciente_info['nombre'],
+                    "indice": paciente_info.get('indice')
+                }
+                self.pdfs_info.append(info)
+                self.manifiesto.registrar(info["id_paciente"], "descargado", historias=paciente_info["historias"],
+                                          **{k: v for k, v in info.items() if k != "id_paciente"})
+            
+                return ruta_documento
         
+            except Exception as e:
+                print(f"❌ Error al visualizar historia clínica: {str(e)}")
+                # Con el navegador caído reintentar no sirve: que decida el supervisor
+                if not navegador_responde(self.driver):
+                    raise
+                if intento < max_intentos:
+                    print(f"🔄 Reintentando visualización (intento {intento+1}/{max_intentos})...")
+        return None
+
+    def leer_historias_panel(self):
+        """Historias del panel histórico como [{'valor', 'fecha'}], en una sola llamada JS"""
         try:
-            time.sleep(3)
-            self._limpiar_overlays()
+            historias = self.driver.execute_script(_JS_HISTORIAS_PANEL) or []
+        except Exception as e:
+            print(f"⚠️ No se pudieron leer las historias del panel: {str(e)[:100]}")
+            return []
+        for historia in historias:
+            fecha = RE_FECHA_HISTORIA.search(historia.pop("texto", ""))
+            historia["fecha"] = fecha.group(1) if fecha else None
+        fechas = sorted(h["fecha"] for h in historias if h["fecha"])
+        print(f"📚 {len(historias)} historias en el panel"
+              f"{' (última: ' + fechas[-1] + ')' if fechas else ''}")
+        return historias
+
+    def _hay_historias_nuevas(self, paciente_info):
+        """
+        True si el panel tiene historias que no estaban en la última descarga del paciente.
+        Sin descarga previa íntegra o sin lectura del panel se descarga de todas formas.
+        """
+        actuales = paciente_info.get("historias") or []
+        registro = self.manifiesto.registro(paciente_info["id"])
+        if not actuales or not registro or registro.get("historias") is None \
+                or not self.manifiesto.completo(paciente_info["id"], "descargado"):
+            return True
 
-            print("🔍 Buscando botón de historial clínico...")
-            historial_btn = self.wait.until(EC.presence_of_element_located((By.ID, "btnPanelHistorico")))
-            self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", historial_btn)
-            time.sleep(1)
-            self.driver.execute_script("arguments[0].click();", historial_btn)
-            print("✅ Historial de paciente abierto (JS)")
-
-            time.sleep(5)
-
-            print("🔍 Seleccionando todas las historias...")
-            checkbox = self.wait.until(EC.presence_of_element_located((By.ID, "btnSeleccionarHistorias")))
-            self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", checkbox)
-            time.sleep(1)
-            self.driver.execute_script("arguments[0].click();", checkbox)
-            print("✅ Historias seleccionadas")
-
-            time.sleep(2)
-
-            print("🔍 Visualizando historias seleccionadas...")
-            visualizar_btn = self.wait.until(EC.presence_of_element_located((By.ID, "btnVisualizarSeleccionado")))
-            self.driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", visualizar_btn)
-            time.sleep(1)
-            self.driver.execute_script("arguments[0].click();", visualizar_btn)
-            print("✅ Visualización iniciada")
-
-            time.sleep(5)
-
-            print("🔍 Localizando el iframe del visor...")
-            iframe = self.wait.until(EC.presence_of_element_located((By.ID, "iframe_visualizar_reporte_formato")))
-            src = iframe.get_attribute("src")
-            print(f"📄 URL del visor: {src}")
-
-            # Abre la pestaña, imprime PDF y luego la cierra
-            self.driver.execute_script("window.open('');")
-            self.driver.switch_to.window(self.driver.window_handles[-1])
-            self.driver.get(src)
-
-            time.sleep(5)
-
-            # Crear nombre de archivo con ID y nombre del paciente
-            nombre_archivo = f"{paciente_info['id']}_{paciente_info['nombre'].replace(' ', '_')}.pdf"
-            # Limpia el nombre de archivo de caracteres especiales
-            nombre_archivo = re.sub(r'[\\/*?:"<>|]', '', nombre_archivo)
-            ruta_pdf = os.path.join(self.output_dir, nombre_archivo)
-            
+        previas = {(h["valor"], h["fecha"]) for h in registro["historias"]}
+        nuevas = [h for h in actuales if (h["valor"], h["fecha"]) not in previas]
+        if nuevas:
+            print(f"🆕 {len(nuevas)} historias nuevas para {paciente_info['nombre']}")
+        else:
+            print(f"⏭️ Sin historias nuevas para {paciente_info['nombre']}, se omite la descarga")
+        return bool(nuevas)
+
+    @tramo("medifolios.impresion_pdf")
+    def _imprimir_reporte_en_pestana(self, src, ruta_pdf, paciente_info):
+        """
+        Respaldo de la descarga directa: abre el reporte en una pestaña.
+
+        Si el reporte es HTML se guarda el DOM tal cual (salvo en modo "impresion");
+        si no, se imprime a PDF. Retorna (ruta, formato).
+        """
+        # Abre la pestaña, imprime PDF y luego la cierra
+        ventanas_previas = len(self.driver.window_handles)
+        self.driver.execute_script("window.open('');")
+        self.esperas.nueva_ventana(ventanas_previas, "reporte")
+        self.driver.switch_to.window(self.driver.window_handles[-1])
+        self.driver.get(src)
+
+        self.esperas.dom_listo("reporte")
+        self.esperas.red_inactiva("reporte")
+
+        tipo = self.driver.execute_script("return document.contentType || '';")
+        if self.modo_descarga != "impresion" and "html" in tipo:
+            ruta, formato = os.path.splitext(ruta_pdf)[0] + SUFIJO_REPORTE_HTML, "html"
+            print(f"💾 Guardando reporte HTML del visor para {paciente_info['nombre']}...")
+            with open(ruta, "w", encoding="utf-8") as f:
+                f.write(self.driver.page_source)
+        else:
+            ruta, formato = ruta_pdf, "pdf"
             print(f"🖨️ Generando PDF desde visor para {paciente_info['nombre']}...")
             self.imprimir_con_cdp(ruta_pdf)
 
-            # Registrar la información del PDF
-            self.pdfs_info.append({
-                "ruta": ruta_pdf,
-                "id_paciente": paciente_info['id'],
-                "nombre_paciente": paciente_info['nombre']
-            })
-
-            # Verificar el número de ventanas abiertas después de cerrar la pestaña
-            print(f"Ventanas abiertas después de cerrar la pestaña del PDF: {len(self.driver.window_handles)}")
-            self.driver.close()  # Cerrar pestaña del reporte
-            self.driver.switch_to.window(self.driver.window_handles[0])
-            print(f"✅ Regresado a la ventana principal. Ventanas abiertas: {len(self.driver.window_handles)}")
-            time.sleep(5)
-            
-            return ruta_pdf
-        
-        except Exception as e:
-            print(f"❌ Error al visualizar historia clínica: {str(e)}")
-            if intento < max_intentos:
-                print(f"🔄 Reintentando visualización (intento {intento+1}/{max_intentos})...")
-                return self.visualizar_historia(paciente_info, intento + 1)
+        # Verificar el número de ventanas abiertas después de cerrar la pestaña
+        print(f"Ventanas abiertas después de cerrar la pestaña del PDF: {len(self.driver.window_handles)}")
+        self.driver.close()  # Cerrar pestaña del reporte
+        self.driver.switch_to.window(self.driver.window_handles[0])
+        print(f"✅ Regresado a la ventana principal. Ventanas abiertas: {len(self.driver.window_handles)}")
+        return ruta, formato
+
+    def _sesion_http(self):
+        """Sesión HTTP reutilizable que comparte las cookies y el User-Agent del navegador"""
+        if self.sesion_http is None:
+            self.sesion_http = requests.Session()
+            self.sesion_http.headers["User-Agent"] = self.driver.execute_script("return navigator.userAgent;")
+
+        # Refrescar cookies en cada uso: el servidor puede rotar la sesión
+        for ck in self.driver.get_cookies():
+            self.sesion_http.cookies.set(
+                ck["name"], ck["value"], domain=ck.get("domain", ""), path=ck.get("path", "/")
+            )
+        return self.sesion_http
+
+    @tramo("medifolios.descarga_reporte")
+    def descargar_reporte_directo(self, url, ruta_base):
+        """
+        Descarga el documento del visor con una petición HTTP usando la sesión del navegador.
+
+        Guarda el documento tal como lo entrega el servidor: `<ruta_base>.pdf` si es un PDF,
+        o `<ruta_base>_reporte.html` si es el reporte en HTML.
+        Retorna (ruta, formato) o None si la respuesta no es un reporte válido: un PDF
+        debe empezar con la firma %PDF- y un HTML tener las marcas de RE_MARCA_REPORTE.
+        """
+        print(f"📥 Descargando reporte directamente: {url}")
+        resp = self._sesion_http().get(url, timeout=60, headers={"Referer": self.driver.current_url})
+        resp.raise_for_status()
+
+        contenido = resp.content
+        tipo = resp.headers.get("Content-Type", "").lower()
+
+        if contenido[:5] == b"%PDF-":
+            ruta, formato = ruta_base + ".pdf", "pdf"
+        elif "application/pdf" in tipo:
+            print("⚠️ La descarga directa dice ser PDF pero no tiene la firma %PDF-")
+            return None
+        elif "html" in tipo or contenido.lstrip()[:1] == b"<":
+            # Si el servidor respondió con el formulario de ingreso, las cookies no sirvieron
+            if b"txt_usuario_login" in contenido:
+                print("⚠️ La descarga directa devolvió la página de ingreso")
+                return None
+            # Una página de error o de sesión vencida no se guarda como historia del paciente
+            if not RE_MARCA_REPORTE.search(contenido):
+                print("⚠️ La descarga directa devolvió un HTML que no es un reporte de historia clínica")
+                return None
+            ruta, formato = ruta_base + SUFIJO_REPORTE_HTML, "html"
+        else:
+            print(f"⚠️ Tipo de contenido inesperado en descarga directa: {tipo}")
             return None
 
+        with open(ruta, "wb") as f:
+            f.write(contenido)
+        print(f"✅ Reporte guardado ({formato}, {len(contenido)/1024:.1f} KB): {ruta}")
+        return ruta, formato
+
+    @tramo("medifolios.navegacion")
     def cerrar_visor_historia(self):
         try:
             # Esperar a que el botón de cerrar esté disponible y sea clickeable
@@ -391,7 +921,7 @@ class HistoriasClinicasExtractor:
                     )
                     close_button.click()
                     print("✅ Botón de cierre del visor clicado con éxito.")
-                    time.sleep(3)
+                    self.esperas.sin_overlays("cierre_visor")
                     return True
                 except:
                     continue
@@ -407,7 +937,7 @@ class HistoriasClinicasExtractor:
                 try:
                     self.driver.execute_script(cmd)
                     print("✅ Visor cerrado usando JavaScript.")
-                    time.sleep(3)
+                    self.esperas.sin_overlays("cierre_visor")
                     return True
                 except:
                     continue
@@ -420,6 +950,7 @@ class HistoriasClinicasExtractor:
             print(f"❌ Error al intentar cerrar el visor de la historia clínica: {str(e)}")
             return False
 
+    @tramo("medifolios.navegacion")
     def volver_a_listado_pacientes(self):
         """Navega de regreso al listado de pacientes"""
         try:
@@ -432,15 +963,16 @@ class HistoriasClinicasExtractor:
                 )
                 volver_btn.click()
                 print("✅ Vuelto al listado mediante botón específico")
-                time.sleep(3)
+                self.esperas.presente((By.CLASS_NAME, "btnCodPacienteListado"), "regreso_listado")
+                self.esperas.red_inactiva("regreso_listado")
                 return True
             except:
                 print("⚠️ No se encontró botón específico para volver, intentando alternativas...")
             
             # Segunda opción: ir directamente a la URL del listado
             try:
-                self.driver.get("https://www.server0medifolios.net/index.php/SALUD_HOME/paciente")
-                time.sleep(3)
+                self.driver.get(f"{URL_SERVIDOR_MEDIFOLIOS}/index.php/SALUD_HOME/paciente")
+                self.esperas.dom_listo("regreso_listado")
                 self.abrir_listado_pacientes()
                 print("✅ Vuelto al listado mediante URL directa")
                 return True
@@ -454,99 +986,167 @@ class HistoriasClinicasExtractor:
 
     def cerrar(self):
         print("👋 Cerrando navegador...")
+        if self.sesion_http is not None:
+            self.sesion_http.close()
+        if self.escucha_red is not None:
+            self.escucha_red.detener()
         try:
             self.driver.quit()
             print("✅ Navegador cerrado correctamente")
         except Exception as e:
             print(f"⚠️ Error al cerrar el navegador: {str(e)}")
+        finally:
+            self.perfil.liberar()
+
+    def descargar_historias_clinicas(self, num_pacientes=3, indices=None, pacientes=None):
+        """
+        Descarga las historias clínicas de varios pacientes secuencialmente.
 
-    def descargar_historias_clinicas(self, num_pacientes=3):
-        """Descarga las historias clínicas de varios pacientes secuencialmente"""
+        Por defecto procesa los primeros `num_pacientes` del listado; con `indices`
+        procesa solo esas posiciones, y con `pacientes` (entradas del índice de
+        construir_indice_pacientes) exactamente esos pacientes, buscándolos por ID.
+        """
         
         self.pdfs_info = []  # Reiniciar la lista de PDFs
+        self.abrir_listado_pacientes()
+
+        if pacientes is not None:
+            objetivos = list(pacientes)
+        else:
+            # Leer el listado una sola vez (todas las páginas necesarias): las posiciones se
+            # traducen a IDs y desde ahí cada paciente se busca por su ID
+            indices = list(indices) if indices is not None else list(range(num_pacientes))
+            listado = self.recorrer_listado_completo(limite=max(indices) + 1) if indices else []
+            objetivos = [listado[i] for i in indices if i < len(listado)]
+            if len(objetivos) < len(indices):
+                print(f"⚠️ El listado solo tiene {len(listado)} pacientes; se procesarán {len(objetivos)}")
+        self.en_listado = True
         
-        for i in range(num_pacientes):
+        for n, objetivo in enumerate(objetivos):
             print(f"\n{'='*50}")
-            print(f"🏥 PROCESANDO PACIENTE {i+1}/{num_pacientes}")
+            print(f"🏥 PROCESANDO PACIENTE {objetivo['indice']+1} ({n+1}/{len(objetivos)})")
             print(f"{'='*50}")
             
             try:
-                # Si es el primer paciente, necesitamos abrir el listado y seleccionarlo
-                if i == 0:
-                    self.abrir_listado_pacientes()
-                    paciente_info = self.seleccionar_paciente_por_indice(i)
-                    if not paciente_info:
-                        print("❌ No se pudo seleccionar el primer paciente. Abortando.")
-                        break
-                # Para los siguientes pacientes, cerrar ficha actual y volver al listado
-                else:
-                    if not self.volver_a_listado_pacientes():
-                        print("❌ No se pudo volver al listado de pacientes. Abortando.")
-                        break
-                    
-                    paciente_info = self.seleccionar_paciente_por_indice(i)
-                    if not paciente_info:
-                        print(f"❌ No se pudo seleccionar el paciente #{i+1}. Abortando.")
-                        break
-                
-                # Visualizar y extraer la historia clínica
-                pdf_path = self.visualizar_historia(paciente_info)
-                
-                # Cerrar el visor de la historia
-                self.cerrar_visor_historia()
-                time.sleep(3)
-                
+                self.descargar_paciente(objetivo)
             except Exception as e:
-                print(f"❌ Error procesando paciente #{i+1}: {str(e)}")
+                print(f"❌ Error procesando paciente #{objetivo['indice']+1}: {str(e)}")
                 # Intentar continuar con el siguiente paciente
                 try:
-                    self.volver_a_listado_pacientes()
+                    self.en_listado = self.volver_a_listado_pacientes()
                 except:
                     print("❌ No se pudo recuperar del error. Abortando.")
                     break
+                if not self.en_listado:
+                    print("❌ No se pudo volver al listado de pacientes. Abortando.")
+                    break
         
         print(f"\n📊 RESUMEN: Se generaron {len(self.pdfs_info)} archivos PDF")
         for i, pdf_info in enumerate(self.pdfs_info):
             print(f"  {i+1}. {pdf_info['nombre_paciente']} (ID: {pdf_info['id_paciente']}) -> {os.path.basename(pdf_info['ruta'])}")
+
+        self.esperas.imprimir_resumen()
         
         return self.pdfs_info
     
-    def extraer_texto_pdf(self, pdf_path):
+    @tramo("medifolios.paciente")
+    def descargar_paciente(self, objetivo):
         """
-        Extrae el texto de un archivo PDF con pre-procesamiento mejorado
+        Descarga la historia de un paciente del índice partiendo del listado o de la
+        ficha del paciente anterior. Retorna su entrada de pdfs_info, o None si no se
+        pudo seleccionar o no generó documento. Los errores del navegador se propagan.
+        """
+        i = objetivo["indice"]
+        # Cerrar la ficha actual y volver al listado
+        if not self.en_listado:
+            if not self.volver_a_listado_pacientes():
+                raise RuntimeError("No se pudo volver al listado de pacientes")
+            self.en_listado = True
+
+        paciente_info = self.seleccionar_paciente(objetivo)
+        if not paciente_info:
+            print(f"⚠️ No se pudo seleccionar el paciente #{i+1}, se continúa con el siguiente.")
+            return None
+
+        if paciente_info.get("omitido"):
+            info = self._info_desde_manifiesto(paciente_info)
+            self.pdfs_info.append(info)
+            return info
+        self.en_listado = False
+
+        # Visualizar y extraer la historia clínica
+        generados = len(self.pdfs_info)
+        self.visualizar_historia(paciente_info)
+
+        # Cerrar el visor de la historia (en modo incremental no se abre si no hubo cambios)
+        if not paciente_info.get("sin_cambios"):
+            self.cerrar_visor_historia()
+        return self.pdfs_info[-1] if len(self.pdfs_info) > generados else None
+
+    def _info_desde_manifiesto(self, paciente_info):
+        """Entrada de pdfs_info de un paciente descargado en una corrida anterior"""
+        registro = self.manifiesto.registro(paciente_info["id"])
+        return {
+            "ruta": registro["ruta"],
+            "formato": registro.get("formato", "pdf"),
+            "id_paciente": paciente_info["id"],
+            "nombre_paciente": paciente_info["nombre"],
+            "indice": paciente_info.get("indice"),
+        }
+
+    def extraer_texto_pdf(self, pdf_path, max_caracteres=None):
+        """
+        Extrae el texto de un archivo PDF con pre-procesamiento mejorado. Con
+        `max_caracteres` deja de leer páginas al llegar a ese largo.
         """
         try:
-            texto_completo = ""
-            with open(pdf_path, 'rb') as archivo:
-                lector_pdf = PyPDF2.PdfReader(archivo)
-                num_paginas = len(lector_pdf.pages)
-                
-                print(f"📄 Extrayendo texto de {pdf_path} ({num_paginas} páginas)")
-                
-                for num_pagina in range(num_paginas):
-                    pagina = lector_pdf.pages[num_pagina]
-                    texto_pagina = pagina.extract_text()
-                    
-                    # Mejoras en el procesamiento de texto
-                    # 1. Normalizar espacios para facilitar búsqueda de patrones
-                    texto_pagina = re.sub(r'\s+', ' ', texto_pagina)
-                    
-                    # 2. Asegurar que "EDAD:" y "SEXO:" sean reconocibles (espacio después de los dos puntos)
-                    texto_pagina = re.sub(r'EDAD:(\d)', r'EDAD: \1', texto_pagina, flags=re.IGNORECASE)
-                    texto_pagina = re.sub(r'SEXO:([A-Za-z])', r'SEXO: \1', texto_pagina, flags=re.IGNORECASE)
-                    
-                    texto_completo += texto_pagina + "\n\n"
-                        
-                return texto_completo
+            # Espacios normalizados y "EDAD:"/"SEXO:" reconocibles en cada página
+            estadisticas = {}
+            texto_completo, num_paginas = texto_pdf(pdf_path, normalizar=normalizar_pagina_pdf,
+                                                    max_caracteres=max_caracteres, backend=self.extractor_pdf,
+                                                    estadisticas=estadisticas)
+
+            origen = obtener_backend(self.extractor_pdf).nombre
+            if not estadisticas["extraidas"]:
+                origen = "caché"
+            print(f"📄 Texto extraído de {pdf_path} ({num_paginas} páginas, {origen})")
+            return texto_completo
         except Exception as e:
             print(f"❌ Error extrayendo texto del PDF {pdf_path}: {str(e)}")
             return ""
     
+    def extraer_texto_html(self, html_path):
+        """
+        Extrae el texto de un reporte HTML descargado directamente del visor
+        """
+        try:
+            with open(html_path, 'rb') as archivo:
+                html = archivo.read()
+            estructura = parsear_reporte_html(html)
+            if estructura["atenciones"] or estructura["paciente"]:
+                # Texto compacto por secciones: encabezado, atenciones, signos, diagnósticos y plan
+                texto = reporte_a_texto(estructura)
+            else:
+                texto = "\n".join(html_a_lineas(html))
+            print(f"📄 Texto extraído de {html_path} ({len(texto)} caracteres, "
+                  f"{len(estructura['atenciones'])} atenciones)")
+            return texto
+        except Exception as e:
+            print(f"❌ Error extrayendo texto del HTML {html_path}: {str(e)}")
+            return ""
+
+    @tramo("medifolios.extraccion_texto")
+    def extraer_texto_documento(self, ruta, max_caracteres=None):
+        """Extrae el texto del documento descargado, sea PDF o reporte HTML"""
+        if ruta.endswith(SUFIJO_REPORTE_HTML):
+            return self.extraer_texto_html(ruta)
+        return self.extraer_texto_pdf(ruta, max_caracteres)
+    
     def diagnosticar_extraccion_pdf(self, pdf_path):
         """
         Extrae el texto del PDF y busca patrones específicos para diagnóstico
         """
-        texto = self.extraer_texto_pdf(pdf_path)
+        texto = self.extraer_texto_documento(pdf_path)
         
         # Buscar patrones relevantes
         patrones = {
@@ -572,14 +1172,16 @@ class HistoriasClinicasExtractor:
         
         return patrones
     
-    def convertir_pdf_a_fhir(self, pdf_path):
+    def convertir_pdf_a_fhir(self, pdf_path, texto_pdf=None):
         """
         Extrae el texto del PDF y lo envía a OpenAI para convertirlo a un JSON HL7-FHIR.
+        Si `texto_pdf` viene ya extraído (p. ej. por el pool de extracción) no se lee el archivo.
         Compatible con la API de OpenAI v1.0+
         """
         try:
-            # Extraer texto del PDF
-            texto_pdf = self.extraer_texto_pdf(pdf_path)
+            # Extraer texto del PDF (o del reporte HTML si se descargó directamente)
+            if texto_pdf is None:
+                texto_pdf = self.extraer_texto_documento(pdf_path)
             
             if not texto_pdf or len(texto_pdf.strip()) < 50:
                 print(f"⚠️ El PDF {pdf_path} no contiene suficiente texto extraíble")
@@ -668,64 +1270,104 @@ class HistoriasClinicasExtractor:
             Devuelve un JSON válido y bien estructurado sin texto adicional.
             """
             
-            # Limitar el texto a enviar a OpenAI (para evitar límites de tokens)
-            max_tokens = 12000  # Ajustar según el modelo
-            texto_recortado = texto_pdf[:max_tokens] if len(texto_pdf) > max_tokens else texto_pdf
+            # Historias largas: un bloque de atenciones por llamada, con el encabezado del paciente en cada uno.
+            # Las páginas normalizadas no contienen "\n\n": el texto se vuelve a partir en páginas exactas
+            separador = None if pdf_path.endswith(SUFIJO_REPORTE_HTML) else "\n\n"
+            historia = segmentar_texto(texto_pdf, separador)
+            bloques = historia.bloques(MAX_CARACTERES_LLM)
+            if len(bloques) > 1:
+                print(f"📑 {len(historia.atenciones)} atenciones en {len(bloques)} bloques "
+                      f"de hasta {MAX_CARACTERES_LLM} caracteres")
             
             # Usar la nueva API de OpenAI (versión >= 1.0.0)
             from openai import OpenAI
             client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
             
+            partes = mapear_bloques(lambda bloque: self._fhir_de_bloque(client, system_prompt, bloque, len(bloques)),
+                                    bloques)
+            if any(parte is None for parte in partes):
+                # Sin un bloque la historia quedaría incompleta: no se guarda y se reintenta en otra corrida
+                print(f"❌ {partes.count(None)} de {len(bloques)} bloques sin JSON válido")
+                return None
+            fhir_json = combinar_json(partes)
+            if len(bloques) > 1:
+                fhir_json = self._unificar_pacientes(fhir_json)
+            
+            print(f"✅ Documento FHIR generado exitosamente")
+            return fhir_json
+            
+        except Exception as e:
+            print(f"❌ Error en proceso de conversión a FHIR: {str(e)}")
+            return None
+
+    def _fhir_de_bloque(self, client, system_prompt, bloque, total_bloques=1):
+        """Envía un bloque de la historia al LLM y retorna el JSON FHIR de la respuesta, o None"""
+        texto = bloque["texto"]
+        encabezado = "Historia clínica extraída del PDF"
+        if total_bloques > 1:
+            encabezado += (f" (parte {bloque['numero']} de {total_bloques}, páginas {bloque['paginas'][0]}"
+                           f"-{bloque['paginas'][1]}; los datos del paciente se repiten en cada parte)")
+        
+        with tramo("medifolios.llm", caracteres=len(texto), bloque=bloque["numero"]):
             response = client.chat.completions.create(
                 model="gpt-4o",  # Ajustar modelo según disponibilidad y necesidad
                 messages=[
                     {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Historia clínica extraída del PDF:\n\n{texto_recortado}"}
+                    {"role": "user", "content": f"{encabezado}:\n\n{texto}"}
                 ],
                 temperature=0.3,  # Baja temperatura para respuestas más deterministas
                 max_tokens=4000,  # Ajustar según el modelo
             )
-            
-            content = response.choices[0].message.content
+        
+        content = response.choices[0].message.content
 
-            # Primero registrar el contenido para diagnóstico
-            print(f"Respuesta de OpenAI (primeros 200 caracteres): {content[:200]}")
+        # Primero registrar el contenido para diagnóstico
+        print(f"Respuesta de OpenAI (primeros 200 caracteres): {content[:200]}")
 
-            # Intentar parsear JSON
-            try:
-                # Primero verificar si la respuesta ya es JSON directamente
-                fhir_json = json.loads(content)
-                print("✅ JSON parseado directamente de la respuesta")
-            except json.JSONDecodeError:
-                # Si no, intentar extraer JSON de bloques de código
-                match = re.search(r"```(?:json)?([\s\S]*?)```", content)
+        # Intentar parsear JSON
+        try:
+            # Primero verificar si la respuesta ya es JSON directamente
+            fhir_json = json.loads(content)
+            print("✅ JSON parseado directamente de la respuesta")
+        except json.JSONDecodeError:
+            # Si no, intentar extraer JSON de bloques de código
+            match = re.search(r"```(?:json)?([\s\S]*?)```", content)
+            if match:
+                try:
+                    fhir_json = json.loads(match.group(1).strip())
+                    print("✅ JSON extraído de bloque de código markdown")
+                except json.JSONDecodeError:
+                    print(f"❌ No se pudo parsear el JSON extraído del bloque de código")
+                    return None
+            else:
+                # Tercer intento: buscar llaves de inicio y fin del JSON
+                match = re.search(r"({[\s\S]*})", content)
                 if match:
                     try:
                         fhir_json = json.loads(match.group(1).strip())
-                        print("✅ JSON extraído de bloque de código markdown")
+                        print("✅ JSON extraído usando expresión regular de llaves")
                     except json.JSONDecodeError:
-                        print(f"❌ No se pudo parsear el JSON extraído del bloque de código")
+                        print(f"❌ No se pudo parsear el JSON usando expresión regular")
                         return None
                 else:
-                    # Tercer intento: buscar llaves de inicio y fin del JSON
-                    match = re.search(r"({[\s\S]*})", content)
-                    if match:
-                        try:
-                            fhir_json = json.loads(match.group(1).strip())
-                            print("✅ JSON extraído usando expresión regular de llaves")
-                        except json.JSONDecodeError:
-                            print(f"❌ No se pudo parsear el JSON usando expresión regular")
-                            return None
-                    else:
-                        print(f"❌ No se encontró estructura JSON en la respuesta")
-                        return None
-                    
-            print(f"✅ Documento FHIR generado exitosamente")
+                    print(f"❌ No se encontró estructura JSON en la respuesta")
+                    return None
+        return fhir_json
+
+    def _unificar_pacientes(self, fhir_json):
+        """Deja un solo Patient en el Bundle combinado: cada bloque trae el suyo, sacado del mismo encabezado"""
+        entradas = fhir_json.get("entry") or []
+        pacientes = [e for e in entradas
+                     if isinstance(e, dict) and (e.get("resource") or {}).get("resourceType") == "Patient"]
+        if len(pacientes) < 2:
             return fhir_json
-            
-        except Exception as e:
-            print(f"❌ Error en proceso de conversión a FHIR: {str(e)}")
-            return None
+        paciente = dict(pacientes[0]["resource"])
+        for otro in pacientes[1:]:
+            for clave, valor in otro["resource"].items():
+                paciente.setdefault(clave, valor)
+        resto = [e for e in entradas if not any(e is p for p in pacientes)]
+        fhir_json["entry"] = [dict(pacientes[0], resource=paciente)] + resto
+        return fhir_json
 
     def generar_xml_de_fhir(self, fhir_json):
         """
@@ -744,6 +1386,7 @@ class HistoriasClinicasExtractor:
             print(f"❌ Error generando XML: {str(e)}")
             return None
 
+    @tramo("medifolios.escritura_html")
     def generar_html_tabular(self, fhir_json, html_path, pdf_info):
         """
         Genera un archivo HTML con visualización tabular de los datos FHIR extraídos.
@@ -855,6 +1498,7 @@ class HistoriasClinicasExtractor:
             print(f"❌ Error generando HTML: {str(e)}")
             return False
     
+    @tramo("medifolios.reporte_global")
     def generar_html_global(self, output_dir):
         # Definir la ruta del archivo HTML global
         html_path = os.path.join(output_dir, "historias_clinicas_fhir.html")
@@ -871,7 +1515,7 @@ class HistoriasClinicasExtractor:
         # Recorrer todos los PDFs procesados
         for info in self.pdfs_info:
             pdf_path = info['ruta']
-            json_path = os.path.splitext(pdf_path)[0] + '.json'
+            json_path = ruta_base_salida(pdf_path) + '.json'
             
             # Verificar si existe el archivo JSON correspondiente
             if os.path.exists(json_path):
@@ -2216,10 +2860,83 @@ class HistoriasClinicasExtractor:
         
         return '\n'.join(html)
         
-    def procesar_pdfs_fhir_html(self):
+    def _textos_para_convertir(self, infos, workers_extraccion=None):
+        """
+        Genera (info, texto) de los documentos a convertir. Los reportes HTML se leen
+        aquí; los PDFs se extraen en el pool de procesos y salen a medida que terminan,
+        así la extracción avanza mientras se espera al LLM.
+        """
+        por_ruta = {}
+        for info in infos:
+            if info['ruta'].endswith(SUFIJO_REPORTE_HTML):
+                yield info, self.extraer_texto_documento(info['ruta'])
+            else:
+                por_ruta[info['ruta']] = info
+        if not por_ruta:
+            return
+        procesos = min(len(por_ruta), workers_extraccion or WORKERS_EXTRACCION)
+        print(f"🧵 Extrayendo texto de {len(por_ruta)} PDFs con {procesos} procesos")
+        for ruta, texto, paginas, tiempos in extraer_textos(list(por_ruta), workers=workers_extraccion,
+                                                            normalizar=normalizar_pagina_pdf,
+                                                            backend=self.extractor_pdf):
+            if "error" not in tiempos:
+                origen = "caché" if tiempos["cache"] else f"{tiempos['segundos']:.1f}s"
+                print(f"📄 Texto extraído de {ruta} ({paginas} páginas, {origen})")
+            yield por_ruta[ruta], texto
+
+    def _procesar_documento_fhir(self, info, texto=None):
+        """
+        Convierte un documento a FHIR (o reutiliza el JSON de una corrida anterior),
+        guarda JSON y XML y genera el HTML tabular. Retorna True si quedó renderizado.
+        """
+        pdf_path = info['ruta']
+        base = ruta_base_salida(pdf_path)
+        json_path = base + '.json'
+        xml_path = base + '.xml'
+        html_path = base + '.html'
+
+        try:
+            if self.reanudar and self.manifiesto.completo(info['id_paciente'], "convertido"):
+                # La conversión (llamada al LLM) ya se hizo: se reutiliza el JSON guardado
+                with open(json_path, 'r', encoding='utf-8') as jf:
+                    fhir_json = json.load(jf)
+                print(f"⏭️ JSON de una corrida anterior: {os.path.basename(json_path)}")
+            else:
+                # Paso 1: Convertir PDF a formato FHIR (JSON)
+                fhir_json = self.convertir_pdf_a_fhir(pdf_path, texto)
+                
+                if not fhir_json:
+                    print(f"⚠️ No se pudo extraer datos FHIR de {pdf_path}. Saltando...")
+                    return False
+                
+                # Paso 2: Guardar JSON
+                with tramo("medifolios.escritura_json"), open(json_path, 'w', encoding='utf-8') as jf:
+                    json.dump(fhir_json, jf, ensure_ascii=False, indent=2)
+                print(f"✅ JSON guardado: {os.path.basename(json_path)}")
+                self.manifiesto.registrar(info['id_paciente'], "convertido", ruta_json=json_path)
+            
+            # Paso 3: Generar XML desde JSON
+            with tramo("medifolios.escritura_xml"):
+                xml_str = self.generar_xml_de_fhir(fhir_json)
+                if xml_str:
+                    with open(xml_path, 'w', encoding='utf-8') as xf:
+                        xf.write(xml_str)
+                    print(f"✅ XML guardado: {os.path.basename(xml_path)}")
+            
+            # Paso 4: Generar visualización HTML tabular
+            if self.generar_html_tabular(fhir_json, html_path, info):
+                print(f"✅ HTML tabular generado: {os.path.basename(html_path)}")
+                self.manifiesto.registrar(info['id_paciente'], "renderizado", ruta_html=html_path)
+                return True
+            
+        except Exception as e:
+            print(f"❌ Error procesando {pdf_path}: {str(e)}")
+        return False
+
+    def procesar_pdfs_fhir_html(self, workers_extraccion=None):
         """
         Recorre todos los PDFs descargados y para cada uno genera:
-        1. Extrae texto del PDF
+        1. Extrae texto del PDF (en paralelo, con un pool de procesos)
         2. Convierte a formato HL7-FHIR (JSON)
         3. Guarda JSON y lo convierte a XML
         4. Genera una visualización HTML tabular
@@ -2229,47 +2946,30 @@ class HistoriasClinicasExtractor:
         Retorna la cantidad de PDFs procesados exitosamente y la ruta del HTML global.
         """
         procesados_exitosamente = 0
+        total = len(self.pdfs_info)
         
         print(f"\n{'='*50}")
         print(f"🔄 PROCESANDO PDFs PARA CONVERTIRLOS A FORMATO FHIR")
         print(f"{'='*50}")
         
-        for i, info in enumerate(self.pdfs_info):
-            pdf_path = info['ruta']
-            base = os.path.splitext(pdf_path)[0]
-            json_path = base + '.json'
-            xml_path = base + '.xml'
-            html_path = base + '.html'
-            
-            print(f"\n📄 [{i+1}/{len(self.pdfs_info)}] Procesando: {os.path.basename(pdf_path)}")
-            
-            try:
-                # Paso 1: Convertir PDF a formato FHIR (JSON)
-                fhir_json = self.convertir_pdf_a_fhir(pdf_path)
-                
-                if not fhir_json:
-                    print(f"⚠️ No se pudo extraer datos FHIR de {pdf_path}. Saltando...")
-                    continue
-                
-                # Paso 2: Guardar JSON
-                with open(json_path, 'w', encoding='utf-8') as jf:
-                    json.dump(fhir_json, jf, ensure_ascii=False, indent=2)
-                print(f"✅ JSON guardado: {os.path.basename(json_path)}")
-                
-                # Paso 3: Generar XML desde JSON
-                xml_str = self.generar_xml_de_fhir(fhir_json)
-                if xml_str:
-                    with open(xml_path, 'w', encoding='utf-8') as xf:
-                        xf.write(xml_str)
-                    print(f"✅ XML guardado: {os.path.basename(xml_path)}")
-                
-                # Paso 4: Generar visualización HTML tabular
-                if self.generar_html_tabular(fhir_json, html_path, info):
-                    print(f"✅ HTML tabular generado: {os.path.basename(html_path)}")
-                    procesados_exitosamente += 1
-                
-            except Exception as e:
-                print(f"❌ Error procesando {pdf_path}: {str(e)}")
+        # Los ya renderizados se omiten y los ya convertidos no necesitan el texto
+        por_convertir = []
+        reutilizables = []
+        for info in self.pdfs_info:
+            if self.reanudar and self.manifiesto.completo(info['id_paciente'], "renderizado"):
+                print(f"⏭️ {os.path.basename(info['ruta'])}: ya convertido y renderizado en una corrida anterior")
+                procesados_exitosamente += 1
+            elif self.reanudar and self.manifiesto.completo(info['id_paciente'], "convertido"):
+                reutilizables.append(info)
+            else:
+                por_convertir.append(info)
+        
+        documentos = itertools.chain(((info, None) for info in reutilizables),
+                                     self._textos_para_convertir(por_convertir, workers_extraccion))
+        for i, (info, texto) in enumerate(documentos, start=procesados_exitosamente + 1):
+            print(f"\n📄 [{i}/{total}] Procesando: {os.path.basename(info['ruta'])}")
+            if self._procesar_documento_fhir(info, texto):
+                procesados_exitosamente += 1
         
         print(f"\n{'='*50}")
         print(f"📊 RESUMEN: Procesados {procesados_exitosamente}/{len(self.pdfs_info)} archivos PDF")
@@ -2304,12 +3004,30 @@ if __name__ == "__main__":
                        help='Solo procesar PDFs existentes sin descargar nuevos')
     parser.add_argument('--no-abrir', '-na', action='store_true',
                        help='No abrir automáticamente el HTML generado al finalizar')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                       help='Navegadores en paralelo para la descarga (1 = secuencial)')
+    parser.add_argument('--modo-descarga', choices=['directo', 'impresion'], default='directo',
+                       help='directo: descarga el reporte por HTTP; impresion: lo abre en pestaña y lo imprime a PDF')
+    parser.add_argument('--reanudar', '--resume', metavar='DIR', default=None,
+                       help='Continuar una corrida anterior en DIR, omitiendo los pacientes ya completos')
+    parser.add_argument('--incremental', metavar='DIR', default=None,
+                       help='Sincronizar contra la corrida en DIR: solo descarga y convierte pacientes con historias nuevas')
+    parser.add_argument('--sin-cache-sesion', action='store_true',
+                       help='Iniciar sesión siempre, sin reutilizar la sesión guardada')
+    parser.add_argument('--max-workers', type=int, default=None,
+                       help='Tope de navegadores simultáneos contra Medifolios (por defecto MEDIFOLIOS_MAX_WORKERS o 4)')
+    parser.add_argument('--headless', action='store_true', default=HEADLESS,
+                       help='Chrome sin ventana y sin imágenes, fuentes ni analítica (por defecto NAVEGADOR_HEADLESS)')
+    parser.add_argument('--extractor-pdf', choices=['auto'] + list(BACKENDS), default=EXTRACTOR_PDF,
+                       help='Librería para extraer el texto de los PDFs (por defecto EXTRACTOR_PDF o auto)')
+    parser.add_argument('--workers-extraccion', type=int, default=None,
+                       help='Procesos para extraer el texto de los PDFs (por defecto EXTRACCION_WORKERS o un proceso por núcleo)')
     
     args = parser.parse_args()
     
-    # Timestamp para carpeta
+    # Timestamp para carpeta; al reanudar se reutiliza la carpeta de la corrida anterior
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    output_dir = os.path.join(args.dir, f"extraccion_{timestamp}")
+    output_dir = args.incremental or args.reanudar or os.path.join(args.dir, f"extraccion_{timestamp}")
     
     print(f"\n{'='*70}")
     print(f"🚀 EXTRACTOR DE HISTORIAS CLÍNICAS MEDIFOLIOS A FORMATO HL7-FHIR")
@@ -2318,6 +3036,7 @@ if __name__ == "__main__":
     print(f"📂 Directorio de salida: {output_dir}")
     print(f"👤 Usuario: {args.usuario}")
     print(f"📊 Pacientes a procesar: {args.pacientes}")
+    print(f"🧵 Workers: {args.workers}")
     print(f"{'='*70}\n")
     
     # Crear el directorio de salida
@@ -2327,12 +3046,40 @@ if __name__ == "__main__":
     log_path = os.path.join(output_dir, "extraccion_log.txt")
     
     # Inicializar extractor
-    extractor = HistoriasClinicasExtractor(output_dir=output_dir)
+    extractor = HistoriasClinicasExtractor(output_dir=output_dir, modo_descarga=args.modo_descarga,
+                                           usar_cache_sesion=not args.sin_cache_sesion,
+                                           reanudar=bool(args.reanudar),
+                                           incremental=bool(args.incremental),
+                                           headless=args.headless, extractor_pdf=args.extractor_pdf)
+    if args.reanudar or args.incremental:
+        print(f"🔁 Reanudando corrida: {extractor.manifiesto.resumen()}")
     
     html_global_path = None
     
     try:
-        if not args.solo_procesar:
+        if not args.solo_procesar and args.workers > 1:
+            # Descarga en paralelo: primero se arma el índice de pacientes con el navegador
+            # principal, luego cada worker abre su propio navegador e inicia sesión
+            from pool_medifolios import descargar_en_paralelo, MAX_WORKERS_CORTESIA
+            if not extractor.login(args.usuario, args.password):
+                print("❌ Falló el inicio de sesión. Finalizando.")
+                extractor.cerrar()
+                exit(1)
+            extractor.navegar_a_pacientes()
+            indice_pacientes = extractor.construir_indice_pacientes(limite=args.pacientes)
+            extractor.pdfs_info = descargar_en_paralelo(
+                args.usuario, args.password, args.pacientes, pacientes=indice_pacientes,
+                num_workers=args.workers, output_dir=output_dir,
+                max_workers=args.max_workers or MAX_WORKERS_CORTESIA,
+                opciones_extractor={"modo_descarga": args.modo_descarga,
+                                    "usar_cache_sesion": not args.sin_cache_sesion,
+                                    "reanudar": bool(args.reanudar),
+                                    "incremental": bool(args.incremental),
+                                    "headless": args.headless}
+            )
+            print("✅ Proceso de descarga completado con éxito")
+
+        elif not args.solo_procesar:
             # Proceso de descarga de historias clínicas
             if not extractor.login(args.usuario, args.password):
                 print("❌ Falló el inicio de sesión. Finalizando.")
@@ -2344,8 +3091,9 @@ if __name__ == "__main__":
             extractor.navegar_a_pacientes()
             
             print(f"\n🔄 Iniciando descarga de historias clínicas para {args.pacientes} pacientes...")
-            # Descargar historias clínicas
-            pdfs_info = extractor.descargar_historias_clinicas(args.pacientes)
+            # Descargar historias clínicas de los pacientes del índice (todas las páginas necesarias)
+            indice_pacientes = extractor.construir_indice_pacientes(limite=args.pacientes)
+            pdfs_info = extractor.descargar_historias_clinicas(pacientes=indice_pacientes)
             
             print("✅ Proceso de descarga completado con éxito")
             
@@ -2354,15 +3102,16 @@ if __name__ == "__main__":
             # En modo solo-procesar, buscar PDFs existentes en el directorio
             pdfs_encontrados = []
             for archivo in os.listdir(args.dir):
-                if archivo.lower().endswith('.pdf'):
+                if archivo.lower().endswith('.pdf') or archivo.endswith(SUFIJO_REPORTE_HTML):
                     ruta_completa = os.path.join(args.dir, archivo)
                     # Extraer ID y nombre del paciente del nombre del archivo
-                    partes = os.path.splitext(archivo)[0].split('_', 1)
+                    partes = os.path.basename(ruta_base_salida(archivo)).split('_', 1)
                     id_paciente = partes[0] if len(partes) > 0 else "ID_desconocido"
                     nombre_paciente = partes[1].replace('_', ' ') if len(partes) > 1 else "Nombre desconocido"
                     
                     pdfs_encontrados.append({
                         "ruta": ruta_completa,
+                        "formato": "html" if archivo.endswith(SUFIJO_REPORTE_HTML) else "pdf",
                         "id_paciente": id_paciente,
                         "nombre_paciente": nombre_paciente
                     })
@@ -2374,14 +3123,18 @@ if __name__ == "__main__":
             # Copiar los PDFs al directorio de salida y actualizar rutas
             extractor.pdfs_info = []
             for pdf_info in pdfs_encontrados:
-                # Crear nombre de archivo
-                nombre_archivo = f"{pdf_info['id_paciente']}_{pdf_info['nombre_paciente'].replace(' ', '_')}.pdf"
+                # Crear nombre de archivo conservando el formato original
+                extension = SUFIJO_REPORTE_HTML if pdf_info['formato'] == "html" else ".pdf"
+                nombre_archivo = f"{pdf_info['id_paciente']}_{pdf_info['nombre_paciente'].replace(' ', '_')}{extension}"
                 nombre_archivo = re.sub(r'[\\/*?:"<>|]', '', nombre_archivo)
                 nueva_ruta = os.path.join(output_dir, nombre_archivo)
                 
-                # Copiar archivo
+                # Copiar archivo, salvo que ya esté (copy2 conserva tamaño y fecha de modificación)
                 import shutil
-                shutil.copy2(pdf_info['ruta'], nueva_ruta)
+                origen = os.stat(pdf_info['ruta'])
+                destino = os.stat(nueva_ruta) if os.path.exists(nueva_ruta) else None
+                if not destino or (destino.st_size, int(destino.st_mtime)) != (origen.st_size, int(origen.st_mtime)):
+                    shutil.copy2(pdf_info['ruta'], nueva_ruta)
                 
                 # Actualizar ruta en la información
                 pdf_info['ruta'] = nueva_ruta
@@ -2392,7 +3145,7 @@ if __name__ == "__main__":
         # Procesar PDFs para convertirlos a FHIR
         if extractor.pdfs_info:
             print("\n🔄 Iniciando procesamiento de PDFs a formato FHIR...")
-            procesados, html_global_path = extractor.procesar_pdfs_fhir_html()
+            procesados, html_global_path = extractor.procesar_pdfs_fhir_html(args.workers_extraccion)
             
             if procesados > 0:
                 print(f"\n✅ Proceso completado exitosamente. Se procesaron {procesados} archivos.")